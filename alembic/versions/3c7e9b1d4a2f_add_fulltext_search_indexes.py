@@ -0,0 +1,32 @@
+"""Add fulltext search indexes
+
+Revision ID: 3c7e9b1d4a2f
+Revises: 952c70f85c42
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7e9b1d4a2f'
+down_revision: Union[str, None] = '952c70f85c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_musics_name_fulltext', 'musics', ['name'], mysql_prefix='FULLTEXT')
+    op.create_index('ix_artists_name_fulltext', 'artists', ['name'], mysql_prefix='FULLTEXT')
+    op.create_index('ix_albums_name_fulltext', 'albums', ['name'], mysql_prefix='FULLTEXT')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_albums_name_fulltext', table_name='albums')
+    op.drop_index('ix_artists_name_fulltext', table_name='artists')
+    op.drop_index('ix_musics_name_fulltext', table_name='musics')
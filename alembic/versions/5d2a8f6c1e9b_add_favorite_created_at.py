@@ -0,0 +1,40 @@
+"""Add Favorite.created_at
+
+Revision ID: 5d2a8f6c1e9b
+Revises: 3c7e9b1d4a2f
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2a8f6c1e9b'
+down_revision: Union[str, None] = '3c7e9b1d4a2f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('favorite', sa.Column('created_at', sa.DateTime(), nullable=True))
+    # Время хранится в UTC (db.models.utcnow). NOW() в MySQL возвращает время в часовом поясе сессии,
+    # CURRENT_TIMESTAMP в SQLite - уже в UTC
+    if op.get_bind().dialect.name == 'mysql':
+        now = sa.func.utc_timestamp()
+    else:
+        now = sa.func.current_timestamp()
+    favorite = sa.table('favorite', sa.column('created_at', sa.DateTime()))
+    op.execute(favorite.update().values(created_at=now))
+    with op.batch_alter_table('favorite') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+    op.create_index('ix_favorite_user_created', 'favorite', ['user_id', 'created_at', 'music_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_favorite_user_created', table_name='favorite')
+    op.drop_column('favorite', 'created_at')
@@ -0,0 +1,30 @@
+"""Add Music.audio_music_id
+
+Revision ID: 7a3c5e9f2b14
+Revises: e4b7d2a9c6f1
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3c5e9f2b14'
+down_revision: Union[str, None] = 'e4b7d2a9c6f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('musics', sa.Column('audio_music_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_musics_audio_music_id', 'musics', 'musics', ['audio_music_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_musics_audio_music_id', 'musics', type_='foreignkey')
+    op.drop_column('musics', 'audio_music_id')
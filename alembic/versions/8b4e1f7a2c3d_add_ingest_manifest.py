@@ -0,0 +1,40 @@
+"""Add ingest_manifest
+
+Revision ID: 8b4e1f7a2c3d
+Revises: 5d2a8f6c1e9b
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e1f7a2c3d'
+down_revision: Union[str, None] = '5d2a8f6c1e9b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ingest_manifest',
+    sa.Column('source_song_id', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('music_id', sa.Integer(), nullable=True),
+    sa.Column('audio_hash', sa.String(length=64), nullable=True),
+    sa.Column('audio_key', sa.String(length=255), nullable=True),
+    sa.Column('image_key', sa.String(length=255), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['music_id'], ['musics.id'], ),
+    sa.PrimaryKeyConstraint('source_song_id')
+    )
+    op.create_index(op.f('ix_ingest_manifest_audio_hash'), 'ingest_manifest', ['audio_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ingest_manifest_audio_hash'), table_name='ingest_manifest')
+    op.drop_table('ingest_manifest')
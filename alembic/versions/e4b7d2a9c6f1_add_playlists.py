@@ -0,0 +1,50 @@
+"""Add playlists and playlist_tracks
+
+Revision ID: e4b7d2a9c6f1
+Revises: c1f3a9d7e5b2
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7d2a9c6f1'
+down_revision: Union[str, None] = 'c1f3a9d7e5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('playlists',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_playlists_user_id', 'playlists', ['user_id', 'id'], unique=False)
+    op.create_table('playlist_tracks',
+    sa.Column('playlist_id', sa.Integer(), nullable=False),
+    sa.Column('music_id', sa.Integer(), nullable=False),
+    sa.Column('position', sa.BigInteger(), nullable=False),
+    sa.Column('added_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['music_id'], ['musics.id'], ),
+    sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ),
+    sa.PrimaryKeyConstraint('playlist_id', 'music_id')
+    )
+    op.create_index('ix_playlist_tracks_position', 'playlist_tracks', ['playlist_id', 'position', 'music_id'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_playlist_tracks_position', table_name='playlist_tracks')
+    op.drop_table('playlist_tracks')
+    op.drop_index('ix_playlists_user_id', table_name='playlists')
+    op.drop_table('playlists')
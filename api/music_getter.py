@@ -1,22 +1,108 @@
-import os
-from pathlib import Path
-from typing import List, Dict, Optional, Any
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Any, BinaryIO, Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """
+    Потокобезопасный ограничитель частоты запросов (token bucket).\n
+    Токены пополняются со скоростью ``rate`` в секунду до ``capacity`` штук; каждый запрос забирает один токен
+    """
+
+    def __init__(self, rate: float, capacity: int | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Забирает токен, при необходимости ожидая его появления"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
 
 
 class ApiUtil:
-    def __init__(self):
-        self.URL_FOR_ALBUMS = "https://saavn.dev/api/search/albums"
-        self.URL_FOR_DETAIL_ALBUM = "https://saavn.dev/api/albums"
+    def __init__(self,
+                 pool_size: int = 16,
+                 timeout: int = 10,
+                 max_retries: int = 3,
+                 backoff_factor: float = 0.5,
+                 backoff_max: float = 10.0,
+                 rate_limit: float | None = 10.0,
+                 base_url: str = "https://saavn.dev/api"):
+        self.URL_FOR_ALBUMS = f"{base_url}/search/albums"
+        self.URL_FOR_DETAIL_ALBUM = f"{base_url}/albums"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
         self.session = requests.Session()
+        # Соединения переиспользуются между потоками конвейера загрузки
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _send(self, url: str, params: Dict[str, Any] | None = None, stream: bool = False) -> requests.Response:
+        """Выполняет GET запрос с ограничением частоты и повторами.\n
+        Ошибки соединения, таймауты и ответы из RETRY_STATUSES повторяются до ``max_retries`` раз
+        с экспоненциальной задержкой (учитывается заголовок Retry-After)
+
+        :raises requests.RequestException: Если запрос не удался после всех попыток
+        :return: Успешный ответ
+        :rtype: requests.Response
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            retry_after = None
+            try:
+                response = self.session.get(url, params=params, stream=stream, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    try:
+                        response.raise_for_status()
+                    except requests.HTTPError:
+                        response.close()
+                        raise
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+
+            time.sleep(self._backoff(attempt, retry_after))
+
+    def _backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        # "Full jitter": одновременно упавшие запросы не повторяются синхронно
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * 2 ** attempt))
 
     def _make_request(self, url: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Общий метод для выполнения HTTP-запросов."""
         try:
-            response = self.session.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
+            with self._send(url, params) as response:
+                return response.json()
         except (requests.RequestException, ValueError) as e:
             print(f"Request failed: {e}")
             return None
@@ -68,44 +154,9 @@ class ApiUtil:
             "songs": [self._process_song(s) for s in album.get("songs", [])]
         }
 
-    def download_song_data(self, album_data: dict) -> dict[str, list[str]]:
-        path_to_download = Path(__file__).parent.parent / "media"
-        os.makedirs(path_to_download, exist_ok=True)
-        img_path_lst = []
-        audio_path_lst = []
-
-        for song in album_data.get("songs", []):
-            song_name = song["name"]
-            song_key = song_name.strip()
-
-            # Скачиваем изображение
-            img_url = song.get("image_url")
-            if img_url:
-                img_ext = os.path.splitext(img_url)[-1].split("?")[0]
-                img_path = os.path.join(path_to_download, f"{song_key}_cover{img_ext}")
-                try:
-                    with requests.get(img_url, stream=True) as r:
-                        r.raise_for_status()
-                        with open(img_path, "wb") as f:
-                            for chunk in r.iter_content(chunk_size=8192):
-                                f.write(chunk)
-                    img_path_lst.append(img_path)
-                except Exception as e:
-                    print(f"Ошибка при скачивании изображения для {song_name}: {e}")
-
-            # Скачиваем аудиофайл
-            music_url = song.get("music_url")
-            if music_url:
-                audio_ext = os.path.splitext(music_url)[-1].split("?")[0]
-                audio_path = os.path.join(path_to_download, f"{song_key}_audio{audio_ext}")
-                try:
-                    with requests.get(music_url, stream=True) as r:
-                        r.raise_for_status()
-                        with open(audio_path, "wb") as f:
-                            for chunk in r.iter_content(chunk_size=8192):
-                                f.write(chunk)
-                    audio_path_lst.append(audio_path)
-                except Exception as e:
-                    print(f"Ошибка при скачивании аудио для {song_name}: {e}")
-
-        return {"img_path_lst": img_path_lst, "audio_path_lst": audio_path_lst}
+    @contextmanager
+    def open_media_stream(self, url: str) -> Iterator[BinaryIO]:
+        """Открывает поток с содержимым медиафайла. Данные читаются из сети по мере чтения потока."""
+        with self._send(url, stream=True) as response:
+            response.raw.decode_content = True
+            yield response.raw
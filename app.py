@@ -1,23 +1,73 @@
 import secrets
 from typing import Sequence
 
-from flask import Flask, render_template, request, url_for, redirect, jsonify
+from botocore.exceptions import ClientError
+from flask import Flask, render_template, request, url_for, redirect, jsonify, abort, send_file, Response, \
+    stream_with_context
 from flask_login import LoginManager, login_user, current_user, logout_user, login_required
 
-from db.connect import create_session
-from db.managers.music_manager import MusicManager
-from db.managers.user_manager import UserManager, EmailAlreadyExistsError
+from db import images
+from db.connect import use_session, begin_request_scope, end_request_scope, get_engine, pool_metrics, \
+    create_db_and_tables
+from db.db_config import settings
+from db.disk_cache import audio_disk_cache
+from db.managers.music_manager import MusicManager, TrackRow
+from db.managers.user_manager import UserManager, UserSnapshot, EmailAlreadyExistsError
 from db.models import User, Music
+from db.pagination import Page, InvalidCursorError
+from db.s3manager import S3Manager, url_cache, batch_signer, start_key_index_refresh
 from forms import LoginForm, RegistrationForm
+from rest_api import api_v1
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = secrets.token_hex(64)
+# Компактный JSON без экранирования кириллицы
+app.json.compact = True
+app.json.ensure_ascii = False
+app.register_blueprint(api_v1)
+# Список файлов s3 хранилища загружается в фоне, а не в первом запросе
+start_key_index_refresh()
 
 login_manager = LoginManager(app)
 
 # Добавим конфигурацию для загрузки файлов
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
-app.config["MAX_CONTENT_LENGTH"] = 2 * 1024 * 1024  # 2MB max
+app.config["MAX_CONTENT_LENGTH"] = settings.MAX_UPLOAD_SIZE
+
+
+@app.cli.command("init-db")
+def init_db():
+    """Создает базу данных и таблицы, если они не существуют"""
+    create_db_and_tables()
+
+
+@app.cli.command("generate-thumbnails")
+def generate_thumbnails():
+    """Создает уменьшенные копии обложек и аватарок, загруженных без них"""
+    with S3Manager() as s3_manager:
+        processed = images.generate_missing_variants(s3_manager)
+    print(f"Обработано изображений: {processed}")
+
+
+@app.cli.command("cleanup-avatars")
+def cleanup_avatars():
+    """Удаляет файлы замененных аватарок, которые не были удалены после загрузки"""
+    deleted = UserManager.delete_replaced_avatars()
+    print(f"Удалено файлов: {deleted}")
+
+
+@app.before_request
+def open_request_session():
+    # Все менеджеры в рамках запроса используют одну сессию, см. db.connect.use_session
+    begin_request_scope()
+
+
+@app.teardown_request
+def close_request_session(exc: BaseException | None):
+    stats = end_request_scope()
+    if stats is not None:
+        app.logger.debug("%s %s: %d sessions, %d pool checkouts, %d queries",
+                         request.method, request.path, stats["sessions"], stats["checkouts"], stats["queries"])
 
 
 @app.route("/update_avatar", methods=["POST"])
@@ -31,80 +81,96 @@ def update_avatar():
     if file:
         try:
             user_manager = UserManager()
-            content = file.read()
-
-            user_manager.upload_avatar(current_user.id, content)
+            # Размер файла ограничен MAX_CONTENT_LENGTH
+            version = user_manager.upload_avatar(current_user.id, file.stream)
 
-            avatar_url = user_manager.get_avatar_url(current_user.id)
+            avatar_url = user_manager.get_avatar_url(current_user.id, size=80, avatar_version=version)
+            avatar_url_2x = user_manager.get_avatar_url(current_user.id, size=160, avatar_version=version)
 
-            return jsonify({"success": True, "avatar_url": avatar_url})
+            return jsonify({"success": True, "avatar_url": avatar_url, "avatar_srcset": f"{avatar_url_2x} 2x"})
 
         except ValueError as e:
             return jsonify({"success": False, "message": str(e)}), 400
+        except TimeoutError:
+            return jsonify({"success": False, "message": "Сервер занят, попробуйте позже"}), 503
 
     return jsonify({"success": False, "message": "Ошибка при обработке файла"}), 400
 
 
 @login_manager.user_loader
-def load_user(user_id: int) -> User | None:
+def load_user(user_id: str) -> UserSnapshot | None:
     user_manager = UserManager()
-    return user_manager.get_user_by_id(user_id)
+    try:
+        return user_manager.get_user_snapshot(int(user_id))
+    except ValueError:
+        return None
 
 
 @login_manager.unauthorized_handler
 def redirect_to_login():
+    if request.blueprint == api_v1.name:
+        return jsonify({"error": "Authentication required"}), 401
     return redirect("/login")
 
 
-def urls_dictionary_getter(tracks: Sequence[type[Music] | Music]):
+def urls_dictionary_getter(tracks: Sequence[type[Music] | Music | TrackRow]):
     soundtracks = [track.id for track in tracks]
-    with create_session() as db_session:
-        music_manager = MusicManager(db_session)
-        urls = music_manager.get_music_url_pairs(*soundtracks)
-        res = [
-            {
-                "track": track,
-                "track_url": track_url,
-                "img_url": img_url
-            }
-            for track, (track_url, img_url) in zip(tracks, urls)
-        ]
-        return res
+    urls = MusicManager.get_music_url_pairs(*soundtracks)
+    srcsets = MusicManager.get_music_image_srcsets(*soundtracks)
+    res = [
+        {
+            "track": track,
+            "track_url": url_for("stream_track", track_id=track.id) if settings.STREAM_PROXY_ENABLED else track_url,
+            "img_url": img_url,
+            "img_srcset": img_srcset,
+            "img_webp_srcset": img_webp_srcset
+        }
+        for track, (track_url, img_url), (img_srcset, img_webp_srcset) in zip(tracks, urls, srcsets)
+    ]
+    return res
 
 
 @app.route("/")
 @login_required
 def home():
-    with create_session() as db_session:
+    with use_session() as db_session:
         music_manager = MusicManager(db_session)
         user_manager = UserManager()
         temporal_soundtracks = music_manager.get_random_music()
         res = urls_dictionary_getter(temporal_soundtracks)
+        favorite_ids = user_manager.get_favorite_ids(current_user.id, (track.id for track in temporal_soundtracks))
         return render_template("home.html",
                                user=current_user,
                                soundtracks=temporal_soundtracks,
                                title="Главная",
                                user_manager=user_manager,
+                               favorite_ids=favorite_ids,
                                res=res)
 
 
 @app.route("/search", methods=["GET"])
 @login_required
 def search():
-    with create_session() as db_session:
+    with use_session() as db_session:
         music_manager = MusicManager(db_session)
         user_manager = UserManager()
         query = request.args.get("q", "").strip()
         if query:
-            result = music_manager.search_music(query)
+            try:
+                page = music_manager.search_music_page(query, cursor=request.args.get("cursor"))
+            except InvalidCursorError:
+                abort(400)
         else:
-            result = []
-        res = urls_dictionary_getter(result)
+            page = Page([])
+        res = urls_dictionary_getter(page.items)
+        favorite_ids = user_manager.get_favorite_ids(current_user.id, (track.id for track in page))
         return render_template("search.html",
                                user=current_user,
                                query=query,
                                title="Поиск",
                                user_manager=user_manager,
+                               favorite_ids=favorite_ids,
+                               page=page,
                                res=res)
 
 
@@ -112,12 +178,16 @@ def search():
 @login_required
 def account():
     user_manager = UserManager()
-    favorite_music = user_manager.get_favorite_tracks(current_user.id)
-    res = urls_dictionary_getter(favorite_music)
+    try:
+        page = user_manager.get_favorite_tracks_page(current_user.id, cursor=request.args.get("cursor"))
+    except InvalidCursorError:
+        abort(400)
+    res = urls_dictionary_getter(page.items)
     return render_template("account.html",
                            user=current_user,
                            title="Аккаунт",
                            user_manager=user_manager,
+                           page=page,
                            res=res)
 
 
@@ -171,12 +241,108 @@ def login():
 @app.route("/toggle_favorite/<int:track_id>", methods=["POST"])
 @login_required
 def toggle_favorite(track_id: int):
+    # Тело {"favorite": true/false} задает требуемое состояние (повторный запрос ничего не меняет),
+    # без него состояние переключается. Возвращается состояние после изменения
     user_manager = UserManager()
-    if not user_manager.is_favorite(current_user.id, track_id):
-        user_manager.add_favorite_track(current_user.id, track_id)
-    else:
-        user_manager.remove_favorite_track(current_user.id, track_id)
-    return "", 204
+    data = request.get_json(silent=True)
+    try:
+        if isinstance(data, dict) and isinstance(data.get("favorite"), bool):
+            favorite = user_manager.set_favorite(current_user.id, track_id, data["favorite"])
+        else:
+            favorite = user_manager.toggle_favorite(current_user.id, track_id)
+    except ValueError:
+        abort(404)
+    return jsonify({"favorite": favorite})
+
+
+@app.route("/stream/<int:track_id>")
+@login_required
+def stream_track(track_id: int):
+    # Отдает аудио трека через сервер (при settings.STREAM_PROXY_ENABLED) с поддержкой Range и If-None-Match.
+    # Популярные треки отдаются с локального диска, остальные - частями из s3 хранилища
+    if not settings.STREAM_PROXY_ENABLED:
+        abort(404)
+
+    filename = MusicManager.get_audio_keys(track_id)[0]
+    content_type = "audio/mp3"
+    entry = audio_disk_cache.get(filename)
+    if entry is not None:
+        try:
+            return send_file(entry.path, mimetype=entry.content_type, conditional=True,
+                             etag=entry.etag, max_age=settings.STREAM_MAX_AGE)
+        except FileNotFoundError:
+            # Файл вытеснен из кэша другим потоком после get: отдаем из s3
+            audio_disk_cache.invalidate(filename)
+
+    s3_manager = S3Manager()
+    byte_range = request.range
+    try:
+        file_object = s3_manager.get_file_object(
+            filename,
+            # s3 не поддерживает несколько диапазонов в одном запросе, в этом случае отдается весь файл
+            byte_range=byte_range.to_header() if byte_range is not None and len(byte_range.ranges) == 1 else None,
+            if_none_match=request.headers.get("If-None-Match")
+        )
+    except ValueError:
+        abort(404)
+    except ClientError as ex:
+        status = ex.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status == 304:
+            return Response(status=304, headers={"ETag": request.headers.get("If-None-Match", "")})
+        if status == 416:
+            abort(416)
+        raise
+
+    def fetch_whole_file():
+        whole_file = s3_manager.get_file_object(filename)
+        return whole_file["Body"], whole_file["ETag"].strip('"'), content_type
+
+    # Браузер запрашивает трек несколькими Range запросами: промахом считается только начало прослушивания
+    if byte_range is None or byte_range.ranges[0][0] == 0:
+        audio_disk_cache.record_miss(filename, fetch_whole_file)
+
+    body = file_object["Body"]
+
+    def generate():
+        try:
+            yield from body.iter_chunks(settings.STREAM_CHUNK_SIZE)
+        finally:
+            body.close()
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(file_object["ContentLength"]),
+        "ETag": file_object["ETag"],
+        "Cache-Control": f"private, max-age={settings.STREAM_MAX_AGE}"
+    }
+    if "ContentRange" in file_object:
+        headers["Content-Range"] = file_object["ContentRange"]
+    return Response(stream_with_context(generate()),
+                    status=206 if "ContentRange" in file_object else 200,
+                    mimetype=content_type,
+                    headers=headers)
+
+
+@app.route("/internal/stats")
+def internal_stats():
+    # Доступно по токену settings.INTERNAL_STATS_TOKEN. Доступ с локального адреса без токена включается
+    # явно (settings.INTERNAL_STATS_ALLOW_LOOPBACK): за обратным прокси все запросы приходят с 127.0.0.1
+    token = settings.INTERNAL_STATS_TOKEN
+    allow_loopback = settings.INTERNAL_STATS_ALLOW_LOOPBACK
+    if not token and not allow_loopback:
+        abort(404)
+    if not (allow_loopback and request.remote_addr in ("127.0.0.1", "::1")):
+        if not token or not secrets.compare_digest(request.headers.get("X-Stats-Token", ""), token):
+            abort(403)
+
+    return jsonify({
+        "db": pool_metrics.snapshot(get_engine()),
+        "s3": {
+            "url_cache": url_cache.stats(),
+            "batch_signer": batch_signer.stats()
+        },
+        "audio_disk_cache": audio_disk_cache.stats()
+    })
 
 
 @app.route("/logout", methods=["GET", "POST"])
@@ -0,0 +1,81 @@
+"""Замер холодного старта воркера: время импорта модуля app в новом процессе.
+
+Запуск::
+
+    python benchmarks/startup.py --runs 10 --history benchmarks/startup_history.jsonl
+
+Каждый запуск выполняется в отдельном интерпретаторе, поэтому учитываются импорт зависимостей и инициализация
+модулей проекта. Медиана и разброс выводятся в консоль и, если указан --history, дописываются строкой JSON в файл,
+что позволяет отслеживать изменение времени старта между коммитами.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_MEASURE_SCRIPT = (
+    "import time\n"
+    "started = time.perf_counter()\n"
+    "import {module}\n"
+    "print(time.perf_counter() - started)\n"
+)
+
+
+def measure_import(module: str) -> float:
+    """Импортирует модуль в новом процессе и возвращает время импорта в секундах
+
+    :param module: Название модуля
+    :type module: str
+    :return: Время импорта в секундах
+    :rtype: float
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", _MEASURE_SCRIPT.format(module=module)],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def _git_revision() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Замер времени импорта приложения")
+    parser.add_argument("--module", default="app", help="Импортируемый модуль (по умолчанию app)")
+    parser.add_argument("--runs", type=int, default=10, help="Количество запусков")
+    parser.add_argument("--history", help="Файл, в который дописывается результат в формате JSON lines")
+    args = parser.parse_args()
+
+    timings = [measure_import(args.module) for _ in range(args.runs)]
+    result = {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "revision": _git_revision(),
+        "module": args.module,
+        "runs": args.runs,
+        "median_ms": round(statistics.median(timings) * 1000, 1),
+        "min_ms": round(min(timings) * 1000, 1),
+        "max_ms": round(max(timings) * 1000, 1)
+    }
+    print(json.dumps(result, ensure_ascii=False))
+
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as file:
+            file.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
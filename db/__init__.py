@@ -1,2 +1,2 @@
-from .connect import create_session
+from .connect import create_session, use_session
 from .models import Base
@@ -0,0 +1,82 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+
+class CacheBackend(ABC):
+    """
+    Базовый класс хранилища кэша.\n
+    Значения должны быть простыми сериализуемыми объектами (dict, list, str, int, ...), чтобы хранилище можно было
+    заменить на общее для нескольких процессов (например, Redis или memcached)
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Any | None:
+        """Возвращает значение по ключу или None, если значение отсутствует или устарело
+
+        :param key: Ключ
+        :type key: str
+        :return: Значение или None
+        :rtype: Any | None
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        """Сохраняет значение на ttl секунд
+
+        :param key: Ключ
+        :type key: str
+        :param value: Значение
+        :type value: Any
+        :param ttl: Время жизни значения в секундах
+        :type ttl: int
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Удаляет значение по ключу
+
+        :param key: Ключ
+        :type key: str
+        """
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Потокобезопасное хранилище кэша в памяти процесса с ограничением по времени жизни и размеру (LRU)"""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Очищает хранилище"""
+        with self._lock:
+            self._entries.clear()
@@ -1,29 +1,127 @@
+import contextlib
+import threading
+from contextvars import ContextVar
+from typing import Iterator
+
 import sqlalchemy.orm
 import sqlalchemy_utils
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session
 
 from . import models
 from .db_config import settings
+from .pool_metrics import PoolMetrics, TimedQueuePool
+
+pool_metrics = PoolMetrics()
+
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """Возвращает engine базы данных, создавая его при первом обращении.\n
+    Импорт модуля не открывает соединений с базой данных
+
+    :return: Engine объект
+    :rtype: Engine
+    """
+    global _engine
+    if _engine is not None:
+        return _engine
 
-DATABASE_URL = settings.DATABASE_URL
-engine = sqlalchemy.create_engine(DATABASE_URL)
+    with _engine_lock:
+        if _engine is None:
+            engine = sqlalchemy.create_engine(
+                settings.DATABASE_URL,
+                poolclass=TimedQueuePool,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+                pool_recycle=settings.DB_POOL_RECYCLE,
+                pool_pre_ping=settings.DB_POOL_PRE_PING,
+                connect_args={"connect_timeout": settings.DB_CONNECT_TIMEOUT}
+            )
+            pool_metrics.attach(engine)
+            engine.pool.metrics = pool_metrics
+            sqlalchemy.event.listen(engine, "checkout", lambda *args: _increment_stat("checkouts"))
+            sqlalchemy.event.listen(engine, "before_cursor_execute", lambda *args: _increment_stat("queries"))
+            SessionLocal.configure(bind=engine)
+            _engine = engine
+        return _engine
 
 
 def create_db_and_tables():
     """
     Создает базу данных (если она не существует) и таблицы,
-    определенные в SQLAlchemy моделях.
+    определенные в SQLAlchemy моделях.\n
+    Вызывается явно: командой ``flask --app app init-db`` или при запуске через main.py
     """
+    engine = get_engine()
     if not sqlalchemy_utils.database_exists(engine.url):
         sqlalchemy_utils.create_database(engine.url)
 
     models.Base.metadata.create_all(engine)
 
 
-create_db_and_tables()
+class _CountingSession(Session):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _increment_stat("sessions")
+
+
+# Привязывается к engine при первом вызове get_engine
+SessionLocal = sqlalchemy.orm.sessionmaker(autocommit=False, autoflush=False, class_=_CountingSession)
 
-SessionLocal = sqlalchemy.orm.sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_request_session: ContextVar[Session | None] = ContextVar("request_session", default=None)
+_request_stats: ContextVar[dict[str, int] | None] = ContextVar("request_stats", default=None)
 
 
 def create_session() -> Session:
+    get_engine()
     return SessionLocal()
+
+
+@contextlib.contextmanager
+def use_session() -> Iterator[Session]:
+    """Возвращает сессию текущего запроса, если она открыта (см. begin_request_scope), иначе - новую сессию,
+    которая будет закрыта при выходе из блока with
+
+    :return: Сессия базы данных
+    :rtype: Iterator[Session]
+    """
+    db_session = _request_session.get()
+    if db_session is not None:
+        yield db_session
+        return
+
+    with create_session() as db_session:
+        yield db_session
+
+
+def begin_request_scope() -> None:
+    """Открывает сессию, общую для всех вызовов use_session в рамках текущего запроса,
+    и начинает подсчет сессий, соединений и запросов к базе данных"""
+    _request_stats.set({"sessions": 0, "checkouts": 0, "queries": 0})
+    _request_session.set(create_session())
+
+
+def end_request_scope() -> dict[str, int] | None:
+    """Закрывает сессию текущего запроса
+
+    :return: Количество сессий, выдач соединений из пула и SQL запросов за время запроса
+    :rtype: dict[str, int] | None
+    """
+    db_session = _request_session.get()
+    if db_session is not None:
+        db_session.close()
+    _request_session.set(None)
+
+    stats = _request_stats.get()
+    _request_stats.set(None)
+    return stats
+
+
+def _increment_stat(name: str) -> None:
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[name] += 1
@@ -15,6 +15,67 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_SSL_CA: str
 
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_CONNECT_TIMEOUT: int = 10
+
+    INTERNAL_STATS_TOKEN: str | None = None
+    INTERNAL_STATS_ALLOW_LOOPBACK: bool = False
+
+    RANDOM_MUSIC_SAMPLE_SIZE: int = 16
+    MUSIC_ID_POOL_TTL: int = 300
+    SEARCH_BACKEND: str = "auto"
+    SEARCH_INDEX_TTL: int = 300
+    PAGE_SIZE_DEFAULT: int = 24
+    PAGE_SIZE_MAX: int = 100
+    USER_CACHE_TTL: int = 60
+    REST_BATCH_MAX: int = 100
+
+    INGEST_METADATA_WORKERS: int = 4
+    INGEST_TRANSFER_WORKERS: int = 8
+    INGEST_CHUNK_SIZE: int = 16
+    INGEST_CHUNK_WORKERS: int = 4
+    INGEST_WRITE_QUEUE_SIZE: int = 8
+    INGEST_SPOOL_MEMORY: int = 16 * 1024 * 1024
+
+    API_TIMEOUT: int = 10
+    API_MAX_RETRIES: int = 3
+    API_RATE_LIMIT: float = 10.0
+
+    STREAM_PROXY_ENABLED: bool = False
+    STREAM_CHUNK_SIZE: int = 256 * 1024
+    STREAM_MAX_AGE: int = 3600
+    STREAM_CACHE_DIR: str | None = None
+    STREAM_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+    STREAM_CACHE_ADMIT_AFTER: int = 2
+
+    IMAGE_JPEG_QUALITY: int = 82
+    IMAGE_WEBP_QUALITY: int = 80
+    IMAGE_WEBP_ENABLED: bool = False
+    IMAGE_MAX_PIXELS: int = 40_000_000
+    MAX_UPLOAD_SIZE: int = 2 * 1024 * 1024
+    IMAGE_WORKERS: int = 2
+    IMAGE_MAX_PENDING: int = 8
+    IMAGE_TIMEOUT: int = 30
+    # Через сколько секунд после замены файлы старой аватарки могут быть удалены
+    AVATAR_DELETE_DELAY: int = 3600
+
+    S3_REGION: str = "ru-central1"
+    S3_URL_CACHE_SIZE: int = 8192
+    S3_URL_CACHE_MARGIN: int = 300
+    S3_KEY_INDEX_NEGATIVE_TTL: int = 60
+    S3_KEY_INDEX_REFRESH_INTERVAL: int = 600
+    S3_MAX_POOL_CONNECTIONS: int = 50
+    S3_TCP_KEEPALIVE: bool = True
+    S3_SIGN_INLINE_THRESHOLD: int = 64
+    S3_SIGN_MAX_WORKERS: int = 4
+    S3_LOCAL_SIGNING: bool = True
+    S3_MULTIPART_CHUNKSIZE: int = 8 * 1024 * 1024
+    S3_UPLOAD_MAX_CONCURRENCY: int = 4
+
     @property
     def DATABASE_URL(self):
         return (f"mysql+pymysql://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}?"
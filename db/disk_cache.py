@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, NamedTuple
+
+from .db_config import settings
+
+
+class DiskCacheEntry(NamedTuple):
+    """Файл в дисковом кэше"""
+    path: str
+    size: int
+    etag: str
+    content_type: str
+
+
+# Функция получения файла из s3: () -> (поток, ETag, content type)
+FileFetcher = Callable[[], tuple[BinaryIO, str, str]]
+
+
+class DiskLruCache:
+    """
+    Потокобезопасный кэш файлов на локальном диске с ограничением по суммарному размеру (LRU).\n
+    Файл попадает в кэш после ``admit_after`` промахов по нему: однократно прослушанные треки не вытесняют популярные.
+    Загрузка в кэш выполняется в фоновом потоке. Содержимое файла по ключу считается неизменным.\n
+    Рядом с каждым файлом хранится json с ключом, ETag и content type, поэтому кэш переживает перезапуск процесса
+    """
+
+    def __init__(self, directory: str, max_bytes: int, admit_after: int = 2, max_tracked_misses: int = 10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.admit_after = admit_after
+        self.max_tracked_misses = max_tracked_misses
+        self.hits = 0
+        self.misses = 0
+        self.loaded = False
+        self._entries: OrderedDict[str, DiskCacheEntry] = OrderedDict()
+        self._size = 0
+        self._miss_counts: OrderedDict[str, int] = OrderedDict()
+        self._filling: set[str] = set()
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> DiskCacheEntry | None:
+        """Возвращает файл из кэша или None, если файл отсутствует
+
+        :param key: Название файла в s3 хранилище
+        :type key: str
+        :return: Запись кэша или None
+        :rtype: DiskCacheEntry | None
+        """
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if not os.path.exists(entry.path):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def record_miss(self, key: str, fetch: FileFetcher) -> None:
+        """Учитывает промах по файлу. После ``admit_after`` промахов файл загружается в кэш в фоновом потоке
+
+        :param key: Название файла в s3 хранилище
+        :type key: str
+        :param fetch: Функция получения файла целиком
+        :type fetch: FileFetcher
+        """
+        with self._lock:
+            if key in self._entries or key in self._filling:
+                return
+
+            count = self._miss_counts.pop(key, 0) + 1
+            if count < self.admit_after:
+                self._miss_counts[key] = count
+                while len(self._miss_counts) > self.max_tracked_misses:
+                    self._miss_counts.popitem(last=False)
+                return
+
+            self._filling.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk-cache-fill")
+            executor = self._executor
+
+        executor.submit(self._fill, key, fetch)
+
+    def put(self, key: str, content: BinaryIO, etag: str, content_type: str) -> DiskCacheEntry:
+        """Сохраняет файл в кэш, вытесняя давно не использованные файлы
+
+        :param key: Название файла в s3 хранилище
+        :type key: str
+        :param content: Содержимое файла
+        :type content: BinaryIO
+        :param etag: ETag файла
+        :type etag: str
+        :param content_type: Content type файла
+        :type content_type: str
+        :return: Запись кэша
+        :rtype: DiskCacheEntry
+        """
+        self._ensure_loaded()
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                while chunk := content.read(1024 * 1024):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        entry = DiskCacheEntry(path, size, etag, content_type)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"key": key, "etag": etag, "content_type": content_type}, f)
+
+        with self._lock:
+            self._remove(key, delete_files=False)
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, key: str) -> None:
+        """Удаляет файл из кэша
+
+        :param key: Название файла в s3 хранилище
+        :type key: str
+        """
+        with self._lock:
+            self._remove(key)
+
+    def stats(self) -> dict[str, int]:
+        """Возвращает статистику кэша
+
+        :return: Количество попаданий, промахов, файлов и их суммарный размер
+        :rtype: dict[str, int]
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "files": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes
+            }
+
+    def _fill(self, key: str, fetch: FileFetcher) -> None:
+        try:
+            stream, etag, content_type = fetch()
+            try:
+                self.put(key, stream, etag, content_type)
+            finally:
+                stream.close()
+        except Exception as ex:
+            print(f"Не удалось сохранить {key} в дисковый кэш: {ex}")
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+
+    def _ensure_loaded(self) -> None:
+        if self.loaded:
+            return
+
+        with self._lock:
+            if self.loaded:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+
+            found = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.endswith(".tmp"):
+                    # Незавершенная запись процесса, завершившегося во время загрузки.
+                    # Свежие файлы могут принадлежать другому процессу с тем же каталогом кэша
+                    if time.time() - os.path.getmtime(path) > 3600:
+                        os.unlink(path)
+                    continue
+                if not name.endswith(".json") or not os.path.exists(path[:-len(".json")]):
+                    continue
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        meta = json.load(f)
+                    data_path = path[:-len(".json")]
+                    found.append((os.path.getmtime(data_path), meta["key"], DiskCacheEntry(
+                        data_path, os.path.getsize(data_path), meta["etag"], meta["content_type"]
+                    )))
+                except (OSError, ValueError, KeyError):
+                    continue
+
+            for _, key, entry in sorted(found, key=lambda item: item[0]):
+                self._entries[key] = entry
+                self._size += entry.size
+            while self._size > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+            self.loaded = True
+
+    def _remove(self, key: str, delete_files: bool = True) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry.size
+        if delete_files:
+            for path in (entry.path, entry.path + ".json"):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+
+audio_disk_cache = DiskLruCache(
+    directory=settings.STREAM_CACHE_DIR or os.path.join(tempfile.gettempdir(), "melodia-audio-cache"),
+    max_bytes=settings.STREAM_CACHE_MAX_BYTES,
+    admit_after=settings.STREAM_CACHE_ADMIT_AFTER
+)
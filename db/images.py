@@ -0,0 +1,347 @@
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import IO, TYPE_CHECKING, Any, BinaryIO, Callable, NamedTuple, TypeVar
+
+from PIL import Image
+
+from .db_config import settings
+
+if TYPE_CHECKING:
+    from .s3manager import S3Manager
+
+# Размеры (по большей стороне) уменьшенных копий обложек и аватарок
+COVER_SIZES = (80, 300, 600)
+AVATAR_SIZES = (80, 160)
+# Наибольший размер хранимой аватарки
+AVATAR_MAX_SIZE = 512
+# Исходные изображения, для которых создаются копии
+_ORIGINAL_IMAGE_KEY = re.compile(r"(music_image|user_avatar)_\d+(?:_v\d+)?\.jpg")
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+T = TypeVar("T")
+
+JPEG_CONTENT_TYPE = "image/jpeg"
+WEBP_CONTENT_TYPE = "image/webp"
+
+
+class ImageVariant(NamedTuple):
+    """Уменьшенная копия изображения"""
+    size: int
+    format: str  # "jpg" или "webp"
+
+    @property
+    def content_type(self) -> str:
+        return WEBP_CONTENT_TYPE if self.format == "webp" else JPEG_CONTENT_TYPE
+
+
+def variant_key(key: str, size: int, image_format: str = "jpg") -> str:
+    """Возвращает название файла уменьшенной копии изображения в s3 хранилище
+
+    :param key: Название исходного файла (например, "music_image_1.jpg")
+    :type key: str
+    :param size: Размер копии по большей стороне
+    :type size: int
+    :param image_format: "jpg" или "webp"
+    :type image_format: str
+    :return: Название файла копии (например, "music_image_1_300.jpg")
+    :rtype: str
+    """
+    return f"{os.path.splitext(key)[0]}_{size}.{image_format}"
+
+
+def image_variants(sizes: tuple[int, ...], webp: bool | None = None) -> list[ImageVariant]:
+    """Возвращает список копий, создаваемых для изображения
+
+    :param sizes: Размеры копий
+    :type sizes: tuple[int, ...]
+    :param webp: Создавать ли WebP копии (None - согласно settings.IMAGE_WEBP_ENABLED)
+    :type webp: bool | None
+    :return: Список копий
+    :rtype: list[ImageVariant]
+    """
+    if webp is None:
+        webp = settings.IMAGE_WEBP_ENABLED
+    formats = ("jpg", "webp") if webp else ("jpg",)
+    return [ImageVariant(size, image_format) for size in sizes for image_format in formats]
+
+
+def open_image(content: bytes | BinaryIO, max_size: int | None = None) -> Image.Image:
+    """Открывает изображение и приводит его к RGB.\n
+    Если задан max_size, JPEG декодируется сразу в уменьшенном масштабе (draft режим), остальные форматы
+    уменьшаются до конвертации (reduce), поэтому в памяти не создается полноразмерная RGB копия
+
+    :param content: Содержимое изображения
+    :type content: bytes | BinaryIO
+    :param max_size: Наибольший требуемый размер по большей стороне
+    :type max_size: int | None
+    :raises ValueError: Если данные не являются изображением или изображение больше settings.IMAGE_MAX_PIXELS
+    :return: Изображение, не превышающее max_size
+    :rtype: Image.Image
+    """
+    try:
+        img = Image.open(BytesIO(content) if isinstance(content, bytes) else content)
+        if max_size is not None:
+            img.draft("RGB", (max_size, max_size))
+    except Exception as ex:
+        raise ValueError("Invalid image data") from ex
+
+    # Размер известен из заголовка до декодирования; после draft - уже уменьшенный размер JPEG
+    if img.width * img.height > settings.IMAGE_MAX_PIXELS:
+        raise ValueError("Image is too large")
+
+    try:
+        if max_size is not None and img.mode not in ("1", "P"):
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        img = img.convert("RGB")
+        if max_size is not None:
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        return img
+    except Exception as ex:
+        raise ValueError("Invalid image data") from ex
+
+
+def encode_image(img: Image.Image, image_format: str = "jpg") -> BytesIO:
+    """Кодирует изображение: JPEG - прогрессивный с оптимизированными таблицами Хаффмана, WebP - с потерями
+
+    :param img: Изображение в RGB
+    :type img: Image.Image
+    :param image_format: "jpg" или "webp"
+    :type image_format: str
+    :return: Закодированное изображение
+    :rtype: BytesIO
+    """
+    img_bytes = BytesIO()
+    if image_format == "webp":
+        img.save(img_bytes, format="WEBP", quality=settings.IMAGE_WEBP_QUALITY, method=4)
+    else:
+        img.save(img_bytes, format="JPEG", quality=settings.IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+    img_bytes.seek(0)
+    return img_bytes
+
+
+def downscale(img: Image.Image, size: int) -> Image.Image:
+    """Возвращает копию изображения, уменьшенную до размера ``size`` по большей стороне
+
+    :param img: Изображение
+    :type img: Image.Image
+    :param size: Наибольший размер
+    :type size: int
+    :return: Уменьшенная копия (или копия исходного, если оно меньше)
+    :rtype: Image.Image
+    """
+    resized = img.copy()
+    resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return resized
+
+
+def render_variants(img: Image.Image, variants: list[ImageVariant]) -> dict[ImageVariant, BytesIO]:
+    """Создает уменьшенные копии изображения. Изображения меньше требуемого размера не увеличиваются
+
+    :param img: Изображение в RGB
+    :type img: Image.Image
+    :param variants: Требуемые копии
+    :type variants: list[ImageVariant]
+    :return: Словарь копия -> закодированное изображение
+    :rtype: dict[ImageVariant, BytesIO]
+    """
+    resized: dict[int, Image.Image] = {}
+    # Каждая копия уменьшается из ближайшей большей, а не из исходного изображения
+    source = img
+    for size in sorted({variant.size for variant in variants}, reverse=True):
+        source = downscale(source, size)
+        resized[size] = source
+
+    return {variant: encode_image(resized[variant.size], variant.format) for variant in variants}
+
+
+def upload_variants(s3_manager: "S3Manager", key: str, img: Image.Image, sizes: tuple[int, ...],
+                    webp: bool | None = None) -> list[str]:
+    """Создает и загружает в s3 хранилище уменьшенные копии изображения
+
+    :param s3_manager: Менеджер s3 хранилища
+    :type s3_manager: S3Manager
+    :param key: Название исходного файла
+    :type key: str
+    :param img: Изображение в RGB
+    :type img: Image.Image
+    :param sizes: Размеры копий
+    :type sizes: tuple[int, ...]
+    :param webp: Создавать ли WebP копии (None - согласно settings.IMAGE_WEBP_ENABLED)
+    :type webp: bool | None
+    :return: Названия загруженных файлов
+    :rtype: list[str]
+    """
+    keys = []
+    for variant, content in render_variants(img, image_variants(sizes, webp)).items():
+        filename = variant_key(key, variant.size, variant.format)
+        s3_manager.upload_file(filename, content, force=True)
+        keys.append(filename)
+    return keys
+
+
+def generate_missing_variants(s3_manager: "S3Manager") -> int:
+    """Создает уменьшенные копии для обложек и аватарок, загруженных до появления копий
+
+    :param s3_manager: Менеджер s3 хранилища
+    :type s3_manager: S3Manager
+    :return: Количество обработанных изображений
+    :rtype: int
+    """
+    keys = {obj.key for obj in s3_manager.get_objects_collection()}
+    processed = 0
+    for key in sorted(keys):
+        sizes = _original_image_sizes(key)
+        if sizes is None:
+            continue
+        missing = [variant for variant in image_variants(sizes)
+                   if variant_key(key, variant.size, variant.format) not in keys]
+        if not missing:
+            continue
+
+        try:
+            img = open_image(s3_manager.get_file(key).read(), max_size=max(variant.size for variant in missing))
+            for variant, content in render_variants(img, missing).items():
+                s3_manager.upload_file(variant_key(key, variant.size, variant.format), content, force=True)
+        except ValueError as ex:
+            print(f"Не удалось создать копии {key}: {ex}")
+            continue
+        processed += 1
+    return processed
+
+
+def _original_image_sizes(key: str) -> tuple[int, ...] | None:
+    match = _ORIGINAL_IMAGE_KEY.fullmatch(key)
+    if match is None:
+        return None
+    return COVER_SIZES if match.group(1) == "music_image" else AVATAR_SIZES
+
+
+def spool_to_file(content: BinaryIO, max_bytes: int) -> IO[bytes]:
+    """Копирует поток частями во временный файл, который процессы image_workers могут открыть по имени
+
+    :param content: Поток с изображением
+    :type content: BinaryIO
+    :param max_bytes: Наибольший допустимый размер
+    :type max_bytes: int
+    :raises ValueError: Если поток длиннее max_bytes
+    :return: Временный файл, удаляемый при закрытии
+    :rtype: IO[bytes]
+    """
+    spool = tempfile.NamedTemporaryFile(prefix="upload_")
+    try:
+        copied = 0
+        while chunk := content.read(SPOOL_CHUNK_SIZE):
+            copied += len(chunk)
+            if copied > max_bytes:
+                raise ValueError("Image is too large")
+            spool.write(chunk)
+        spool.flush()
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+def render_avatar(content: bytes | str) -> dict[int | None, bytes]:
+    """Создает аватарку и ее уменьшенные копии. Выполняется в процессе image_workers
+
+    :param content: Содержимое загруженного изображения или путь к файлу с ним
+    :type content: bytes | str
+    :raises ValueError: Если данные не являются изображением или изображение слишком большое
+    :return: Словарь размер копии (None - аватарка) -> JPEG
+    :rtype: dict[int | None, bytes]
+    """
+    if isinstance(content, str):
+        with open(content, "rb") as file:
+            img = open_image(file, max_size=AVATAR_MAX_SIZE)
+    else:
+        img = open_image(content, max_size=AVATAR_MAX_SIZE)
+    rendered: dict[int | None, bytes] = {None: encode_image(img).getvalue()}
+    for variant, encoded in render_variants(img, image_variants(AVATAR_SIZES, webp=False)).items():
+        rendered[variant.size] = encoded.getvalue()
+    return rendered
+
+
+class ImageWorkerPool:
+    """
+    Ограниченный пул процессов для декодирования и кодирования изображений.\n
+    Работа с изображениями выполняется вне потоков Flask и не удерживает GIL. Одновременно в пуле находится
+    не более ``max_pending`` задач: остальные вызовы ждут до ``timeout`` секунд и получают TimeoutError.
+    При ``max_workers`` = 0 задачи выполняются в вызывающем потоке
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8, timeout: float = 30):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Выполняет функцию в пуле и возвращает результат
+
+        :param func: Функция уровня модуля (передается в процесс через pickle)
+        :param args: Аргументы функции
+        :raises TimeoutError: Если пул занят или задача не завершилась за ``timeout`` секунд
+        :return: Результат функции
+        """
+        if self.max_workers == 0:
+            return func(*args)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Image workers are busy")
+        executor = self._get_executor()
+        try:
+            future = executor.submit(func, *args)
+        except BaseException as ex:
+            self._slots.release()
+            if isinstance(ex, BrokenProcessPool):
+                self._discard_executor(executor)
+            raise
+        # Слот освобождается по завершении задачи, а не по истечении ожидания: задача, не дождавшаяся
+        # результата, продолжает выполняться в пуле и учитывается в max_pending
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+
+    def shutdown(self) -> None:
+        """Останавливает процессы пула"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        # Процесс аварийно завершился (например, из-за нехватки памяти): следующий вызов создаст новый пул.
+        # Оставшиеся задачи старого пула отменяются, их слоты освобождаются
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: дочерние процессы не наследуют потоки и соединения веб-приложения
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+
+image_workers = ImageWorkerPool(
+    max_workers=settings.IMAGE_WORKERS,
+    max_pending=settings.IMAGE_MAX_PENDING,
+    timeout=settings.IMAGE_TIMEOUT
+)
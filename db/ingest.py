@@ -0,0 +1,680 @@
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from io import BytesIO
+from typing import BinaryIO, Callable, Iterable
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+from api.music_getter import ApiUtil
+from . import connect, images, models
+from .db_config import settings
+from .managers.music_manager import music_id_pool
+from .s3manager import S3Manager
+from .search import get_search_backend
+
+logger = logging.getLogger(__name__)
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+class ArtistIdCache:
+    """
+    Соответствие имя артиста -> id, загружаемое из базы данных одним запросом при первом обращении.\n
+    Новые артисты добавляются одним многострочным INSERT на альбом. Имена сравниваются без учета регистра,
+    как и в колляции MySQL по умолчанию
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._ids: dict[str, int] = {}
+        self._pending: dict[str, int] = {}
+
+    def resolve(self, db_session: Session, names: set[str]) -> dict[str, int]:
+        """Возвращает id артистов по именам, создавая недостающих артистов
+
+        :param db_session: Сессия базы данных
+        :type db_session: Session
+        :param names: Имена артистов
+        :type names: set[str]
+        :return: Словарь имя -> id
+        :rtype: dict[str, int]
+        """
+        if not self.loaded:
+            self._ids.update((_artist_key(name), artist_id)
+                             for artist_id, name in db_session.execute(select(models.Artist.id, models.Artist.name)))
+            self.loaded = True
+
+        missing = {}
+        for name in names:
+            key = _artist_key(name)
+            if key not in self._ids and key not in self._pending:
+                missing.setdefault(key, name)
+
+        if missing:
+            rows = [{"name": name, "bio": "", "country": ""} for name in missing.values()]
+            db_session.execute(_insert_ignore(db_session, models.Artist.__table__, ["name"]), rows)
+            for artist_id, name in db_session.execute(
+                    select(models.Artist.id, models.Artist.name).where(models.Artist.name.in_(missing.values()))
+            ):
+                self._pending[_artist_key(name)] = artist_id
+
+        resolved = {}
+        for name in names:
+            key = _artist_key(name)
+            artist_id = self._pending.get(key, self._ids.get(key))
+            if artist_id is not None:
+                resolved[name] = artist_id
+        return resolved
+
+    def commit(self) -> None:
+        """Фиксирует артистов, созданных в текущей транзакции"""
+        self._ids.update(self._pending)
+        self._pending.clear()
+
+    def rollback(self) -> None:
+        """Забывает артистов, созданных в отмененной транзакции"""
+        self._pending.clear()
+
+
+class IngestPipeline:
+    """
+    Конвейер загрузки каталога из стороннего API в базу данных и s3 хранилище.\n
+    Этапы и их параллельность:
+
+    * получение информации об альбомах - до ``metadata_workers`` запросов одновременно;
+    * обработка частей альбомов из ``chunk_size`` треков - до ``chunk_workers`` частей одновременно,
+      в том числе из разных альбомов;
+    * скачивание и загрузка файлов - до ``transfer_workers`` файлов одновременно. Аудио при скачивании
+      сохраняется во временный файл (до settings.INGEST_SPOOL_MEMORY байт - в памяти) и хэшируется:
+      аудио, совпадающее с уже сохраненным, в s3 не загружается. Загрузка идет частями (multipart);
+      число одновременно загружаемых частей одного файла задается settings.S3_UPLOAD_MAX_CONCURRENCY.
+      Для обложек дополнительно создаются уменьшенные копии (см. db.images);
+    * запись в базу данных - в одном потоке через очередь из ``write_queue_size`` заданий (_SerialWriter):
+      при заполненной очереди части альбомов ждут записи, а не накапливаются в памяти.
+      Артисты, треки и их связи записываются многострочными INSERT (треки в MySQL - по одному, см. _insert_musics),
+      id известных артистов берутся из ArtistIdCache.
+
+    Транзакции не охватывают передачу файлов: часть альбома записывается двумя короткими транзакциями.
+    Первая сохраняет треки и их записи в IngestManifest со статусом STATUS_PENDING, вторая после загрузки
+    файлов выставляет статусы STATUS_DONE и STATUS_DUPLICATE, а треки, файлы которых загрузить не удалось,
+    удаляет. Между транзакциями треки уже есть в базе данных, но их файлы еще загружаются.\n
+    Каждый трек записывается в IngestManifest вместе с SHA-256 аудио, поэтому повторный запуск
+    пропускает уже загруженные треки. Треки со статусом STATUS_FAILED загружаются повторно,
+    у треков со статусом STATUS_PENDING (прерванный запуск) заново передаются файлы, id треков сохраняются.
+    Если аудио трека совпадает с уже сохраненным, трек сохраняется со своими метаданными и обложкой
+    и использует файл сохраненного трека (Music.audio_music_id). Одинаковое аудио, одновременно загружаемое
+    в одном запуске, обнаруживается только при записи результата: лишний файл тогда удаляется
+    """
+
+    def __init__(self,
+                 api_util: ApiUtil | None = None,
+                 s3_manager_factory: Callable[[], S3Manager] = S3Manager,
+                 session_factory: Callable[[], Session] = connect.create_session,
+                 metadata_workers: int | None = None,
+                 transfer_workers: int | None = None,
+                 chunk_size: int | None = None,
+                 chunk_workers: int | None = None,
+                 write_queue_size: int | None = None):
+        self.api_util = api_util or ApiUtil(
+            timeout=settings.API_TIMEOUT,
+            max_retries=settings.API_MAX_RETRIES,
+            rate_limit=settings.API_RATE_LIMIT
+        )
+        self.s3_manager_factory = s3_manager_factory
+        self.session_factory = session_factory
+        self.metadata_workers = metadata_workers or settings.INGEST_METADATA_WORKERS
+        self.transfer_workers = transfer_workers or settings.INGEST_TRANSFER_WORKERS
+        self.chunk_size = chunk_size or settings.INGEST_CHUNK_SIZE
+        self.chunk_workers = chunk_workers or settings.INGEST_CHUNK_WORKERS
+        self.write_queue_size = write_queue_size or settings.INGEST_WRITE_QUEUE_SIZE
+        self.artist_ids = ArtistIdCache()
+
+    def run_category(self, category: str, limit: int = 1) -> list[int]:
+        """Загружает альбомы найденные по категории
+
+        :param category: Поисковый запрос для альбомов
+        :type category: str
+        :param limit: Количество альбомов
+        :type limit: int
+        :return: id сохраненных треков
+        :rtype: list[int]
+        """
+        album_ids = self.api_util.get_album_ids_by_category(category, limit=limit)
+        return self.run(album_ids or [])
+
+    def run(self, album_ids: list[str]) -> list[int]:
+        """Загружает альбомы по их id в стороннем API
+
+        :param album_ids: id альбомов
+        :type album_ids: list[str]
+        :return: id сохраненных треков
+        :rtype: list[int]
+        """
+        albums = []
+        writer = _SerialWriter(self.write_queue_size)
+        try:
+            with ThreadPoolExecutor(max_workers=self.metadata_workers,
+                                    thread_name_prefix="ingest-meta") as meta_pool, \
+                    ThreadPoolExecutor(max_workers=self.transfer_workers,
+                                       thread_name_prefix="ingest-transfer") as transfer_pool, \
+                    ThreadPoolExecutor(max_workers=self.chunk_workers,
+                                       thread_name_prefix="ingest-chunk") as chunk_pool:
+                # Информация о следующих альбомах скачивается, пока сохраняются предыдущие
+                album_futures = [meta_pool.submit(self.api_util.get_album_info, album_id) for album_id in album_ids]
+                for album_id, album_future in zip(album_ids, album_futures):
+                    try:
+                        album_info = album_future.result()
+                    except Exception as ex:
+                        logger.warning("Не удалось получить информацию об альбоме %s: %s", album_id, ex)
+                        continue
+                    if not album_info:
+                        continue
+
+                    albums.append((album_info, [
+                        chunk_pool.submit(self._ingest_chunk, album_info, song_infos, transfer_pool, writer)
+                        for song_infos in self._album_chunks(album_info)
+                    ]))
+        finally:
+            writer.close()
+
+        saved_music_ids = []
+        for album_info, chunk_futures in albums:
+            album_music_ids = [music_id for chunk_future in chunk_futures for music_id in chunk_future.result()]
+            if album_music_ids:
+                logger.info("Успешно сохранен альбом: %s", album_info.get("name"))
+            saved_music_ids.extend(album_music_ids)
+        return saved_music_ids
+
+    def _album_chunks(self, album_info: dict) -> list[list[dict]]:
+        song_infos = [song_info for song_info in album_info.get("songs", [])
+                      if song_info.get("name") and song_info.get("music_url")]
+
+        db_session = self.session_factory()
+        try:
+            song_infos = self._skip_finished(db_session, song_infos)
+        finally:
+            db_session.close()
+        if not song_infos:
+            logger.info("Альбом уже загружен: %s", album_info.get("name"))
+        return [song_infos[start:start + self.chunk_size] for start in range(0, len(song_infos), self.chunk_size)]
+
+    def _ingest_chunk(self, album_info: dict, song_infos: list[dict], transfer_pool: ThreadPoolExecutor,
+                      writer: "_SerialWriter") -> list[int]:
+        try:
+            songs = writer.submit(self._begin_chunk, album_info, song_infos).result()
+        except Exception as ex:
+            logger.exception("Ошибка при сохранении альбома %s: %s", album_info.get("name"), ex)
+            writer.submit(self._record_failed, song_infos).result()
+            return []
+
+        s3_manager = self.s3_manager_factory()
+        uploaded_keys, audio_hashes, failed = self._transfer_files(s3_manager, songs, transfer_pool)
+        for music_id in failed:
+            self._discard_files(s3_manager, _flatten(uploaded_keys.pop(music_id, {}).values()))
+
+        try:
+            saved_music_ids, unused_keys = writer.submit(
+                self._finish_chunk, songs, uploaded_keys, audio_hashes, failed
+            ).result()
+        except Exception as ex:
+            # Треки остаются в статусе STATUS_PENDING: следующий запуск передаст их файлы заново
+            logger.exception("Не удалось записать результат загрузки альбома %s: %s", album_info.get("name"), ex)
+            return []
+        self._discard_files(s3_manager, unused_keys)
+        return saved_music_ids
+
+    def _begin_chunk(self, album_info: dict, song_infos: list[dict]) -> list[tuple[int, dict]]:
+        """Первая транзакция части альбома: записывает треки со статусом STATUS_PENDING.
+        Треки, оставшиеся в этом статусе после прерванного запуска, повторно не записываются"""
+        db_session = self.session_factory()
+        try:
+            pending = self._find_pending(db_session, song_infos)
+            album_id = self._get_or_create_album(db_session, album_info)
+            songs = self._write_songs(db_session, album_id,
+                                      [song_info for song_info in song_infos if _source_id(song_info) not in pending],
+                                      self.artist_ids)
+            self._record_manifest(db_session, [
+                _manifest_row(song_info, models.IngestManifest.STATUS_PENDING, music_id)
+                for music_id, song_info in songs if _source_id(song_info) is not None
+            ])
+            db_session.commit()
+            self.artist_ids.commit()
+        except Exception:
+            db_session.rollback()
+            self.artist_ids.rollback()
+            raise
+        finally:
+            db_session.close()
+
+        return [(pending[_source_id(song_info)], song_info) for song_info in song_infos
+                if _source_id(song_info) in pending] + songs
+
+    def _transfer_files(self, s3_manager: S3Manager, songs: list[tuple[int, dict]],
+                        transfer_pool: ThreadPoolExecutor) -> tuple[dict[int, dict[str, list[str]]],
+                                                                    dict[int, str], set[int]]:
+        """Загружает файлы треков. Возвращает загруженные файлы трека по префиксу, SHA-256 аудио
+        и id треков, файлы которых загрузить не удалось"""
+        transfers = {}
+        for music_id, song_info in songs:
+            for url, prefix in ((song_info.get("image_url"), "music_image"),
+                                (song_info.get("music_url"), "music_audio")):
+                if not url:
+                    continue
+                key = f"{prefix}_{music_id}{os.path.splitext(url)[-1].split('?')[0]}"
+                transfer = self._transfer_image if prefix == "music_image" else self._transfer
+                transfers[transfer_pool.submit(transfer, s3_manager, url, key)] = (music_id, song_info, prefix)
+
+        uploaded_keys = defaultdict(dict)
+        audio_hashes = {}
+        failed = set()
+        for future in as_completed(transfers):
+            music_id, song_info, prefix = transfers[future]
+            try:
+                keys, digest = future.result()
+            except Exception as ex:
+                logger.warning("Ошибка при загрузке файла трека %s: %s", song_info["name"], ex)
+                failed.add(music_id)
+            else:
+                uploaded_keys[music_id][prefix] = keys
+                if prefix == "music_audio":
+                    audio_hashes[music_id] = digest
+        return uploaded_keys, audio_hashes, failed
+
+    def _finish_chunk(self, songs: list[tuple[int, dict]], uploaded_keys: dict[int, dict[str, list[str]]],
+                      audio_hashes: dict[int, str], failed: set[int]) -> tuple[list[int], list[str]]:
+        """Вторая транзакция части альбома: записывает результат загрузки файлов.
+        Возвращает id сохраненных треков и загруженные файлы, которые больше не нужны"""
+        db_session = self.session_factory()
+        try:
+            if failed:
+                self._discard_musics(db_session, failed)
+
+            audio_keys = {music_id: _main_key(uploaded_keys[music_id], "music_audio") for music_id, _ in songs
+                          if music_id not in failed}
+            unused_keys = []
+            duplicates = self._find_duplicates(db_session, audio_keys, audio_hashes)
+            # Аудио не загружалось, но трек с тем же аудио удален после проверки в _transfer: трек не сохраняется
+            lost = {music_id for music_id, audio_key in audio_keys.items()
+                    if audio_key is None and music_id not in duplicates}
+            if lost:
+                self._discard_musics(db_session, lost)
+                for music_id in lost:
+                    unused_keys.extend(_flatten(uploaded_keys.pop(music_id, {}).values()))
+                    del audio_keys[music_id]
+                failed = failed | lost
+            if duplicates:
+                self._link_audio(db_session, {music_id: audio_music_id
+                                              for music_id, (audio_music_id, _) in duplicates.items()})
+                for music_id, (_, audio_key) in duplicates.items():
+                    unused_keys.extend(uploaded_keys[music_id].pop("music_audio", []))
+                    audio_keys[music_id] = audio_key
+
+            self._record_manifest(db_session, [
+                _manifest_row(
+                    song_info,
+                    models.IngestManifest.STATUS_DUPLICATE if music_id in duplicates
+                    else models.IngestManifest.STATUS_DONE,
+                    music_id,
+                    audio_hash=audio_hashes.get(music_id),
+                    # У дубликата - файл трека, аудио которого он использует
+                    audio_key=audio_keys[music_id],
+                    image_key=_main_key(uploaded_keys[music_id], "music_image")
+                )
+                for music_id, song_info in songs
+                if music_id not in failed and _source_id(song_info) is not None
+            ] + [
+                _manifest_row(song_info, models.IngestManifest.STATUS_FAILED) for music_id, song_info in songs
+                if music_id in failed and _source_id(song_info) is not None
+            ])
+            saved_music_ids = [music_id for music_id, _ in songs if music_id not in failed]
+            db_session.commit()
+
+            music_id_pool.invalidate()
+            get_search_backend(db_session).index_music(db_session, saved_music_ids)
+            return saved_music_ids, unused_keys
+        except Exception:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.close()
+
+    def _transfer(self, s3_manager: S3Manager, url: str, key: str) -> tuple[list[str], str]:
+        with tempfile.SpooledTemporaryFile(max_size=settings.INGEST_SPOOL_MEMORY) as spool:
+            with self.api_util.open_media_stream(url) as stream:
+                reader = _HashingReader(stream)
+                shutil.copyfileobj(reader, spool, SPOOL_CHUNK_SIZE)
+            digest = reader.hash.hexdigest()
+            if self._is_saved_audio(digest):
+                # Трек будет связан с сохраненным аудио в _finish_chunk
+                return [], digest
+
+            spool.seek(0)
+            s3_manager.upload_file(key, spool, force=True)
+        return [key], digest
+
+    def _is_saved_audio(self, audio_hash: str) -> bool:
+        db_session = self.session_factory()
+        try:
+            return db_session.execute(
+                select(models.IngestManifest.source_song_id).where(
+                    models.IngestManifest.audio_hash == audio_hash,
+                    models.IngestManifest.status == models.IngestManifest.STATUS_DONE
+                ).limit(1)
+            ).first() is not None
+        finally:
+            db_session.close()
+
+    def _transfer_image(self, s3_manager: S3Manager, url: str, key: str) -> tuple[list[str], str]:
+        # Обложки небольшие: исходный файл читается в память один раз для загрузки и создания копий
+        with self.api_util.open_media_stream(url) as stream:
+            content = stream.read()
+        s3_manager.upload_file(key, BytesIO(content), force=True)
+        keys = [key]
+        try:
+            img = images.open_image(content, max_size=max(images.COVER_SIZES))
+        except ValueError as ex:
+            # Страницы покажут исходную обложку
+            logger.warning("Не удалось создать копии обложки %s: %s", key, ex)
+            return keys, hashlib.sha256(content).hexdigest()
+
+        try:
+            keys.extend(images.upload_variants(s3_manager, key, img, images.COVER_SIZES))
+        except Exception:
+            self._discard_files(s3_manager, keys)
+            raise
+        return keys, hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def _skip_finished(db_session: Session, song_infos: list[dict]) -> list[dict]:
+        source_ids = [_source_id(song_info) for song_info in song_infos if _source_id(song_info) is not None]
+        if not source_ids:
+            return song_infos
+
+        finished = set(db_session.execute(
+            select(models.IngestManifest.source_song_id).where(
+                models.IngestManifest.source_song_id.in_(source_ids),
+                models.IngestManifest.status.in_([models.IngestManifest.STATUS_DONE,
+                                                  models.IngestManifest.STATUS_DUPLICATE])
+            )
+        ).scalars())
+        return [song_info for song_info in song_infos if _source_id(song_info) not in finished]
+
+    @staticmethod
+    def _find_pending(db_session: Session, song_infos: list[dict]) -> dict[str, int]:
+        """Возвращает id треков, оставшихся в статусе STATUS_PENDING, по id трека источника"""
+        source_ids = [_source_id(song_info) for song_info in song_infos if _source_id(song_info) is not None]
+        if not source_ids:
+            return {}
+
+        return dict(db_session.execute(
+            select(models.IngestManifest.source_song_id, models.IngestManifest.music_id).where(
+                models.IngestManifest.source_song_id.in_(source_ids),
+                models.IngestManifest.status == models.IngestManifest.STATUS_PENDING,
+                models.IngestManifest.music_id.is_not(None)
+            )
+        ).all())
+
+    @staticmethod
+    def _get_or_create_album(db_session: Session, album_info: dict) -> int:
+        album_id = db_session.execute(
+            select(models.Album.id).where(models.Album.name == album_info.get("name", "Unknown Album"))
+        ).scalar()
+        if album_id is None:
+            album = models.Album(
+                name=album_info.get("name", "Unknown Album"),
+                description=album_info.get("description", ""),
+                year=album_info.get("year", datetime.now().year)
+            )
+            db_session.add(album)
+            db_session.flush()
+            album_id = album.id
+        return album_id
+
+    @staticmethod
+    def _write_songs(db_session: Session, album_id: int, song_infos: list[dict],
+                     artist_ids: ArtistIdCache) -> list[tuple[int, dict]]:
+        if not song_infos:
+            return []
+
+        artist_names = {artist_data["name"] for song_info in song_infos
+                        for artist_data in song_info.get("artists", [])}
+        resolved_artists = artist_ids.resolve(db_session, artist_names)
+
+        music_ids = _insert_musics(db_session, [
+            {
+                "name": song_info["name"],
+                "release_year": song_info.get("year") or datetime.now().year,
+                "duration": song_info.get("duration") or 0,
+                "explicit_content": False,
+                "language": song_info.get("language") or "Unknown",
+                "album_id": album_id
+            }
+            for song_info in song_infos
+        ])
+
+        associations = {
+            (music_id, resolved_artists[artist_data["name"]])
+            for music_id, song_info in zip(music_ids, song_infos)
+            for artist_data in song_info.get("artists", [])
+            if artist_data["name"] in resolved_artists
+        }
+        if associations:
+            db_session.execute(
+                _insert_ignore(db_session, models.MusicArtistAssociation.__table__, ["music_id", "artist_id"]),
+                [{"music_id": music_id, "artist_id": artist_id} for music_id, artist_id in associations]
+            )
+
+        return list(zip(music_ids, song_infos))
+
+    @staticmethod
+    def _find_duplicates(db_session: Session, audio_keys: dict[int, str | None],
+                         audio_hashes: dict[int, str]) -> dict[int, tuple[int, str | None]]:
+        """Возвращает словарь id нового трека -> (id сохраненного трека с тем же аудио, название его файла аудио).
+        audio_keys - названия загруженных файлов аудио новых треков (None - аудио не загружалось)"""
+        hashes = {audio_hashes[music_id] for music_id in audio_keys if music_id in audio_hashes}
+        if not hashes:
+            return {}
+
+        known = {
+            audio_hash: (music_id, audio_key)
+            for audio_hash, music_id, audio_key in db_session.execute(
+                select(
+                    models.IngestManifest.audio_hash,
+                    models.IngestManifest.music_id,
+                    models.IngestManifest.audio_key
+                ).where(
+                    models.IngestManifest.audio_hash.in_(hashes),
+                    models.IngestManifest.status == models.IngestManifest.STATUS_DONE
+                )
+            )
+        }
+        duplicates = {}
+        # Файл аудио есть только у первого из одинаковых треков
+        for music_id, audio_key in sorted(audio_keys.items(), key=lambda item: item[1] is None):
+            audio_hash = audio_hashes.get(music_id)
+            if audio_hash is None:
+                continue
+            if audio_hash in known:
+                duplicates[music_id] = known[audio_hash]
+            else:
+                known[audio_hash] = (music_id, audio_key)
+        return duplicates
+
+    @staticmethod
+    def _link_audio(db_session: Session, audio_music_ids: dict[int, int]) -> None:
+        table = models.Music.__table__
+        db_session.execute(
+            update(table).where(table.c.id == bindparam("b_id")).values(audio_music_id=bindparam("b_audio_music_id")),
+            [{"b_id": music_id, "b_audio_music_id": audio_music_id}
+             for music_id, audio_music_id in audio_music_ids.items()]
+        )
+
+    @staticmethod
+    def _record_manifest(db_session: Session, rows: list[dict]) -> None:
+        # Запись повторно загруженного трека (STATUS_FAILED) заменяется
+        if rows:
+            db_session.execute(_upsert(db_session, models.IngestManifest.__table__, ["source_song_id"], [
+                "status", "music_id", "audio_hash", "audio_key", "image_key", "updated_at"
+            ]), rows)
+
+    def _record_failed(self, song_infos: list[dict]) -> None:
+        db_session = self.session_factory()
+        try:
+            self._record_manifest(db_session, [
+                _manifest_row(song_info, models.IngestManifest.STATUS_FAILED) for song_info in song_infos
+                if _source_id(song_info) is not None
+            ])
+            db_session.commit()
+        except Exception as ex:
+            db_session.rollback()
+            logger.exception("Не удалось записать в журнал незагруженные треки: %s", ex)
+        finally:
+            db_session.close()
+
+    @staticmethod
+    def _discard_musics(db_session: Session, music_ids: set[int]) -> None:
+        db_session.execute(
+            delete(models.MusicArtistAssociation).where(models.MusicArtistAssociation.music_id.in_(music_ids))
+        )
+        db_session.execute(delete(models.Music).where(models.Music.id.in_(music_ids)))
+
+    @staticmethod
+    def _discard_files(s3_manager: S3Manager, keys: list[str]) -> None:
+        for key in keys:
+            try:
+                s3_manager.delete_file(key)
+            except Exception as ex:
+                logger.warning("Не удалось удалить файл %s: %s", key, ex)
+
+
+class _SerialWriter:
+    """
+    Выполняет задания в одном потоке в порядке поступления. Очередь заданий ограничена ``max_pending``:
+    submit ждет, пока в ней не освободится место
+    """
+
+    def __init__(self, max_pending: int):
+        self._queue: queue.Queue[tuple[Future, Callable, tuple] | None] = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._work, name="ingest-db", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Ставит задание в очередь
+
+        :param fn: Функция
+        :type fn: Callable
+        :return: Результат выполнения функции
+        :rtype: Future
+        """
+        future = Future()
+        self._queue.put((future, fn, args))
+        return future
+
+    def close(self) -> None:
+        """Выполняет оставшиеся задания и останавливает поток"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _work(self) -> None:
+        while (task := self._queue.get()) is not None:
+            future, fn, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args)
+            except BaseException as ex:
+                future.set_exception(ex)
+            else:
+                future.set_result(result)
+
+
+class _HashingReader:
+    """Обертка над потоком, считающая SHA-256 прочитанных данных"""
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self.hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._stream.read(size)
+        self.hash.update(chunk)
+        return chunk
+
+
+def _flatten(key_lists: Iterable[list[str]]) -> list[str]:
+    return [key for keys in key_lists for key in keys]
+
+
+def _main_key(keys_by_prefix: dict[str, list[str]], prefix: str) -> str | None:
+    keys = keys_by_prefix.get(prefix)
+    return keys[0] if keys else None
+
+
+def _source_id(song_info: dict) -> str | None:
+    source_id = song_info.get("id")
+    return None if source_id is None else str(source_id)
+
+
+def _manifest_row(song_info: dict, status: str, music_id: int | None = None, audio_hash: str | None = None,
+                  audio_key: str | None = None, image_key: str | None = None) -> dict:
+    return {
+        "source_song_id": _source_id(song_info),
+        "status": status,
+        "music_id": music_id,
+        "audio_hash": audio_hash,
+        "audio_key": audio_key,
+        "image_key": image_key
+    }
+
+
+def _artist_key(name: str) -> str:
+    return name.strip().casefold()
+
+
+def _insert_ignore(db_session: Session, table, conflict_columns: list[str]):
+    """INSERT, пропускающий строки с уже существующим уникальным ключом"""
+    dialect = db_session.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update({column: statement.inserted[column] for column in conflict_columns})
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=conflict_columns)
+    return insert(table)
+
+
+def _upsert(db_session: Session, table, conflict_columns: list[str], update_columns: list[str]):
+    """INSERT, обновляющий update_columns у строк с уже существующим уникальным ключом"""
+    dialect = db_session.get_bind().dialect.name
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update({column: statement.inserted[column] for column in update_columns})
+    if dialect == "sqlite":
+        statement = sqlite.insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=conflict_columns,
+            set_={column: statement.excluded[column] for column in update_columns}
+        )
+    return insert(table)
+
+
+def _insert_musics(db_session: Session, rows: list[dict]) -> list[int]:
+    """Вставляет треки и возвращает их id в порядке rows"""
+    table = models.Music.__table__
+    if db_session.get_bind().dialect.insert_returning:
+        result = db_session.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+        return list(result.scalars())
+
+    # MySQL не поддерживает RETURNING, а id строк многострочного INSERT при параллельных вставках
+    # (innodb_autoinc_lock_mode=2) могут перемежаться с чужими, поэтому треки вставляются по одному
+    statement = insert(table)
+    return [db_session.execute(statement, row).lastrowid for row in rows]
@@ -1,2 +1,3 @@
 from .music_manager import MusicManager
+from .playlist_manager import PlaylistManager
 from .user_manager import UserManager
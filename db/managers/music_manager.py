@@ -1,15 +1,120 @@
+import datetime
+import threading
+import time
 from random import sample
+from typing import Iterable, NamedTuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
 
-from ..models import Music
+from .. import images
+from ..connect import use_session
+from ..db_config import settings
+from ..models import Music, MusicArtistAssociation
+from ..pagination import Page, paginate
 from ..s3manager import S3Manager
+from ..search import get_search_backend
+
+
+class TrackRow(NamedTuple):
+    """Легковесное представление трека для шаблонов и API, не привязанное к сессии базы данных"""
+    id: int
+    name: str
+    artist: str
+    album_id: int | None
+    duration: int
+    release_year: int
+    favorited_at: datetime.datetime | None = None
+
+    @classmethod
+    def from_music(cls, music: Music, favorited_at: datetime.datetime | None = None) -> "TrackRow":
+        """Создает TrackRow из объекта модели Music. Артисты трека должны быть загружены заранее
+        (см. TRACK_ROW_OPTIONS)
+
+        :param music: Объект модели Music
+        :type music: Music
+        :param favorited_at: Время добавления трека в избранное
+        :type favorited_at: datetime.datetime | None
+        :return: TrackRow объект
+        :rtype: TrackRow
+        """
+        return cls(
+            id=music.id,
+            name=music.name,
+            artist=", ".join(association.artist.name for association in music.artists),
+            album_id=music.album_id,
+            duration=music.duration,
+            release_year=music.release_year,
+            favorited_at=favorited_at
+        )
+
+
+# Опции загрузки Music, необходимые для TrackRow.from_music без ленивых запросов
+TRACK_ROW_OPTIONS = (
+    selectinload(Music.artists).joinedload(MusicArtistAssociation.artist),
+)
+
+
+class MusicIdPool:
+    """
+    Потокобезопасный кэш id всех треков для случайной выборки.\n
+    Список id перечитывается из базы данных не чаще, чем раз в ``ttl`` секунд, или после вызова invalidate
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self._ids: list[int] = []
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_ids(self, db_session: Session) -> list[int]:
+        """Возвращает список id всех треков
+
+        :param db_session: Сессия базы данных для обновления списка
+        :type db_session: Session
+        :return: Список id треков
+        :rtype: list[int]
+        """
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._ids = list(db_session.execute(select(Music.id)).scalars())
+                self._expires_at = time.monotonic() + self.ttl
+            return self._ids
+
+    def invalidate(self) -> None:
+        """Помечает список id устаревшим. Следует вызывать после добавления или удаления треков"""
+        with self._lock:
+            self._expires_at = 0.0
+
+
+music_id_pool = MusicIdPool(ttl=settings.MUSIC_ID_POOL_TTL)
 
 
 class MusicManager:
     def __init__(self, db_session: Session):
         self.db_session = db_session
 
+    @staticmethod
+    def get_audio_keys(*music_ids: int) -> list[str]:
+        """Возвращает названия файлов аудио треков в s3 хранилище.\n
+        Трек, аудио которого совпало с уже сохраненным при загрузке каталога, использует файл другого трека
+        (Music.audio_music_id). Такие треки находятся одним запросом к базе данных
+
+        :param music_ids: id треков
+        :return: Список названий файлов в порядке music_ids
+        :rtype: list[str]
+        """
+        audio_music_ids = {}
+        if music_ids:
+            with use_session() as db_session:
+                audio_music_ids = dict(db_session.execute(
+                    select(Music.id, Music.audio_music_id).where(
+                        Music.id.in_(set(music_ids)),
+                        Music.audio_music_id.is_not(None)
+                    )
+                ).all())
+        return [f"music_audio_{audio_music_ids.get(music_id, music_id)}.mp4" for music_id in music_ids]
+
     @staticmethod
     def get_music_audio_url(music_id: int) -> str | None:
         """Возвращает url на файл с музыкой по id
@@ -22,7 +127,7 @@ class MusicManager:
         with S3Manager() as s3_manager:
             try:
                 url = s3_manager.get_file_url_safe(
-                    f"music_audio_{music_id}.mp4",
+                    MusicManager.get_audio_keys(music_id)[0],
                     content_type="audio/mp3",
                     content_disposition="inline"
                 )
@@ -56,7 +161,7 @@ class MusicManager:
             try:
                 url_pair = (
                     s3_manager.get_file_url_safe(
-                        f"music_audio_{music_id}.mp4",
+                        MusicManager.get_audio_keys(music_id)[0],
                         content_type="audio/mp3",
                         content_disposition="inline"
                     ),
@@ -76,19 +181,18 @@ class MusicManager:
         и вторым элементом - url на изображение к музыке.\n
         Внимание! Данный метод не проверяет существование записей в базе данных и файлов в s3.
         Используйте данный метод, если уверены, что в базе данных и s3 хранилище существует необходимая информация.
+        Названия файлов аудио определяются одним запросом (см. get_audio_keys)
 
         :param music_ids: id треков
         :return: Список, каждый элемент которого - кортеж с первым элементом - url на аудио музыки
         и вторым элементом - url на изображение к музыке.
         :rtype: list[tuple[str, str]]
         """
+        audio_keys = MusicManager.get_audio_keys(*music_ids)
         with S3Manager() as s3_manager:
             url_lists = s3_manager.get_file_group_urls(
                 *zip(
-                    map(
-                        lambda music_id: f"music_audio_{music_id}.mp4",
-                        music_ids
-                    ),
+                    audio_keys,
                     map(
                         lambda music_id: f"music_image_{music_id}.jpg",
                         music_ids
@@ -100,20 +204,144 @@ class MusicManager:
         res: list[tuple[str, str]] = list(map(tuple, url_lists))
         return res
 
-    def search_music(self, pattern: str) -> list[type[Music]]:
-        """Возвращает список объектов модели Music, в название которых входит паттерн query
+    @staticmethod
+    def get_music_image_srcsets(*music_ids: int) -> list[tuple[str, str | None]]:
+        """Возвращает для каждого трека значения атрибута srcset с уменьшенными копиями обложки:
+        JPEG и WebP (None, если WebP копии не создаются).\n
+        Внимание! Данный метод не проверяет существование копий в s3 хранилище.
+        Копии создаются при загрузке каталога, для старых обложек - командой ``flask --app app generate-thumbnails``
 
-        :param pattern: Паттерн для поиска
+        :param music_ids: id треков
+        :return: Список кортежей (JPEG srcset, WebP srcset)
+        :rtype: list[tuple[str, str | None]]
+        """
+        # Карточки треков не шире 300px, копия 600px - для экранов с высокой плотностью пикселей
+        sizes = [size for size in images.COVER_SIZES if size >= 300]
+        variants = images.image_variants(tuple(sizes))
+        with S3Manager() as s3_manager:
+            url_lists = s3_manager.get_file_group_urls(
+                *(
+                    [images.variant_key(f"music_image_{music_id}.jpg", variant.size, variant.format)
+                     for variant in variants]
+                    for music_id in music_ids
+                ),
+                content_types=[variant.content_type for variant in variants],
+                content_disposition="inline"
+            )
+
+        srcsets = []
+        for urls in url_lists:
+            by_format = {"jpg": [], "webp": []}
+            for variant, url in zip(variants, urls):
+                by_format[variant.format].append(f"{url} {variant.size}w")
+            srcsets.append((", ".join(by_format["jpg"]), ", ".join(by_format["webp"]) or None))
+        return srcsets
+
+    def search_music(self, pattern: str, limit: int | None = None) -> list[type[Music]]:
+        """Возвращает список объектов модели Music, найденных по названию трека, имени артиста или названию альбома,
+        в порядке убывания релевантности
+
+        :param pattern: Поисковый запрос
         :type pattern: str
-        :return: Список объектов модели Music, в название которых соответствует "%pattern%"
+        :param limit: Максимальное количество результатов (None - без ограничения)
+        :type limit: int | None
+        :return: Список объектов модели Music
         :rtype: list[type[Music]]
         """
-        return self.db_session.query(Music).filter(Music.name.ilike(f"%{pattern}%")).all()
+        hits = get_search_backend(self.db_session).search(self.db_session, pattern, limit=limit)
+        return [music for _, music in self._attach_musics(hits)]
+
+    def search_music_page(self, pattern: str, cursor: str | None = None,
+                          page_size: int | None = None) -> Page[type[Music]]:
+        """Возвращает страницу результатов поиска (см. search_music)
+
+        :param pattern: Поисковый запрос
+        :type pattern: str
+        :param cursor: Курсор, полученный с соседней страницы (None - первая страница)
+        :type cursor: str | None
+        :param page_size: Размер страницы (по умолчанию settings.PAGE_SIZE_DEFAULT)
+        :type page_size: int | None
+        :raises InvalidCursorError: Если курсор поврежден
+        :return: Страница объектов модели Music
+        :rtype: Page[type[Music]]
+        """
+        backend = get_search_backend(self.db_session)
+        page = paginate(
+            lambda after, before, limit: self._attach_musics(
+                backend.search(self.db_session, pattern, limit=limit, after=after, before=before)
+            ),
+            key=lambda item: (item[0][0], item[1].id),
+            key_types=(float, int),
+            cursor=cursor,
+            page_size=page_size
+        )
+        page.items = [music for _, music in page.items]
+        return page
 
-    def get_random_music(self) -> list[type[Music]]:
-        """Возвращает список 5 случайных, не повторяющихся, объектов модели Music
+    def get_music_page(self, cursor: str | None = None, page_size: int | None = None) -> Page[type[Music]]:
+        """Возвращает страницу каталога треков, упорядоченного по id. Артисты треков загружаются заранее
+        (см. TRACK_ROW_OPTIONS)
 
-        :return: Список 5 случайных, не повторяющихся, объектов модели Music
+        :param cursor: Курсор, полученный с соседней страницы (None - первая страница)
+        :type cursor: str | None
+        :param page_size: Размер страницы (по умолчанию settings.PAGE_SIZE_DEFAULT)
+        :type page_size: int | None
+        :raises InvalidCursorError: Если курсор поврежден
+        :return: Страница объектов модели Music
+        :rtype: Page[type[Music]]
+        """
+
+        def fetch(after: tuple | None, before: tuple | None, limit: int) -> list[type[Music]]:
+            query = self.db_session.query(Music).options(*TRACK_ROW_OPTIONS)
+            if before is not None:
+                musics = query.filter(Music.id < before[0]).order_by(Music.id.desc()).limit(limit).all()
+                return musics[::-1]
+            if after is not None:
+                query = query.filter(Music.id > after[0])
+            return query.order_by(Music.id).limit(limit).all()
+
+        return paginate(fetch, key=lambda music: (music.id,), key_types=(int,), cursor=cursor, page_size=page_size)
+
+    def get_existing_ids(self, music_ids: Iterable[int]) -> list[int]:
+        """Возвращает id треков из music_ids, которые существуют в базе данных, по возрастанию
+
+        :param music_ids: id треков
+        :type music_ids: Iterable[int]
+        :return: Список id существующих треков
+        :rtype: list[int]
+        """
+        music_ids = set(music_ids)
+        if not music_ids:
+            return []
+        return list(self.db_session.execute(
+            select(Music.id).where(Music.id.in_(music_ids)).order_by(Music.id)
+        ).scalars())
+
+    def _attach_musics(self, hits: list[tuple[float, int]]) -> list[tuple[tuple[float, int], type[Music]]]:
+        if not hits:
+            return []
+
+        musics = self.db_session.query(Music).filter(Music.id.in_([music_id for _, music_id in hits])).all()
+        musics_by_id = {music.id: music for music in musics}
+        return [(hit, musics_by_id[hit[1]]) for hit in hits if hit[1] in musics_by_id]
+
+    def get_random_music(self, count: int | None = None) -> list[type[Music]]:
+        """Возвращает список случайных, не повторяющихся, объектов модели Music.\n
+        Если треков в базе данных меньше, чем count, возвращаются все треки в случайном порядке
+
+        :param count: Количество треков (по умолчанию settings.RANDOM_MUSIC_SAMPLE_SIZE)
+        :type count: int | None
+        :return: Список случайных, не повторяющихся, объектов модели Music
         :rtype: list[type[Music]]
         """
-        return sample(self.db_session.query(Music).all(), 16)
+        if count is None:
+            count = settings.RANDOM_MUSIC_SAMPLE_SIZE
+
+        music_ids = music_id_pool.get_ids(self.db_session)
+        sampled_ids = sample(music_ids, min(count, len(music_ids)))
+        if not sampled_ids:
+            return []
+
+        musics = self.db_session.query(Music).filter(Music.id.in_(sampled_ids)).all()
+        musics_by_id = {music.id: music for music in musics}
+        return [musics_by_id[music_id] for music_id in sampled_ids if music_id in musics_by_id]
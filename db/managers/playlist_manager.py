@@ -0,0 +1,343 @@
+from typing import Iterable
+
+from sqlalchemy import ColumnElement, Insert, and_, bindparam, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from .music_manager import TRACK_ROW_OPTIONS, TrackRow
+from ..connect import use_session
+from ..models import Music, Playlist, PlaylistTrack, utcnow
+from ..pagination import Page, paginate
+
+# Промежуток между позициями соседних треков: между ними можно 16 раз вставить трек посередине,
+# прежде чем потребуется перенумерация плейлиста
+POSITION_GAP = 1 << 16
+
+
+class PlaylistNotFoundError(Exception):
+    """Данная ошибка возникает, если у пользователя нет плейлиста с указанным id"""
+
+
+class PlaylistManager:
+    """Класс для управления плейлистами пользователей в базе данных.\n
+    Методы принимают id пользователя и изменяют только его плейлисты
+    """
+
+    @staticmethod
+    def create_playlist(user_id: int, name: str) -> Playlist:
+        """Создает плейлист
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param name: Название плейлиста
+        :type name: str
+        :return: Объект модели Playlist
+        :rtype: Playlist
+        """
+        playlist = Playlist(user_id=user_id, name=name)
+        with use_session() as db_session:
+            # Сессия общая для всего запроса: при ошибке откатывается только точка сохранения
+            with db_session.begin_nested():
+                db_session.add(playlist)
+            db_session.commit()
+            db_session.refresh(playlist)
+        return playlist
+
+    @staticmethod
+    def get_playlists(user_id: int) -> list[Playlist]:
+        """Возвращает плейлисты пользователя, начиная с последних созданных
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :return: Список объектов модели Playlist
+        :rtype: list[Playlist]
+        """
+        with use_session() as db_session:
+            return list(db_session.execute(
+                select(Playlist).where(Playlist.user_id == user_id).order_by(Playlist.id.desc())
+            ).scalars())
+
+    @staticmethod
+    def rename_playlist(user_id: int, playlist_id: int, name: str) -> None:
+        """Переименовывает плейлист
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param playlist_id: id плейлиста
+        :type playlist_id: int
+        :param name: Новое название
+        :type name: str
+        :raises PlaylistNotFoundError: Если у пользователя нет плейлиста с таким id
+        """
+        with use_session() as db_session:
+            updated = db_session.execute(
+                update(Playlist).where(Playlist.id == playlist_id, Playlist.user_id == user_id).values(name=name)
+            ).rowcount
+            db_session.commit()
+        if not updated:
+            raise PlaylistNotFoundError(f"Playlist not found with id: {playlist_id}")
+
+    @staticmethod
+    def delete_playlist(user_id: int, playlist_id: int) -> None:
+        """Удаляет плейлист вместе с его треками
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param playlist_id: id плейлиста
+        :type playlist_id: int
+        :raises PlaylistNotFoundError: Если у пользователя нет плейлиста с таким id
+        """
+        with use_session() as db_session:
+            with db_session.begin_nested():
+                _check_owner(db_session, user_id, playlist_id)
+                db_session.execute(delete(PlaylistTrack).where(PlaylistTrack.playlist_id == playlist_id))
+                db_session.execute(delete(Playlist).where(Playlist.id == playlist_id))
+            db_session.commit()
+
+    @staticmethod
+    def add_tracks(user_id: int, playlist_id: int, music_ids: Iterable[int]) -> int:
+        """Добавляет треки в конец плейлиста в переданном порядке.\n
+        Треки, которые уже есть в плейлисте или отсутствуют в базе данных, пропускаются
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param playlist_id: id плейлиста
+        :type playlist_id: int
+        :param music_ids: id треков
+        :type music_ids: Iterable[int]
+        :raises PlaylistNotFoundError: Если у пользователя нет плейлиста с таким id
+        :return: Количество добавленных треков
+        :rtype: int
+        """
+        music_ids = list(dict.fromkeys(music_ids))
+        with use_session() as db_session:
+            with db_session.begin_nested():
+                _check_owner(db_session, user_id, playlist_id)
+                if not music_ids:
+                    return 0
+
+                existing = set(db_session.execute(select(Music.id).where(Music.id.in_(music_ids))).scalars())
+                present = set(db_session.execute(
+                    select(PlaylistTrack.music_id).where(
+                        PlaylistTrack.playlist_id == playlist_id,
+                        PlaylistTrack.music_id.in_(music_ids)
+                    )
+                ).scalars())
+                new_ids = [music_id for music_id in music_ids if music_id in existing and music_id not in present]
+                if not new_ids:
+                    return 0
+
+                # max(position) выбирается по индексу (playlist_id, position), не просматривая плейлист
+                last_position = db_session.execute(
+                    select(func.max(PlaylistTrack.position)).where(PlaylistTrack.playlist_id == playlist_id)
+                ).scalar() or 0
+                now = utcnow()
+                added = db_session.execute(_insert_ignore_track().values([
+                    {
+                        "playlist_id": playlist_id,
+                        "music_id": music_id,
+                        "position": last_position + POSITION_GAP * (i + 1),
+                        "added_at": now
+                    }
+                    for i, music_id in enumerate(new_ids)
+                ])).rowcount
+            db_session.commit()
+            return added
+
+    @staticmethod
+    def remove_tracks(user_id: int, playlist_id: int, music_ids: Iterable[int]) -> int:
+        """Удаляет треки из плейлиста. Позиции остальных треков не изменяются
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param playlist_id: id плейлиста
+        :type playlist_id: int
+        :param music_ids: id треков
+        :type music_ids: Iterable[int]
+        :raises PlaylistNotFoundError: Если у пользователя нет плейлиста с таким id
+        :return: Количество удаленных треков
+        :rtype: int
+        """
+        music_ids = set(music_ids)
+        with use_session() as db_session:
+            with db_session.begin_nested():
+                _check_owner(db_session, user_id, playlist_id)
+                if not music_ids:
+                    return 0
+                removed = db_session.execute(
+                    delete(PlaylistTrack).where(
+                        PlaylistTrack.playlist_id == playlist_id,
+                        PlaylistTrack.music_id.in_(music_ids)
+                    )
+                ).rowcount
+            db_session.commit()
+            return removed
+
+    @staticmethod
+    def move_track(user_id: int, playlist_id: int, music_id: int, after_music_id: int | None) -> None:
+        """Перемещает трек в плейлисте сразу после другого трека.\n
+        Трек получает позицию посередине между соседями, поэтому изменяется одна строка. Если промежуток
+        между соседями исчерпан, позиции плейлиста перенумеровываются
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param playlist_id: id плейлиста
+        :type playlist_id: int
+        :param music_id: id перемещаемого трека
+        :type music_id: int
+        :param after_music_id: id трека, после которого нужно поставить трек (None - в начало плейлиста)
+        :type after_music_id: int | None
+        :raises PlaylistNotFoundError: Если у пользователя нет плейлиста с таким id
+        :raises ValueError: Если треков нет в плейлисте или after_music_id совпадает с music_id
+        """
+        if after_music_id == music_id:
+            raise ValueError("Track can not be moved after itself")
+
+        with use_session() as db_session:
+            with db_session.begin_nested():
+                _check_owner(db_session, user_id, playlist_id)
+                if _get_position(db_session, playlist_id, music_id) is None:
+                    raise ValueError(f"Track {music_id} is not in playlist {playlist_id}")
+
+                position = _position_after(db_session, playlist_id, music_id, after_music_id)
+                if position is None:
+                    _renumber(db_session, playlist_id)
+                    position = _position_after(db_session, playlist_id, music_id, after_music_id)
+
+                db_session.execute(
+                    update(PlaylistTrack)
+                    .where(PlaylistTrack.playlist_id == playlist_id, PlaylistTrack.music_id == music_id)
+                    .values(position=position)
+                )
+            db_session.commit()
+
+    @staticmethod
+    def get_tracks_page(user_id: int, playlist_id: int, cursor: str | None = None,
+                        page_size: int | None = None) -> Page[TrackRow]:
+        """Возвращает страницу треков плейлиста в порядке плейлиста.\n
+        Ссылки на файлы не подписываются: их получают отдельно для всей страницы (см. rest_api._track_urls)
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param playlist_id: id плейлиста
+        :type playlist_id: int
+        :param cursor: Курсор, полученный с соседней страницы (None - первая страница)
+        :type cursor: str | None
+        :param page_size: Размер страницы (по умолчанию settings.PAGE_SIZE_DEFAULT)
+        :type page_size: int | None
+        :raises PlaylistNotFoundError: Если у пользователя нет плейлиста с таким id
+        :raises InvalidCursorError: Если курсор поврежден
+        :return: Страница объектов TrackRow
+        :rtype: Page[TrackRow]
+        """
+        with use_session() as db_session:
+            _check_owner(db_session, user_id, playlist_id)
+
+            def fetch(after: tuple | None, before: tuple | None,
+                      limit: int) -> list[tuple[tuple[int, int], TrackRow]]:
+                query = (
+                    select(Music, PlaylistTrack.position)
+                    .join(PlaylistTrack, PlaylistTrack.music_id == Music.id)
+                    .where(PlaylistTrack.playlist_id == playlist_id)
+                    .options(*TRACK_ROW_OPTIONS)
+                )
+                if before is not None:
+                    query = query.where(_key_before(*before)).order_by(
+                        PlaylistTrack.position.desc(), PlaylistTrack.music_id.desc()
+                    )
+                else:
+                    if after is not None:
+                        query = query.where(_key_after(*after))
+                    query = query.order_by(PlaylistTrack.position, PlaylistTrack.music_id)
+
+                rows = [
+                    ((position, music.id), TrackRow.from_music(music))
+                    for music, position in db_session.execute(query.limit(limit))
+                ]
+                return rows[::-1] if before is not None else rows
+
+            page = paginate(fetch, key=lambda item: item[0], key_types=(int, int), cursor=cursor,
+                            page_size=page_size)
+            page.items = [row for _, row in page.items]
+            return page
+
+
+def _check_owner(db_session: Session, user_id: int, playlist_id: int) -> None:
+    owner_id = db_session.execute(select(Playlist.user_id).where(Playlist.id == playlist_id)).scalar()
+    if owner_id is None or owner_id != user_id:
+        raise PlaylistNotFoundError(f"Playlist not found with id: {playlist_id}")
+
+
+def _get_position(db_session: Session, playlist_id: int, music_id: int) -> int | None:
+    return db_session.execute(
+        select(PlaylistTrack.position).where(
+            PlaylistTrack.playlist_id == playlist_id,
+            PlaylistTrack.music_id == music_id
+        )
+    ).scalar()
+
+
+def _position_after(db_session: Session, playlist_id: int, music_id: int, after_music_id: int | None) -> int | None:
+    """Позиция для трека music_id сразу после after_music_id или None, если свободной позиции нет"""
+    if after_music_id is None:
+        lower = None
+    else:
+        lower = _get_position(db_session, playlist_id, after_music_id)
+        if lower is None:
+            raise ValueError(f"Track {after_music_id} is not in playlist {playlist_id}")
+
+    query = select(PlaylistTrack.position, PlaylistTrack.music_id).where(
+        PlaylistTrack.playlist_id == playlist_id,
+        PlaylistTrack.music_id != music_id
+    )
+    if lower is not None:
+        query = query.where(_key_after(lower, after_music_id))
+    upper = db_session.execute(
+        query.order_by(PlaylistTrack.position, PlaylistTrack.music_id).limit(1)
+    ).scalar()
+
+    if lower is None:
+        return POSITION_GAP if upper is None else upper - POSITION_GAP
+    if upper is None:
+        return lower + POSITION_GAP
+    if upper - lower < 2:
+        return None
+    return (lower + upper) // 2
+
+
+def _renumber(db_session: Session, playlist_id: int) -> None:
+    """Восстанавливает промежутки POSITION_GAP между позициями треков плейлиста"""
+    music_ids = db_session.execute(
+        select(PlaylistTrack.music_id)
+        .where(PlaylistTrack.playlist_id == playlist_id)
+        .order_by(PlaylistTrack.position, PlaylistTrack.music_id)
+    ).scalars()
+    db_session.execute(
+        update(PlaylistTrack.__table__)
+        .where(
+            PlaylistTrack.__table__.c.playlist_id == bindparam("b_playlist_id"),
+            PlaylistTrack.__table__.c.music_id == bindparam("b_music_id")
+        )
+        .values(position=bindparam("b_position")),
+        [
+            {"b_playlist_id": playlist_id, "b_music_id": music_id, "b_position": POSITION_GAP * (i + 1)}
+            for i, music_id in enumerate(music_ids)
+        ]
+    )
+
+
+def _key_after(position: int, music_id: int) -> ColumnElement[bool]:
+    return or_(
+        PlaylistTrack.position > position,
+        and_(PlaylistTrack.position == position, PlaylistTrack.music_id > music_id)
+    )
+
+
+def _key_before(position: int, music_id: int) -> ColumnElement[bool]:
+    return or_(
+        PlaylistTrack.position < position,
+        and_(PlaylistTrack.position == position, PlaylistTrack.music_id < music_id)
+    )
+
+
+def _insert_ignore_track() -> Insert:
+    return insert(PlaylistTrack).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
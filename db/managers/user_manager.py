@@ -1,16 +1,117 @@
+import datetime
+import logging
+import re
+import time
 from io import BytesIO
+from typing import BinaryIO, Iterable
 
-from PIL import Image
+from flask_login import UserMixin
+from sqlalchemy import Insert, Select, and_, delete, insert, literal, or_, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 
-from ..connect import create_session
-from ..models import User, Favorite, Music
-from ..s3manager import S3Manager
+from .music_manager import TRACK_ROW_OPTIONS, TrackRow
+from .. import images
+from ..cache import CacheBackend, InMemoryCacheBackend
+from ..connect import use_session
+from ..db_config import settings
+from ..models import User, Favorite, Music, utcnow
+from ..pagination import Page, paginate
+from ..s3manager import S3Manager, delayed_deleter
+
+logger = logging.getLogger(__name__)
 
 
 class EmailAlreadyExistsError(Exception):
     """Данная ошибка возникает в случае попытки добавить в базу данных уже существующий email"""
 
 
+class UserSnapshot(UserMixin):
+    """
+    Неизменяемый снимок пользователя для flask-login.\n
+    Не связан с сессией базы данных и не содержит хэш пароля, поэтому безопасно хранится в кэше
+    """
+
+    def __init__(self, *, id: int, username: str, email: str, is_active: bool = True,
+                 avatar_version: int | None = None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.avatar_version = avatar_version
+        self._is_active = is_active
+
+    @property
+    def is_active(self) -> bool:
+        return self._is_active
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        """Создает снимок из объекта модели User
+
+        :param user: Объект модели User
+        :type user: User
+        :return: UserSnapshot объект
+        :rtype: UserSnapshot
+        """
+        return cls(id=user.id, username=user.username, email=user.email, is_active=bool(user.is_active),
+                   avatar_version=user.avatar_version)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "username": self.username, "email": self.email, "is_active": self._is_active,
+                "avatar_version": self.avatar_version}
+
+    def __repr__(self):
+        return f"<UserSnapshot {self.username}>"
+
+
+class UserCache:
+    """Кэш снимков пользователей. Хранилище можно заменить на общее для нескольких процессов через backend"""
+
+    def __init__(self, backend: CacheBackend, ttl: int = 60):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, user_id: int) -> UserSnapshot | None:
+        """Возвращает снимок пользователя из кэша
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :return: UserSnapshot объект или None, если пользователя нет в кэше
+        :rtype: UserSnapshot | None
+        """
+        data = self.backend.get(self._key(user_id))
+        return UserSnapshot(**data) if data is not None else None
+
+    def set(self, snapshot: UserSnapshot) -> None:
+        """Сохраняет снимок пользователя в кэш
+
+        :param snapshot: Снимок пользователя
+        :type snapshot: UserSnapshot
+        """
+        if self.ttl > 0:
+            self.backend.set(self._key(snapshot.id), snapshot.to_dict(), self.ttl)
+
+    def invalidate(self, user_id: int | None) -> None:
+        """Удаляет пользователя из кэша
+
+        :param user_id: id пользователя
+        :type user_id: int | None
+        """
+        if user_id is not None:
+            self.backend.delete(self._key(user_id))
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"user:{user_id}"
+
+
+user_cache = UserCache(InMemoryCacheBackend(), ttl=settings.USER_CACHE_TTL)
+
+# Файл аватарки с версией в названии никогда не изменяется
+AVATAR_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
 class UserManager:
     """Класс для управления пользователями в базе данных"""
 
@@ -24,12 +125,30 @@ class UserManager:
         :return: Объект модели User
         :rtype: User
         """
-        with create_session() as db_session:
+        with use_session() as db_session:
             user_instance: User | None = db_session.get(User, user_id)
             if user_instance is None:
                 raise ValueError(f"User not found with id: {user_id}")
             return user_instance
 
+    @staticmethod
+    def get_user_snapshot(user_id: int) -> UserSnapshot:
+        """Получение снимка пользователя по id. Сначала проверяется кэш, затем база данных
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :raises ValueError: Если пользователя с данным user_id не существует
+        :return: UserSnapshot объект
+        :rtype: UserSnapshot
+        """
+        snapshot = user_cache.get(user_id)
+        if snapshot is not None:
+            return snapshot
+
+        snapshot = UserSnapshot.from_user(UserManager.get_user_by_id(user_id))
+        user_cache.set(snapshot)
+        return snapshot
+
     @staticmethod
     def get_user_by_email(email: str) -> User:
         """Получение пользователя по адресу эл. почты
@@ -41,7 +160,7 @@ class UserManager:
         :rtype: User
         """
 
-        with create_session() as db_session:
+        with use_session() as db_session:
             user_instance: User | None = db_session.query(User).filter(User.email == email).first()
             if user_instance is None:
                 raise ValueError(f"User not found with email: {email}")
@@ -57,14 +176,13 @@ class UserManager:
         if self._email_exists(user.email):
             raise EmailAlreadyExistsError(f"Email already exists: {user.email}")
 
-        with create_session() as db_session:
-            try:
+        with use_session() as db_session:
+            # Сессия общая для всего запроса: при ошибке откатывается только точка сохранения
+            with db_session.begin_nested():
                 db_session.add(user)
-                db_session.commit()
-                db_session.refresh(user)
-            except Exception:
-                db_session.rollback()
-                raise
+            db_session.commit()
+            db_session.refresh(user)
+        user_cache.invalidate(user.id)
 
     @staticmethod
     def update_user_info(user: User) -> None:
@@ -73,13 +191,11 @@ class UserManager:
         :param user: Объект модели User
         :type user: User
         """
-        with create_session() as db_session:
-            try:
+        with use_session() as db_session:
+            with db_session.begin_nested():
                 db_session.merge(user)
-                db_session.commit()
-            except Exception:
-                db_session.rollback()
-                raise
+            db_session.commit()
+        user_cache.invalidate(user.id)
 
     @staticmethod
     def delete_user(user: User):
@@ -88,55 +204,157 @@ class UserManager:
         :param user: Объект модели User
         :type user: User
         """
-        with create_session() as db_session:
-            try:
+        user_id = user.id
+        with use_session() as db_session:
+            with db_session.begin_nested():
                 db_session.delete(user)
-                db_session.commit()
-            except Exception:
-                db_session.rollback()
-                raise
+            db_session.commit()
+        user_cache.invalidate(user_id)
 
     @staticmethod
     def _email_exists(email: str) -> bool:
-        with create_session() as db_session:
+        with use_session() as db_session:
             user_instance: User | None = db_session.query(User).filter(User.email == email).first()
             return user_instance is not None
 
-    def upload_avatar(self, user_id: int, content: bytes):
-        """ Загрузка аватарки пользователя в s3 хранилище
+    @staticmethod
+    def upload_avatar(user_id: int, content: bytes | BinaryIO) -> int:
+        """ Загрузка аватарки пользователя в s3 хранилище.\n
+        Изображение обрабатывается в пуле процессов images.image_workers. Каждая загрузка сохраняется под новым
+        названием с версией, поэтому файлы отдаются с неограниченным временем кэширования, а версия записывается
+        в User.avatar_version, только если она новее сохраненной в базе данных. Файлы замененной версии удаляются
+        в фоне (s3manager.delayed_deleter) через settings.AVATAR_DELETE_DELAY секунд: до этого на них могут
+        ссылаться страницы и снимки пользователя в кэшах других процессов. Файлы, удаление которых не
+        выполнилось, удаляет команда cleanup-avatars (UserManager.delete_replaced_avatars).
+        Существование пользователя не проверяется: вызывающий код передает id аутентифицированного пользователя
 
         :param user_id: id пользователя
         :type user_id: int
-        :param content: Валидные байты, хранящие изображение
-        :type content: bytes
+        :param content: Байты или файлоподобный объект с изображением. Поток не читается в память целиком:
+            он копируется во временный файл, который открывает процесс пула
+        :type content: bytes | BinaryIO
+        :raises ValueError: Если данные не являются изображением или изображение слишком большое
+            (в том числе длиннее settings.MAX_UPLOAD_SIZE)
+        :raises TimeoutError: Если пул обработки изображений занят
+        :return: Текущая версия аватарки (версия параллельной загрузки, если она оказалась новее)
+        :rtype: int
         """
-        try:
-            self.get_user_by_id(user_id)
-        except ValueError:
-            raise
-
-        converted_content = _convert_image_bytes_to_jpeg(content)
-
+        if isinstance(content, bytes):
+            rendered = images.image_workers.run(images.render_avatar, content)
+        else:
+            with images.spool_to_file(content, settings.MAX_UPLOAD_SIZE) as spool:
+                rendered = images.image_workers.run(images.render_avatar, spool.name)
+
+        version = time.time_ns() // 1_000_000
+        filename = _avatar_key(user_id, version)
         with S3Manager() as s3_manager:
-            s3_manager.upload_file(f"user_avatar_{user_id}.jpg", converted_content, force=True)
+            for size, data in rendered.items():
+                key = filename if size is None else images.variant_key(filename, size)
+                s3_manager.upload_file(key, BytesIO(data), force=True, cache_control=AVATAR_CACHE_CONTROL)
+
+            with use_session() as db_session:
+                # Сравнение с текущей версией выполняется под блокировкой строки:
+                # версия из снимка пользователя может быть устаревшей
+                previous = db_session.scalar(
+                    select(User.avatar_version).where(User.id == user_id).with_for_update()
+                )
+                if previous is None or previous < version:
+                    db_session.execute(update(User).where(User.id == user_id).values(avatar_version=version))
+                    replaced = previous
+                else:
+                    # Параллельная загрузка оказалась новее: заменена только что загруженная версия
+                    replaced, version = version, previous
+                db_session.commit()
+            user_cache.invalidate(user_id)
+
+        if replaced is not None:
+            delayed_deleter.schedule(_avatar_keys(user_id, replaced), settings.AVATAR_DELETE_DELAY)
+        return version
 
     @staticmethod
-    def get_avatar_url(user_id: int) -> str | None:
-        """Возвращает url на аватарку пользователя
+    def get_avatar_url(user_id: int, size: int | None = None, avatar_version: int | None = None) -> str | None:
+        """Возвращает url на аватарку пользователя.\n
+        Если известна версия аватарки (UserSnapshot.avatar_version), url подписывается без обращения
+        к s3 хранилищу. Без версии проверяется наличие аватарки, загруженной до появления версий
 
         :param user_id: id пользователя
+        :param size: Размер уменьшенной копии из images.AVATAR_SIZES (None - исходная аватарка).
+            Если копии нет, возвращается url исходной аватарки
+        :type size: int | None
+        :param avatar_version: Версия аватарки
+        :type avatar_version: int | None
         :return: url на аватарку пользователя или None, если у данного пользователя нет аватарки
         :rtype: str | None
         """
         with S3Manager() as s3_manager:
-            try:
-                return s3_manager.get_file_url_safe(
-                    f"user_avatar_{user_id}.jpg",
+            if avatar_version is not None:
+                # Копии всех размеров загружаются вместе с аватаркой
+                filename = _avatar_key(user_id, avatar_version)
+                return s3_manager.get_file_url_fast(
+                    filename if size is None else images.variant_key(filename, size),
                     content_type="image/jpeg",
                     content_disposition="inline"
                 )
-            except ValueError:
-                return None
+
+            filename = f"user_avatar_{user_id}.jpg"
+            filenames = [filename] if size is None else [images.variant_key(filename, size), filename]
+            for candidate in filenames:
+                try:
+                    return s3_manager.get_file_url_safe(
+                        candidate,
+                        content_type="image/jpeg",
+                        content_disposition="inline"
+                    )
+                except ValueError:
+                    continue
+            return None
+
+    @staticmethod
+    def delete_replaced_avatars() -> int:
+        """Удаляет из s3 хранилища файлы замененных аватарок, оставшиеся после загрузок
+        (например, если процесс завершился до их отложенного удаления).\n
+        Версия считается замененной с момента появления следующей по времени версии и удаляется, когда
+        с этого момента прошло settings.AVATAR_DELETE_DELAY секунд. Файлы без следующей версии, но и не текущие,
+        остаются от незавершенных загрузок и считаются замененными с момента своего создания. Текущая версия
+        не удаляется никогда; аватарка, загруженная до появления версий, имеет версию 0
+
+        :return: Количество удаленных файлов
+        :rtype: int
+        """
+        pattern = re.compile(r"user_avatar_(\d+)(?:_v(\d+))?(?:_\d+)?\.jpg")
+        keys: dict[int, dict[int, list[str]]] = {}
+        with S3Manager() as s3_manager:
+            for obj in s3_manager.get_objects_collection(prefix="user_avatar_"):
+                match = pattern.fullmatch(obj.key)
+                if match is not None:
+                    user_keys = keys.setdefault(int(match.group(1)), {})
+                    user_keys.setdefault(int(match.group(2) or 0), []).append(obj.key)
+            if not keys:
+                return 0
+
+            with use_session() as db_session:
+                current_versions = dict(db_session.execute(
+                    select(User.id, User.avatar_version).where(User.id.in_(keys))
+                ).all())
+
+            cutoff = time.time_ns() // 1_000_000 - settings.AVATAR_DELETE_DELAY * 1000
+            deleted = 0
+            for user_id, keys_by_version in keys.items():
+                current_version = current_versions.get(user_id) or 0
+                versions = sorted(keys_by_version)
+                for version, replaced_at in zip(versions, versions[1:] + [versions[-1]]):
+                    if version == current_version or replaced_at > cutoff:
+                        continue
+                    for key in keys_by_version[version]:
+                        try:
+                            s3_manager.delete_file(key)
+                        except ValueError:
+                            continue
+                        except Exception as ex:
+                            logger.warning("Не удалось удалить %s: %s", key, ex)
+                            continue
+                        deleted += 1
+        return deleted
 
     @staticmethod
     def add_favorite_track(user_id: int, music_id: int):
@@ -148,7 +366,7 @@ class UserManager:
         :type music_id: int
         :raises ValueError: Если трек уже в избранных
         """
-        with create_session() as db_session:
+        with use_session() as db_session:
             favorite_instance: Favorite | None = db_session.get(Favorite, (user_id, music_id))
             if favorite_instance is not None:
                 raise ValueError("Favorite instance already exists")
@@ -158,19 +376,66 @@ class UserManager:
             db_session.commit()
 
     @staticmethod
-    def get_favorite_tracks(user_id: int) -> list[Music]:
-        """Возвращает список избранных треков пользователя
+    def get_favorite_tracks(user_id: int) -> list[TrackRow]:
+        """Возвращает список избранных треков пользователя, начиная с последних добавленных
 
         :param user_id: id пользователя
         :type user_id: int
-        :return: Список объектов модели Music
-        :rtype: list[Music]
+        :return: Список объектов TrackRow
+        :rtype: list[TrackRow]
         """
-        with create_session() as db_session:
-            user_instance: User | None = db_session.get(User, user_id)
-            if user_instance is None:
-                raise ValueError(f"User does not exist with id: {user_id}")
-            return list(map(lambda favorite: favorite.music, user_instance.favorites))
+        with use_session() as db_session:
+            rows = db_session.execute(
+                _favorite_tracks_query(user_id).order_by(Favorite.created_at.desc(), Favorite.music_id.desc())
+            )
+            return [TrackRow.from_music(music, favorited_at) for music, favorited_at in rows]
+
+    @staticmethod
+    def get_favorite_tracks_page(user_id: int, cursor: str | None = None,
+                                 page_size: int | None = None) -> Page[TrackRow]:
+        """Возвращает страницу избранных треков пользователя, начиная с последних добавленных
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param cursor: Курсор, полученный с соседней страницы (None - первая страница)
+        :type cursor: str | None
+        :param page_size: Размер страницы (по умолчанию settings.PAGE_SIZE_DEFAULT)
+        :type page_size: int | None
+        :raises InvalidCursorError: Если курсор поврежден
+        :return: Страница объектов TrackRow
+        :rtype: Page[TrackRow]
+        """
+        with use_session() as db_session:
+            def fetch(after: tuple | None, before: tuple | None, limit: int) -> list[TrackRow]:
+                query = _favorite_tracks_query(user_id)
+                if before is not None:
+                    created_at, music_id = before
+                    query = query.where(or_(
+                        Favorite.created_at > created_at,
+                        and_(Favorite.created_at == created_at, Favorite.music_id > music_id)
+                    )).order_by(Favorite.created_at, Favorite.music_id)
+                else:
+                    if after is not None:
+                        created_at, music_id = after
+                        query = query.where(or_(
+                            Favorite.created_at < created_at,
+                            and_(Favorite.created_at == created_at, Favorite.music_id < music_id)
+                        ))
+                    query = query.order_by(Favorite.created_at.desc(), Favorite.music_id.desc())
+
+                rows = [
+                    TrackRow.from_music(music, favorited_at)
+                    for music, favorited_at in db_session.execute(query.limit(limit))
+                ]
+                return rows[::-1] if before is not None else rows
+
+            return paginate(
+                fetch,
+                key=lambda row: (row.favorited_at.isoformat(), row.id),
+                key_types=(datetime.datetime.fromisoformat, int),
+                cursor=cursor,
+                page_size=page_size
+            )
 
     @staticmethod
     def remove_favorite_track(user_id: int, music_id: int):
@@ -182,7 +447,7 @@ class UserManager:
         :type music_id: int
         :raises ValueError: Если трека нет в избранных
         """
-        with create_session() as db_session:
+        with use_session() as db_session:
             favorite_instance: Favorite | None = db_session.get(Favorite, (user_id, music_id))
             if favorite_instance is None:
                 raise ValueError("Favorite instance does not exist")
@@ -201,20 +466,172 @@ class UserManager:
         :return: Булево значение - True, если трек в избранных, False - в противном случае
         :rtype: bool
         """
-        with create_session() as db_session:
+        with use_session() as db_session:
             favorite_instance: Favorite | None = db_session.get(Favorite, (user_id, music_id))
             return favorite_instance is not None
 
+    @staticmethod
+    def get_favorite_ids(user_id: int, music_ids: Iterable[int]) -> set[int]:
+        """Возвращает множество id треков из music_ids, которые находятся в избранных у пользователя.\n
+        Выполняет один запрос вместо вызова is_favorite для каждого трека
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param music_ids: id треков
+        :type music_ids: Iterable[int]
+        :return: Множество id избранных треков
+        :rtype: set[int]
+        """
+        music_ids = set(music_ids)
+        if not music_ids:
+            return set()
+
+        with use_session() as db_session:
+            rows = db_session.execute(
+                select(Favorite.music_id).where(
+                    Favorite.user_id == user_id,
+                    Favorite.music_id.in_(music_ids)
+                )
+            )
+            return set(rows.scalars())
+
+    @staticmethod
+    def add_favorite_tracks(user_id: int, music_ids: Iterable[int]) -> int:
+        """Добавляет треки в избранное одним запросом INSERT ... SELECT.\n
+        Треки, которые уже в избранных или отсутствуют в базе данных, пропускаются, поэтому повторный вызов
+        ничего не меняет
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param music_ids: id треков
+        :type music_ids: Iterable[int]
+        :return: Количество добавленных треков
+        :rtype: int
+        """
+        music_ids = set(music_ids)
+        if not music_ids:
+            return 0
+
+        with use_session() as db_session:
+            # INSERT IGNORE: в отличие от ON DUPLICATE KEY UPDATE, rowcount равен количеству добавленных строк
+            statement = _insert_ignore_favorite().from_select(
+                ["user_id", "music_id", "created_at"],
+                select(literal(user_id), Music.id, literal(utcnow())).where(Music.id.in_(music_ids))
+            )
+            added = db_session.execute(statement).rowcount
+            db_session.commit()
+            return added
+
+    @staticmethod
+    def remove_favorite_tracks(user_id: int, music_ids: Iterable[int]) -> int:
+        """Удаляет треки из избранных одним запросом. Треки, которых нет в избранных, пропускаются
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param music_ids: id треков
+        :type music_ids: Iterable[int]
+        :return: Количество удаленных треков
+        :rtype: int
+        """
+        music_ids = set(music_ids)
+        if not music_ids:
+            return 0
+
+        with use_session() as db_session:
+            removed = db_session.execute(
+                delete(Favorite).where(Favorite.user_id == user_id, Favorite.music_id.in_(music_ids))
+            ).rowcount
+            db_session.commit()
+            return removed
+
+    @staticmethod
+    def set_favorite(user_id: int, music_id: int, favorite: bool) -> bool:
+        """Добавляет трек в избранное или удаляет его оттуда одним запросом. Повторный вызов ничего не меняет.\n
+        Существование трека проверяет внешний ключ при добавлении; удаление несуществующего трека ничего не делает
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param music_id: id трека
+        :type music_id: int
+        :param favorite: True - добавить в избранное, False - удалить из избранного
+        :type favorite: bool
+        :raises ValueError: Если при добавлении трека с данным music_id не существует
+        :return: Находится ли трек в избранных после вызова
+        :rtype: bool
+        """
+        with use_session() as db_session:
+            if favorite:
+                _add_favorite(db_session, user_id, music_id)
+            else:
+                db_session.execute(delete(Favorite).where(Favorite.user_id == user_id, Favorite.music_id == music_id))
+            db_session.commit()
+            return favorite
+
+    @staticmethod
+    def toggle_favorite(user_id: int, music_id: int) -> bool:
+        """Переключает нахождение трека в избранных: DELETE, а если удалять нечего - INSERT.\n
+        Переключение не атомарно: одновременные вызовы для одного трека оба могут не найти строку для удаления,
+        и тогда оба добавят трек и вернут True. Атомарное переключение потребовало бы блокировки строки
+        (SELECT ... FOR UPDATE) и еще одного запроса, поэтому клиенты, повторяющие запросы, передают
+        требуемое состояние (set_favorite)
+
+        :param user_id: id пользователя
+        :type user_id: int
+        :param music_id: id трека
+        :type music_id: int
+        :raises ValueError: Если трека с данным music_id не существует
+        :return: Находится ли трек в избранных после вызова
+        :rtype: bool
+        """
+        with use_session() as db_session:
+            removed = db_session.execute(
+                delete(Favorite).where(Favorite.user_id == user_id, Favorite.music_id == music_id)
+            ).rowcount
+            if not removed:
+                _add_favorite(db_session, user_id, music_id)
+            db_session.commit()
+            return not removed
+
+
+def _insert_ignore_favorite() -> Insert:
+    return insert(Favorite).prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+
+
+def _add_favorite(db_session: Session, user_id: int, music_id: int) -> None:
+    values = {"user_id": user_id, "music_id": music_id, "created_at": utcnow()}
+    dialect = db_session.get_bind().dialect.name
+    if dialect == "mysql":
+        # В отличие от INSERT IGNORE, ON DUPLICATE KEY UPDATE пропускает только уже добавленный трек,
+        # а нарушение внешнего ключа (несуществующий трек) остается ошибкой
+        statement = mysql.insert(Favorite).values(values)
+        statement = statement.on_duplicate_key_update(user_id=statement.inserted.user_id)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(Favorite).values(values).on_conflict_do_nothing(
+            index_elements=["user_id", "music_id"]
+        )
+    else:
+        statement = insert(Favorite).values(values)
 
-def _convert_image_bytes_to_jpeg(image_bytes: bytes) -> BytesIO:
     try:
-        img = Image.open(BytesIO(image_bytes))
-        img = img.convert("RGB")
-        img_bytes = BytesIO()
-        img.save(img_bytes, format="JPEG")
-        img_bytes.seek(0)
+        db_session.execute(statement)
+    except IntegrityError as ex:
+        # Отменяется только этот запрос, транзакция сессии остается активной
+        raise ValueError(f"Music not found with id: {music_id}") from ex
+
+
+def _favorite_tracks_query(user_id: int) -> Select:
+    return (
+        select(Music, Favorite.created_at)
+        .join(Favorite, Favorite.music_id == Music.id)
+        .where(Favorite.user_id == user_id)
+        .options(*TRACK_ROW_OPTIONS)
+    )
+
+
+def _avatar_key(user_id: int, version: int) -> str:
+    return f"user_avatar_{user_id}_v{version}.jpg"
 
-        return img_bytes
 
-    except Exception as ex:
-        raise ValueError("Invalid image data") from ex
+def _avatar_keys(user_id: int, version: int) -> list[str]:
+    filename = _avatar_key(user_id, version)
+    return [filename, *(images.variant_key(filename, size) for size in images.AVATAR_SIZES)]
@@ -1,7 +1,10 @@
 from .album import Album
 from .artist import Artist
-from .base import Base
+from .base import Base, utcnow
 from .favorite import Favorite
+from .ingest_manifest import IngestManifest
 from .music import Music
 from .music_artist_association import MusicArtistAssociation
+from .playlist import Playlist
+from .playlist_track import PlaylistTrack
 from .user import User
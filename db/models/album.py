@@ -6,6 +6,9 @@ from .base import Base
 class Album(Base):
     """Таблица альбомов"""
     __tablename__ = "albums"
+    __table_args__ = (
+        sqlalchemy.Index("ix_albums_name_fulltext", "name", mysql_prefix="FULLTEXT"),
+    )
 
     id = sqlalchemy.Column(
         sqlalchemy.Integer,
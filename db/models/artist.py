@@ -8,6 +8,9 @@ from .base import Base
 class Artist(Base):
     """Таблица артистов (исполнителей)"""
     __tablename__ = "artists"
+    __table_args__ = (
+        sqlalchemy.Index("ix_artists_name_fulltext", "name", mysql_prefix="FULLTEXT"),
+    )
 
     def __init__(self,
                  *,
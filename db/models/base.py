@@ -1,3 +1,15 @@
+import datetime
+
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
+
+
+def utcnow() -> datetime.datetime:
+    """Текущее время в UTC. Отметки времени пользовательских действий (избранное, плейлисты) записываются
+    приложением по этим часам, а не функцией now() сервера базы данных, часовой пояс которой может отличаться
+
+    :return: Время с часовым поясом UTC
+    :rtype: datetime.datetime
+    """
+    return datetime.datetime.now(datetime.timezone.utc)
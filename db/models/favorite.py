@@ -1,10 +1,13 @@
 import sqlalchemy
 
-from .base import Base
+from .base import Base, utcnow
 
 
 class Favorite(Base):
     __tablename__ = "favorite"
+    __table_args__ = (
+        sqlalchemy.Index("ix_favorite_user_created", "user_id", "created_at", "music_id"),
+    )
 
     user_id = sqlalchemy.Column(
         sqlalchemy.Integer,
@@ -16,6 +19,11 @@ class Favorite(Base):
         sqlalchemy.ForeignKey("musics.id"),
         primary_key=True
     )
+    created_at = sqlalchemy.Column(
+        sqlalchemy.DateTime,
+        nullable=False,
+        default=utcnow
+    )
     user = sqlalchemy.orm.relationship("User", back_populates="favorites")
     music = sqlalchemy.orm.relationship("Music", back_populates="favorited_by")
 
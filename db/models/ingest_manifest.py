@@ -0,0 +1,55 @@
+import datetime
+
+import sqlalchemy
+
+from .base import Base
+
+
+class IngestManifest(Base):
+    """Журнал загрузки треков из стороннего API: по одной записи на трек источника"""
+    __tablename__ = "ingest_manifest"
+
+    # Трек записан, его файлы загружаются. Остается после прерванного запуска: следующий запуск загрузит файлы
+    STATUS_PENDING = "pending"
+    # Трек и его файлы сохранены
+    STATUS_DONE = "done"
+    # Трек music_id сохранен, но его аудио совпадает с уже сохраненным и повторно не хранится (Music.audio_music_id)
+    STATUS_DUPLICATE = "duplicate"
+    # Файлы трека загрузить не удалось, трек не сохранен. Повторный запуск загрузит его снова
+    STATUS_FAILED = "failed"
+
+    source_song_id = sqlalchemy.Column(
+        sqlalchemy.String(64),
+        primary_key=True,
+    )
+    status = sqlalchemy.Column(
+        sqlalchemy.String(16),
+        nullable=False,
+    )
+    music_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("musics.id"),
+        nullable=True,
+    )
+    audio_hash = sqlalchemy.Column(
+        sqlalchemy.String(64),  # SHA-256 в hex
+        nullable=True,
+        index=True,
+    )
+    audio_key = sqlalchemy.Column(
+        sqlalchemy.String(255),
+        nullable=True,
+    )
+    image_key = sqlalchemy.Column(
+        sqlalchemy.String(255),
+        nullable=True,
+    )
+    updated_at = sqlalchemy.Column(
+        sqlalchemy.DateTime,
+        nullable=False,
+        default=datetime.datetime.utcnow,
+        onupdate=datetime.datetime.utcnow,
+    )
+
+    def __repr__(self):
+        return f"{self.source_song_id} -> {self.music_id} ({self.status})"
@@ -6,6 +6,9 @@ from .base import Base
 class Music(Base):
     """Таблица музыки (треков)"""
     __tablename__ = "musics"
+    __table_args__ = (
+        sqlalchemy.Index("ix_musics_name_fulltext", "name", mysql_prefix="FULLTEXT"),
+    )
 
     id = sqlalchemy.Column(
         sqlalchemy.Integer,
@@ -38,6 +41,13 @@ class Music(Base):
         sqlalchemy.ForeignKey("albums.id"),
         nullable=True,
     )
+    # Трек, файл аудио которого использует данный трек (None - собственный файл music_audio_{id}.mp4).
+    # Задается при загрузке каталога, если аудио совпадает с уже сохраненным треком
+    audio_music_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("musics.id"),
+        nullable=True,
+    )
     artists = sqlalchemy.orm.relationship(
         "MusicArtistAssociation",
         back_populates="music",
@@ -0,0 +1,39 @@
+import sqlalchemy
+
+from .base import Base, utcnow
+
+
+class Playlist(Base):
+    """Таблица плейлистов пользователей"""
+    __tablename__ = "playlists"
+    __table_args__ = (
+        sqlalchemy.Index("ix_playlists_user_id", "user_id", "id"),
+    )
+
+    id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+    user_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("users.id"),
+        nullable=False
+    )
+    name = sqlalchemy.Column(
+        sqlalchemy.String(255),
+        nullable=False
+    )
+    created_at = sqlalchemy.Column(
+        sqlalchemy.DateTime,
+        nullable=False,
+        default=utcnow
+    )
+    user = sqlalchemy.orm.relationship("User", back_populates="playlists")
+    tracks = sqlalchemy.orm.relationship(
+        "PlaylistTrack",
+        back_populates="playlist",
+    )
+
+    def __repr__(self):
+        return f"<Playlist {self.name}>"
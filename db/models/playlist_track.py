@@ -0,0 +1,39 @@
+import sqlalchemy
+
+from .base import Base, utcnow
+
+
+class PlaylistTrack(Base):
+    """Трек в плейлисте.\n
+    Порядок задается значением position с промежутками между соседними треками, поэтому вставка и перемещение
+    трека изменяют одну строку. При равных position треки упорядочиваются по music_id
+    """
+    __tablename__ = "playlist_tracks"
+    __table_args__ = (
+        sqlalchemy.Index("ix_playlist_tracks_position", "playlist_id", "position", "music_id"),
+    )
+
+    playlist_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("playlists.id"),
+        primary_key=True
+    )
+    music_id = sqlalchemy.Column(
+        sqlalchemy.Integer,
+        sqlalchemy.ForeignKey("musics.id"),
+        primary_key=True
+    )
+    position = sqlalchemy.Column(
+        sqlalchemy.BigInteger,
+        nullable=False
+    )
+    added_at = sqlalchemy.Column(
+        sqlalchemy.DateTime,
+        nullable=False,
+        default=utcnow
+    )
+    playlist = sqlalchemy.orm.relationship("Playlist", back_populates="tracks")
+    music = sqlalchemy.orm.relationship("Music")
+
+    def __repr__(self):
+        return f"{self.playlist_id} -> {self.music_id} ({self.position})"
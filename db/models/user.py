@@ -44,6 +44,12 @@ class User(Base, UserMixin):
         sqlalchemy.Boolean,
         default=True
     )
+    # Версия аватарки (время загрузки в мс), входит в название файла в s3 хранилище.
+    # None - аватарка не загружалась или загружена до появления версий
+    avatar_version = sqlalchemy.Column(
+        sqlalchemy.BigInteger,
+        nullable=True
+    )
 
     def set_password(self, password: str):
         self.password = generate_password_hash(password)
@@ -58,3 +64,7 @@ class User(Base, UserMixin):
         "Favorite",
         back_populates="user",
     )
+    playlists = sqlalchemy.orm.relationship(
+        "Playlist",
+        back_populates="user",
+    )
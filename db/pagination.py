@@ -0,0 +1,138 @@
+import base64
+import json
+from typing import Any, Callable, Generic, Sequence, TypeVar
+
+from .db_config import settings
+
+T = TypeVar("T")
+
+# Функция выборки страницы: (after, before, limit) -> элементы в порядке отображения.
+# При заданном before возвращаются limit элементов, непосредственно предшествующих курсору
+PageFetcher = Callable[[tuple | None, tuple | None, int], Sequence[T]]
+
+
+class InvalidCursorError(ValueError):
+    """Данная ошибка возникает при передаче поврежденного или чужого курсора"""
+
+
+class Page(Generic[T]):
+    """Страница результатов с курсорами на следующую и предыдущую страницы"""
+
+    def __init__(self, items: list[T], next_cursor: str | None = None, prev_cursor: str | None = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return f"<Page {len(self.items)} items next={self.next_cursor!r} prev={self.prev_cursor!r}>"
+
+
+def clamp_page_size(page_size: int | None) -> int:
+    """Приводит размер страницы к допустимому диапазону
+
+    :param page_size: Запрошенный размер страницы (None - размер по умолчанию)
+    :type page_size: int | None
+    :return: Размер страницы от 1 до settings.PAGE_SIZE_MAX
+    :rtype: int
+    """
+    if page_size is None:
+        page_size = settings.PAGE_SIZE_DEFAULT
+    return max(1, min(page_size, settings.PAGE_SIZE_MAX))
+
+
+def encode_cursor(key: tuple, direction: str) -> str:
+    """Кодирует ключ элемента в курсор
+
+    :param key: Ключ сортировки элемента
+    :type key: tuple
+    :param direction: "next" или "prev"
+    :type direction: str
+    :return: Курсор в виде url-safe строки
+    :rtype: str
+    """
+    raw = json.dumps([direction, list(key)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[tuple, str]:
+    """Декодирует курсор
+
+    :param cursor: Курсор
+    :type cursor: str
+    :raises InvalidCursorError: Если курсор поврежден
+    :return: Кортеж (ключ, направление)
+    :rtype: tuple[tuple, str]
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, key = json.loads(raw)
+    except Exception as ex:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from ex
+
+    if direction not in ("next", "prev") or not isinstance(key, list):
+        raise InvalidCursorError(f"Invalid cursor: {cursor}")
+    return tuple(key), direction
+
+
+def paginate(fetch: PageFetcher[T], key: Callable[[T], tuple], key_types: tuple[Callable[[Any], Any], ...],
+             cursor: str | None, page_size: int | None = None) -> Page[T]:
+    """Выбирает страницу по курсору (keyset пагинация)
+
+    :param fetch: Функция выборки (after, before, limit) -> элементы в порядке отображения
+    :type fetch: PageFetcher
+    :param key: Функция, возвращающая ключ сортировки элемента
+    :type key: Callable[[T], tuple]
+    :param key_types: Типы (или функции приведения) значений ключа сортировки, используются для проверки курсора
+    :type key_types: tuple[Callable[[Any], Any], ...]
+    :param cursor: Курсор, полученный с предыдущей страницы (None - первая страница)
+    :type cursor: str | None
+    :param page_size: Размер страницы
+    :type page_size: int | None
+    :raises InvalidCursorError: Если курсор поврежден
+    :return: Страница результатов
+    :rtype: Page
+    """
+    page_size = clamp_page_size(page_size)
+
+    if cursor is None:
+        items = list(fetch(None, None, page_size + 1))
+        has_next = len(items) > page_size
+        has_prev = False
+        items = items[:page_size]
+    else:
+        cursor_key, direction = decode_cursor(cursor)
+        cursor_key = _coerce_key(cursor_key, key_types)
+        if direction == "next":
+            items = list(fetch(cursor_key, None, page_size + 1))
+            has_next = len(items) > page_size
+            has_prev = True
+            items = items[:page_size]
+        else:
+            items = list(fetch(None, cursor_key, page_size + 1))
+            has_prev = len(items) > page_size
+            has_next = True
+            items = items[-page_size:]
+
+    if not items:
+        return Page([])
+
+    return Page(
+        items,
+        next_cursor=encode_cursor(key(items[-1]), "next") if has_next else None,
+        prev_cursor=encode_cursor(key(items[0]), "prev") if has_prev else None
+    )
+
+
+def _coerce_key(key: tuple, types: tuple[Callable[[Any], Any], ...]) -> tuple[Any, ...]:
+    if len(key) != len(types):
+        raise InvalidCursorError(f"Invalid cursor key: {key}")
+    try:
+        return tuple(value_type(value) for value_type, value in zip(types, key))
+    except (TypeError, ValueError) as ex:
+        raise InvalidCursorError(f"Invalid cursor key: {key}") from ex
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+
+import sqlalchemy
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMetrics:
+    """
+    Сбор метрик пула соединений SQLAlchemy.\n
+    Учитывает время ожидания соединения из пула, время удержания соединения, время установки новых соединений
+    и количество выдач, возвратов и инвалидаций. Для времени хранятся последние ``window`` измерений
+    """
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._counters = {"checkouts": 0, "checkins": 0, "connects": 0, "invalidations": 0}
+        self._checkout_wait: deque[float] = deque(maxlen=window)
+        self._hold: deque[float] = deque(maxlen=window)
+        self._connect: deque[float] = deque(maxlen=window)
+
+    def attach(self, engine: Engine) -> None:
+        """Подписывается на события пула engine
+
+        :param engine: Engine объект
+        :type engine: Engine
+        """
+        sqlalchemy.event.listen(engine, "checkout", self._on_checkout)
+        sqlalchemy.event.listen(engine, "checkin", self._on_checkin)
+        sqlalchemy.event.listen(engine, "connect", self._on_connect)
+        sqlalchemy.event.listen(engine, "invalidate", self._on_invalidate)
+        sqlalchemy.event.listen(engine, "do_connect", self._on_do_connect)
+
+    def record_checkout_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._checkout_wait.append(seconds)
+
+    def snapshot(self, engine: Engine) -> dict:
+        """Возвращает текущие метрики пула
+
+        :param engine: Engine объект, пул которого описывается
+        :type engine: Engine
+        :return: Словарь с размерами пула, счетчиками и задержками в миллисекундах
+        :rtype: dict
+        """
+        pool = engine.pool
+        with self._lock:
+            stats = {
+                "pool": {
+                    "class": type(pool).__name__,
+                    "size": _call_or_none(pool, "size"),
+                    "checked_out": _call_or_none(pool, "checkedout"),
+                    "checked_in": _call_or_none(pool, "checkedin"),
+                    "overflow": _call_or_none(pool, "overflow"),
+                    "status": pool.status()
+                },
+                "counters": dict(self._counters),
+                "checkout_wait_ms": _summary(self._checkout_wait),
+                "hold_ms": _summary(self._hold),
+                "connect_ms": _summary(self._connect)
+            }
+
+        size = stats["pool"]["size"]
+        max_overflow = getattr(pool, "_max_overflow", None)
+        checked_out = stats["pool"]["checked_out"]
+        if size and checked_out is not None and max_overflow is not None and max_overflow >= 0:
+            stats["pool"]["utilisation"] = round(checked_out / (size + max_overflow), 3)
+        return stats
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        connection_record.info["checkout_started"] = time.perf_counter()
+        with self._lock:
+            self._counters["checkouts"] += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        started = connection_record.info.pop("checkout_started", None)
+        with self._lock:
+            self._counters["checkins"] += 1
+            if started is not None:
+                self._hold.append(time.perf_counter() - started)
+
+    def _on_do_connect(self, dialect, conn_rec, cargs, cparams) -> None:
+        conn_rec.info["connect_started"] = time.perf_counter()
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        started = connection_record.info.pop("connect_started", None)
+        with self._lock:
+            self._counters["connects"] += 1
+            if started is not None:
+                self._connect.append(time.perf_counter() - started)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        with self._lock:
+            self._counters["invalidations"] += 1
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, измеряющий время ожидания свободного соединения"""
+
+    metrics: PoolMetrics | None = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_checkout_wait(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _call_or_none(pool, name: str) -> int | None:
+    method = getattr(pool, name, None)
+    return method() if callable(method) else None
+
+
+def _summary(values: deque[float]) -> dict[str, float | int]:
+    if not values:
+        return {"count": 0}
+
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "avg": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max": round(ordered[-1] * 1000, 3)
+    }
@@ -1,13 +1,586 @@
+import datetime
+import hashlib
+import heapq
+import hmac
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import Any, Sequence
+from typing import Any, BinaryIO, Callable, Iterable, Sequence
+from urllib.parse import quote, urlsplit
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.credentials import Credentials
+from botocore.exceptions import ClientError
 from botocore.response import StreamingBody
 from types_boto3_s3 import S3Client
-from types_boto3_s3.service_resource import BucketObjectsCollection
+from types_boto3_s3.service_resource import BucketObjectsCollection, S3ServiceResource
+
+from .db_config import settings
 
 BUCKET_NAME = "melodia"
+ENDPOINT_URL = "https://storage.yandexcloud.net"
+
+logger = logging.getLogger(__name__)
+
+
+class PresignedUrlCache:
+    """
+    Потокобезопасный кэш пре-подписанных url.\n
+    Ключ - (название файла, content type, content disposition, запрошенное время действия). Url выдается из кэша,
+    пока до истечения его срока действия остается больше ``margin`` секунд.
+    При переполнении вытесняются давно не использованные записи
+    """
+
+    def __init__(self, max_size: int = 8192, margin: int = 300):
+        self.max_size = max_size
+        self.margin = margin
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, str, str, int], tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename: str, content_type: str, content_disposition: str, expiration: int) -> str | None:
+        """Возвращает url из кэша или None, если url отсутствует или скоро истечет
+
+        :param filename: Название файла
+        :type filename: str
+        :param content_type: Тип возвращаемого контента
+        :type content_type: str
+        :param content_disposition: Значение Content-Disposition
+        :type content_disposition: str
+        :param expiration: Запрошенное время действия url в секундах
+        :type expiration: int
+        :return: Пре-подписанный url или None
+        :rtype: str | None
+        """
+        key = (filename, content_type, content_disposition, expiration)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            url, expires_at = entry
+            if expires_at - now <= min(self.margin, expiration):
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return url
+
+    def put(self, filename: str, content_type: str, content_disposition: str, url: str, expiration: int) -> None:
+        """Сохраняет url в кэш
+
+        :param filename: Название файла
+        :type filename: str
+        :param content_type: Тип возвращаемого контента
+        :type content_type: str
+        :param content_disposition: Значение Content-Disposition
+        :type content_disposition: str
+        :param url: Пре-подписанный url
+        :type url: str
+        :param expiration: Время действия url в секундах
+        :type expiration: int
+        """
+        if self.max_size <= 0:
+            return
+
+        key = (filename, content_type, content_disposition, expiration)
+        expires_at = time.monotonic() + expiration
+        with self._lock:
+            self._entries[key] = (url, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, filename: str) -> None:
+        """Удаляет из кэша все url для файла
+
+        :param filename: Название файла
+        :type filename: str
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == filename]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """Очищает кэш и счетчики"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """Возвращает статистику кэша
+
+        :return: Словарь с ключами size, hits, misses
+        :rtype: dict[str, int]
+        """
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class S3KeyIndex:
+    """
+    Потокобезопасный индекс существующих в s3 хранилище файлов.\n
+    Заполняется списком объектов бакета в фоновом потоке (start_refresh) и поддерживается в актуальном состоянии
+    методами загрузки и удаления S3Manager. Список перезагружается каждые ``interval`` секунд: файлы, удаленные
+    другими процессами, пропадают из индекса не позже следующей перезагрузки. Отсутствующие файлы запоминаются
+    на ``negative_ttl`` секунд, так как их могли загрузить другие процессы.
+    Пока список не загружен, наличие файлов проверяется в хранилище
+    """
+
+    def __init__(self, negative_ttl: int = 60):
+        self.negative_ttl = negative_ttl
+        self.loaded = False
+        self._keys: set[str] = set()
+        self._missing: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._refresher: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def refresh(self, loader: Callable[[], Iterable[str]]) -> None:
+        """Заменяет содержимое индекса списком файлов из хранилища. При ошибке индекс не меняется
+
+        :param loader: Функция, возвращающая названия всех файлов в хранилище
+        :type loader: Callable[[], Iterable[str]]
+        """
+        try:
+            keys = set(loader())
+        except Exception as ex:
+            logger.warning("Не удалось загрузить список файлов s3 хранилища: %s", ex)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            # Файлы, удаленные во время получения списка, в нем еще могли быть
+            self._keys = keys.difference(key for key, missing_until in self._missing.items() if missing_until > now)
+            self.loaded = True
+
+    def start_refresh(self, loader: Callable[[], Iterable[str]], interval: int) -> None:
+        """Запускает фоновый поток, загружающий список файлов сразу и затем каждые ``interval`` секунд
+
+        :param loader: Функция, возвращающая названия всех файлов в хранилище
+        :type loader: Callable[[], Iterable[str]]
+        :param interval: Период перезагрузки списка в секундах
+        :type interval: int
+        """
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresh_forever, args=(loader, interval),
+                                               name="s3-key-index", daemon=True)
+            self._refresher.start()
+
+    def stop_refresh(self) -> None:
+        """Останавливает фоновый поток"""
+        with self._lock:
+            refresher, self._refresher = self._refresher, None
+        if refresher is not None:
+            self._stop.set()
+            refresher.join()
+
+    def _refresh_forever(self, loader: Callable[[], Iterable[str]], interval: int) -> None:
+        while True:
+            self.refresh(loader)
+            if self._stop.wait(interval):
+                return
+
+    def contains(self, filename: str) -> bool | None:
+        """Проверяет наличие файла по индексу
+
+        :param filename: Название файла
+        :type filename: str
+        :return: True или False, если ответ известен, None - если требуется проверка в хранилище
+        :rtype: bool | None
+        """
+        with self._lock:
+            if filename in self._keys:
+                return True
+
+            missing_until = self._missing.get(filename)
+            if missing_until is None:
+                return None
+            if missing_until > time.monotonic():
+                return False
+
+            del self._missing[filename]
+            return None
+
+    def add(self, filename: str) -> None:
+        """Отмечает файл как существующий
+
+        :param filename: Название файла
+        :type filename: str
+        """
+        with self._lock:
+            self._keys.add(filename)
+            self._missing.pop(filename, None)
+
+    def discard(self, filename: str) -> None:
+        """Отмечает файл как отсутствующий
+
+        :param filename: Название файла
+        :type filename: str
+        """
+        with self._lock:
+            self._keys.discard(filename)
+            self._missing[filename] = time.monotonic() + self.negative_ttl
+
+    def clear(self) -> None:
+        """Сбрасывает индекс до следующей загрузки списка объектов"""
+        with self._lock:
+            self._keys.clear()
+            self._missing.clear()
+            self.loaded = False
+
+
+class LocalPresigner:
+    """
+    Генератор пре-подписанных GET url по алгоритму AWS SigV4 без построения запроса botocore.\n
+    Формирует url, совпадающий побайтово с ``generate_presigned_url("get_object", ...)`` для path-style адресации.
+    Ключ подписи вычисляется один раз на сутки, регион и секретный ключ
+    """
+
+    def __init__(self, credentials: Credentials, region: str, endpoint_url: str = ENDPOINT_URL,
+                 bucket: str = BUCKET_NAME):
+        self._credentials = credentials
+        self.region = region
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self._host = urlsplit(self.endpoint_url).netloc
+        self._signing_keys: dict[tuple[str, str, str], bytes] = {}
+        self._lock = threading.Lock()
+
+    def presign_get(self, filename: str, content_type: str, content_disposition: str, expiration: int) -> str:
+        """Генерирует пре-подписанный url на получение файла
+
+        :param filename: Название файла
+        :type filename: str
+        :param content_type: Тип возвращаемого контента
+        :type content_type: str
+        :param content_disposition: Значение Content-Disposition
+        :type content_disposition: str
+        :param expiration: Время действия url в секундах
+        :type expiration: int
+        :return: Пре-подписанный url
+        :rtype: str
+        """
+        credentials = self._credentials.get_frozen_credentials()
+        timestamp = _utcnow().strftime("%Y%m%dT%H%M%SZ")
+        datestamp = timestamp[:8]
+        scope = f"{datestamp}/{self.region}/s3/aws4_request"
+
+        path = f"/{self.bucket}/{quote(filename, safe='/~')}"
+        operation_params = [
+            ("response-content-type", content_type),
+            ("response-content-disposition", content_disposition)
+        ]
+        auth_params = [
+            ("X-Amz-Algorithm", "AWS4-HMAC-SHA256"),
+            ("X-Amz-Credential", f"{credentials.access_key}/{scope}"),
+            ("X-Amz-Date", timestamp),
+            ("X-Amz-Expires", str(expiration)),
+            ("X-Amz-SignedHeaders", "host")
+        ]
+        if credentials.token is not None:
+            auth_params.append(("X-Amz-Security-Token", credentials.token))
+
+        encoded_params = [
+            (_percent_encode(key), _percent_encode(value))
+            for key, value in operation_params + auth_params
+        ]
+        query_string = "&".join(f"{key}={value}" for key, value in encoded_params)
+        canonical_query_string = "&".join(f"{key}={value}" for key, value in sorted(encoded_params))
+
+        canonical_request = "\n".join((
+            "GET",
+            path,
+            canonical_query_string,
+            f"host:{self._host}\n",
+            "host",
+            "UNSIGNED-PAYLOAD"
+        ))
+        string_to_sign = "\n".join((
+            "AWS4-HMAC-SHA256",
+            timestamp,
+            scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        ))
+        signing_key = self._get_signing_key(credentials.secret_key, datestamp)
+        signature = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        return f"{self.endpoint_url}{path}?{query_string}&X-Amz-Signature={signature}"
+
+    def _get_signing_key(self, secret_key: str, datestamp: str) -> bytes:
+        cache_key = (secret_key, datestamp, self.region)
+        signing_key = self._signing_keys.get(cache_key)
+        if signing_key is not None:
+            return signing_key
+
+        signing_key = f"AWS4{secret_key}".encode("utf-8")
+        for part in (datestamp, self.region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, part.encode("utf-8"), hashlib.sha256).digest()
+
+        with self._lock:
+            # Ключи за прошедшие сутки больше не понадобятся
+            self._signing_keys = {cache_key: signing_key}
+        return signing_key
+
+
+def _percent_encode(value: str) -> str:
+    return quote(value, safe="-_.~")
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class S3ClientRegistry:
+    """
+    Общий для процесса s3 клиент с пулом соединений.\n
+    Клиенты boto3 потокобезопасны, поэтому один клиент переиспользуется всеми экземплярами S3Manager,
+    а сессия, конфигурация эндпоинта и соединения создаются один раз
+    """
+
+    def __init__(self, max_pool_connections: int = 50, tcp_keepalive: bool = True):
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self._session: boto3.session.Session | None = None
+        self._client: S3Client | None = None
+        self._presigner: LocalPresigner | None = None
+        # Отсутствие учетных данных или региона запоминается так же, как созданный генератор: до close()
+        self._presigner_resolved = False
+        self._lock = threading.Lock()
+
+    def client(self) -> S3Client:
+        """Возвращает общий s3 клиент, создавая его при первом обращении
+
+        :return: S3Client объект
+        :rtype: S3Client
+        """
+        if self._client is not None:
+            return self._client
+
+        with self._lock:
+            if self._client is None:
+                self._client = self._get_session().client(
+                    service_name="s3",
+                    endpoint_url=ENDPOINT_URL,
+                    region_name=settings.S3_REGION,
+                    config=Config(
+                        # Те же параметры подписи и адресации, что и у LocalPresigner
+                        signature_version="s3v4",
+                        s3={"addressing_style": "path"},
+                        max_pool_connections=self.max_pool_connections,
+                        tcp_keepalive=self.tcp_keepalive
+                    )
+                )
+            return self._client
+
+    def presigner(self) -> LocalPresigner | None:
+        """Возвращает локальный генератор url для общего клиента
+
+        :return: LocalPresigner объект или None, если учетные данные или регион не найдены
+        :rtype: LocalPresigner | None
+        """
+        if self._presigner_resolved:
+            return self._presigner
+
+        client = self.client()
+        with self._lock:
+            if not self._presigner_resolved:
+                credentials = self._get_session().get_credentials()
+                # Без региона область подписи не совпадет с той, что ожидает хранилище
+                if credentials is not None and client.meta.region_name:
+                    self._presigner = LocalPresigner(
+                        credentials,
+                        region=client.meta.region_name,
+                        endpoint_url=client.meta.endpoint_url
+                    )
+                self._presigner_resolved = True
+            return self._presigner
+
+    def resource(self) -> S3ServiceResource:
+        """Создает s3 ресурс на общей сессии. Ресурсы boto3 не потокобезопасны, поэтому не переиспользуются
+
+        :return: S3ServiceResource объект
+        :rtype: S3ServiceResource
+        """
+        with self._lock:
+            return self._get_session().resource("s3", endpoint_url=ENDPOINT_URL, region_name=settings.S3_REGION)
+
+    def close(self) -> None:
+        """Закрывает соединения общего клиента. Следующее обращение создаст новый клиент"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._presigner = None
+            self._presigner_resolved = False
+            self._session = None
+
+    def _get_session(self) -> boto3.session.Session:
+        if self._session is None:
+            self._session = boto3.session.Session()
+        return self._session
+
+
+class BatchSigner:
+    """
+    Исполнитель пакетной генерации url.\n
+    Небольшие пакеты подписываются в вызывающем потоке, так как подпись - быстрая CPU операция и переключение
+    потоков обходится дороже нее. Крупные пакеты делятся на части и выполняются в долгоживущем пуле потоков.
+    Результаты возвращаются в порядке входных данных
+    """
+
+    def __init__(self, inline_threshold: int = 64, max_workers: int = 4):
+        self.inline_threshold = inline_threshold
+        self.max_workers = max_workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "inline_batches": 0,
+            "pooled_batches": 0,
+            "items": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0
+        }
+
+    def map(self, func: Callable[[Any], Any], items: Sequence[Any]) -> list[Any]:
+        """Применяет func к каждому элементу items
+
+        :param func: Функция, вызываемая для каждого элемента
+        :type func: Callable[[Any], Any]
+        :param items: Элементы пакета
+        :type items: Sequence[Any]
+        :return: Список результатов в порядке items
+        :rtype: list[Any]
+        """
+        started = time.perf_counter()
+        inline = len(items) < self.inline_threshold or self.max_workers <= 1
+        if inline:
+            results = [func(item) for item in items]
+        else:
+            chunk_size = -(-len(items) // self.max_workers)
+            chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+            results = []
+            for chunk_results in self._get_executor().map(lambda chunk: [func(item) for item in chunk], chunks):
+                results.extend(chunk_results)
+
+        self._record(len(items), inline, time.perf_counter() - started)
+        return results
+
+    def stats(self) -> dict[str, int | float]:
+        """Возвращает статистику выполненных пакетов
+
+        :return: Словарь с количеством пакетов, элементов и временем выполнения в секундах
+        :rtype: dict[str, int | float]
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def shutdown(self) -> None:
+        """Останавливает пул потоков. Следующий крупный пакет создаст новый пул"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="s3-sign")
+            return self._executor
+
+    def _record(self, items: int, inline: bool, seconds: float) -> None:
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["inline_batches" if inline else "pooled_batches"] += 1
+            self._stats["items"] += items
+            self._stats["total_seconds"] += seconds
+            self._stats["max_seconds"] = max(self._stats["max_seconds"], seconds)
+
+
+class DelayedDeleter:
+    """
+    Удаляет файлы из s3 хранилища в фоновом потоке через заданное время после запроса удаления.\n
+    Очередь хранится в памяти процесса: удаления, не выполненные до его завершения, теряются
+    """
+
+    def __init__(self, delete: Callable[[str], None]):
+        self._delete = delete
+        self._queue: list[tuple[float, int, list[str]]] = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def schedule(self, keys: list[str], delay: float) -> None:
+        """Запрашивает удаление файлов
+
+        :param keys: Названия файлов
+        :type keys: list[str]
+        :param delay: Через сколько секунд удалить файлы
+        :type delay: float
+        """
+        with self._condition:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), list(keys)))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="s3-delayed-delete", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def pending(self) -> int:
+        """Возвращает количество запросов удаления, ожидающих своего времени
+
+        :return: Количество запросов
+        :rtype: int
+        """
+        with self._condition:
+            return len(self._queue)
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _, _, keys = heapq.heappop(self._queue)
+
+            for key in keys:
+                try:
+                    self._delete(key)
+                except ValueError:
+                    # Файл уже удален
+                    continue
+                except Exception as ex:
+                    logger.warning("Не удалось удалить %s: %s", key, ex)
+
+
+client_registry = S3ClientRegistry(
+    max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+    tcp_keepalive=settings.S3_TCP_KEEPALIVE
+)
+transfer_config = TransferConfig(
+    multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+    max_concurrency=settings.S3_UPLOAD_MAX_CONCURRENCY
+)
+url_cache = PresignedUrlCache(max_size=settings.S3_URL_CACHE_SIZE, margin=settings.S3_URL_CACHE_MARGIN)
+key_index = S3KeyIndex(negative_ttl=settings.S3_KEY_INDEX_NEGATIVE_TTL)
+batch_signer = BatchSigner(
+    inline_threshold=settings.S3_SIGN_INLINE_THRESHOLD,
+    max_workers=settings.S3_SIGN_MAX_WORKERS
+)
 
 
 class S3Manager:
@@ -16,11 +589,7 @@ class S3Manager:
     """
 
     def __init__(self):
-        self._session = boto3.session.Session()
-        self._s3_client: S3Client = self._session.client(
-            service_name="s3",
-            endpoint_url="https://storage.yandexcloud.net"
-        )
+        self._s3_client: S3Client = client_registry.client()
 
     def get_file(self, filename: str) -> StreamingBody:
         """Получение файла из s3 хранилища
@@ -41,15 +610,47 @@ class S3Manager:
 
         return file_object
 
-    def upload_file(self, filename: str, content: BytesIO | StreamingBody, force: bool = False) -> None:
-        """Загрузка файла в s3 хранилище
+    def get_file_object(self, filename: str, byte_range: str | None = None,
+                        if_none_match: str | None = None) -> dict[str, Any]:
+        """Получение файла из s3 хранилища вместе с метаданными (ETag, размер, Content-Range)
+
+        :param filename: Название файла
+        :type filename: str
+        :param byte_range: Значение заголовка Range (например, "bytes=0-1023")
+        :type byte_range: str | None
+        :param if_none_match: Значение заголовка If-None-Match
+        :type if_none_match: str | None
+        :raises ValueError: Если файл с таким именем не существует
+        :raises ClientError: Если файл не изменился (код 304) или диапазон некорректен (код 416)
+        :return: Ответ GetObject: Body, ETag, ContentLength, ContentRange (для запроса диапазона)
+        :rtype: dict[str, Any]
+        """
+        params = {"Bucket": BUCKET_NAME, "Key": filename}
+        if byte_range is not None:
+            params["Range"] = byte_range
+        if if_none_match is not None:
+            params["IfNoneMatch"] = if_none_match
+
+        try:
+            return self._s3_client.get_object(**params)
+        except ClientError as ex:
+            if ex.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise ValueError(f"File not found: {filename}") from ex
+            raise
+
+    def upload_file(self, filename: str, content: BytesIO | StreamingBody | BinaryIO, force: bool = False,
+                    cache_control: str | None = None) -> None:
+        """Загрузка файла в s3 хранилище.\n
+        Содержимое читается потоком: крупные файлы загружаются частями (multipart) без полной копии в памяти
 
         :param filename: Название, под которым требуется сохранить файл
         :type filename: str
-        :param content: BytesIO или StreamingBody объект с содержимым файла
-        :type content: BytesIO | StreamingBody
+        :param content: Файлоподобный объект с методом read() (BytesIO, StreamingBody, поток HTTP ответа)
+        :type content: BytesIO | StreamingBody | BinaryIO
         :param force: Игнорировать существование файла
         :type force: bool
+        :param cache_control: Заголовок Cache-Control, с которым хранилище будет отдавать файл
+        :type cache_control: str | None
         :raises ValueError: Если файл с таким именем уже существует
         """
         if not force and self._file_exists(filename):
@@ -58,8 +659,14 @@ class S3Manager:
         self._s3_client.upload_fileobj(
             Fileobj=content,
             Bucket=BUCKET_NAME,
-            Key=filename
+            Key=filename,
+            Config=transfer_config,
+            ExtraArgs={"CacheControl": cache_control} if cache_control is not None else None
         )
+        key_index.add(filename)
+        if force:
+            # Файл мог быть перезаписан: новый url с другой подписью не совпадет с url, закэшированным браузерами
+            url_cache.invalidate(filename)
 
     def delete_file(self, filename: str) -> None:
         """Удаление файла из s3 хранилища
@@ -75,6 +682,8 @@ class S3Manager:
             Bucket=BUCKET_NAME,
             Key=filename
         )
+        key_index.discard(filename)
+        url_cache.invalidate(filename)
 
     def update_file(self, filename: str, content: BytesIO | StreamingBody) -> None:
         """Обновление данных файла в s3 хранилище
@@ -91,17 +700,24 @@ class S3Manager:
         self._s3_client.upload_fileobj(
             Fileobj=content,
             Bucket=BUCKET_NAME,
-            Key=filename
+            Key=filename,
+            Config=transfer_config
         )
+        key_index.add(filename)
+        url_cache.invalidate(filename)
 
-    def get_objects_collection(self) -> BucketObjectsCollection:
+    def get_objects_collection(self, prefix: str | None = None) -> BucketObjectsCollection:
         """Возвращает объект для просмотра информации о всех файлах в хранилище
 
+        :param prefix: Если указан, возвращаются только файлы, названия которых начинаются с prefix
+        :type prefix: str | None
         :return: BucketObjectsCollection объект
         :rtype: BucketObjectsCollection
         """
-        s3_resource = self._session.resource("s3")
+        s3_resource = client_registry.resource()
         s3_bucket = s3_resource.Bucket(name=BUCKET_NAME)
+        if prefix is not None:
+            return s3_bucket.objects.filter(Prefix=prefix)
         bucket_objects_collection = s3_bucket.objects.all()
         return bucket_objects_collection
 
@@ -131,18 +747,7 @@ class S3Manager:
                 return default
             raise ValueError(f"File not found: {filename}")
 
-        url = self._s3_client.generate_presigned_url(
-            "get_object",
-            Params={
-                "Bucket": BUCKET_NAME,
-                "Key": filename,
-                "ResponseContentType": content_type,
-                "ResponseContentDisposition": content_disposition
-            },
-            ExpiresIn=expiration
-        )
-
-        return url
+        return self._generate_url(filename, content_type, content_disposition, expiration)
 
     def get_file_url_fast(self, filename: str,
                           content_type: str,
@@ -165,18 +770,7 @@ class S3Manager:
         :rtype: str
         """
 
-        url = self._s3_client.generate_presigned_url(
-            "get_object",
-            Params={
-                "Bucket": BUCKET_NAME,
-                "Key": filename,
-                "ResponseContentType": content_type,
-                "ResponseContentDisposition": content_disposition
-            },
-            ExpiresIn=expiration
-        )
-
-        return url
+        return self._generate_url(filename, content_type, content_disposition, expiration)
 
     def get_file_urls(self,
                       *filenames: str,
@@ -192,18 +786,15 @@ class S3Manager:
         :param expiration:
         :return:
         """
-        with ThreadPoolExecutor(max_workers=32) as executor:
-            urls = list(
-                executor.map(
-                    lambda filename: self.get_file_url_fast(
-                        filename,
-                        content_type=content_type,
-                        content_disposition=content_disposition,
-                        expiration=expiration
-                    ),
-                    filenames
-                )
-            )
+        urls = batch_signer.map(
+            lambda filename: self.get_file_url_fast(
+                filename,
+                content_type=content_type,
+                content_disposition=content_disposition,
+                expiration=expiration
+            ),
+            filenames
+        )
         return urls
 
     def get_file_group_urls(self,
@@ -225,35 +816,79 @@ class S3Manager:
             :type expiration: int, optional
             :return: Список списков URL. Каждый внутренний список содержит URL для файлов в соответствующей группе.
             :rtype: list[list[str]]"""
-        with ThreadPoolExecutor(max_workers=32) as executor:
-            urls = list(
-                executor.map(
-                    lambda sequence: list(
-                        map(
-                            lambda filename, content_type: self.get_file_url_fast(
-                                filename,
-                                content_type=content_type,
-                                content_disposition=content_disposition,
-                                expiration=expiration
-                            ),
-                            sequence,
-                            content_types
-                        )
+        urls = batch_signer.map(
+            lambda sequence: list(
+                map(
+                    lambda filename, content_type: self.get_file_url_fast(
+                        filename,
+                        content_type=content_type,
+                        content_disposition=content_disposition,
+                        expiration=expiration
                     ),
-                    sequences
+                    sequence,
+                    content_types
                 )
-            )
+            ),
+            sequences
+        )
         return urls
 
-    def _file_exists(self, filename: str):
+    def _generate_url(self, filename: str, content_type: str, content_disposition: str, expiration: int) -> str:
+        url = url_cache.get(filename, content_type, content_disposition, expiration)
+        if url is not None:
+            return url
+
+        presigner = client_registry.presigner() if settings.S3_LOCAL_SIGNING else None
+        if presigner is not None:
+            url = presigner.presign_get(filename, content_type, content_disposition, expiration)
+        else:
+            url = self._s3_client.generate_presigned_url(
+                "get_object",
+                Params={
+                    "Bucket": BUCKET_NAME,
+                    "Key": filename,
+                    "ResponseContentType": content_type,
+                    "ResponseContentDisposition": content_disposition
+                },
+                ExpiresIn=expiration
+            )
+        url_cache.put(filename, content_type, content_disposition, url, expiration)
+        return url
+
+    def _file_exists(self, filename: str) -> bool:
+        exists = key_index.contains(filename)
+        if exists is not None:
+            return exists
+
         try:
-            self.get_file(filename)
-        except ValueError:
+            self._s3_client.head_object(
+                Bucket=BUCKET_NAME,
+                Key=filename
+            )
+        except ClientError as ex:
+            # Отсутствие файла запоминается, остальные ошибки (доступ, сбой хранилища) пробрасываются
+            if ex.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                raise
+            key_index.discard(filename)
             return False
+
+        key_index.add(filename)
         return True
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._s3_client.close()
+        # Клиент общий для всего процесса и закрывается через client_registry.close()
+        pass
+
+
+delayed_deleter = DelayedDeleter(lambda key: S3Manager().delete_file(key))
+
+
+def start_key_index_refresh() -> None:
+    """Запускает фоновую загрузку списка файлов хранилища в key_index
+    (раз в settings.S3_KEY_INDEX_REFRESH_INTERVAL секунд, 0 - не загружать)"""
+    if settings.S3_KEY_INDEX_REFRESH_INTERVAL > 0:
+        key_index.start_refresh(lambda: [obj.key for obj in S3Manager().get_objects_collection()],
+                                settings.S3_KEY_INDEX_REFRESH_INTERVAL)
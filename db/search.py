@@ -0,0 +1,368 @@
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from .db_config import settings
+from .models import Album, Artist, Music, MusicArtistAssociation
+
+# Веса полей при ранжировании: совпадение в названии трека важнее совпадения в имени артиста или альбоме
+TRACK_WEIGHT = 3
+ARTIST_WEIGHT = 2
+ALBUM_WEIGHT = 1
+# Значение innodb_ft_min_token_size по умолчанию: более короткие слова не попадают в FULLTEXT индекс
+FULLTEXT_MIN_TOKEN_SIZE = 3
+
+
+class SearchBackend(ABC):
+    """Базовый класс поискового индекса по трекам, артистам и альбомам"""
+
+    @abstractmethod
+    def search(self, db_session: Session, query: str, limit: int | None = None,
+               after: tuple[float, int] | None = None,
+               before: tuple[float, int] | None = None) -> list[tuple[float, int]]:
+        """Возвращает пары (релевантность, id трека) для треков, подходящих под запрос, в порядке убывания
+        релевантности (при равной релевантности - по возрастанию id).\n
+        Если задан after, возвращаются результаты, следующие за ключом after. Если задан before - последние limit
+        результатов, предшествующих ключу before
+
+        :param db_session: Сессия базы данных
+        :type db_session: Session
+        :param query: Поисковый запрос
+        :type query: str
+        :param limit: Максимальное количество результатов (None - без ограничения)
+        :type limit: int | None
+        :param after: Ключ (релевантность, id), после которого начинается выборка
+        :type after: tuple[float, int] | None
+        :param before: Ключ (релевантность, id), перед которым заканчивается выборка
+        :type before: tuple[float, int] | None
+        :return: Список пар (релевантность, id трека)
+        :rtype: list[tuple[float, int]]
+        """
+
+    @abstractmethod
+    def index_music(self, db_session: Session, music_ids: Iterable[int]) -> None:
+        """Добавляет или обновляет треки в индексе
+
+        :param db_session: Сессия базы данных
+        :type db_session: Session
+        :param music_ids: id треков
+        :type music_ids: Iterable[int]
+        """
+
+
+class TrigramSearchBackend(SearchBackend):
+    """
+    Инвертированный индекс по триграммам, хранящийся в памяти процесса.\n
+    Строится из базы данных при первом поиске и дополняется через index_music. index_music обновляет только
+    индекс своего процесса, поэтому индекс перестраивается не реже, чем раз в ``ttl`` секунд: треки,
+    загруженные другим процессом, появляются в поиске с этой задержкой. Устаревший индекс перестраивает
+    один поток, остальные в это время ищут по старому индексу. Используется для баз данных
+    без полнотекстового поиска (например, SQLite)
+    """
+
+    def __init__(self, min_similarity: float = 0.5, ttl: int = 300):
+        self.min_similarity = min_similarity
+        self.ttl = ttl
+        self.loaded = False
+        self._expires_at = 0.0
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._documents: dict[int, list[tuple[int, str]]] = {}
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    def search(self, db_session: Session, query: str, limit: int | None = None,
+               after: tuple[float, int] | None = None,
+               before: tuple[float, int] | None = None) -> list[tuple[float, int]]:
+        self._ensure_loaded(db_session)
+
+        normalized_query = _normalize(query)
+        if not normalized_query:
+            return []
+        query_trigrams = _trigrams(normalized_query)
+
+        with self._lock:
+            scores: dict[int, int] = defaultdict(int)
+            matches: dict[int, int] = defaultdict(int)
+            for trigram in query_trigrams:
+                for music_id, weight in self._postings.get(trigram, {}).items():
+                    scores[music_id] += weight
+                    matches[music_id] += 1
+
+            ranked = []
+            for music_id, score in scores.items():
+                fields = self._documents[music_id]
+                substring_weight = max((weight for weight, value in fields if normalized_query in value), default=0)
+                if substring_weight == 0 and matches[music_id] < self.min_similarity * len(query_trigrams):
+                    continue
+                ranked.append((float(score + substring_weight * len(query_trigrams)), music_id))
+
+        ranked.sort(key=_rank_key)
+        if after is not None:
+            ranked = [item for item in ranked if _rank_key(item) > _rank_key(after)]
+        if before is not None:
+            ranked = [item for item in ranked if _rank_key(item) < _rank_key(before)]
+            return ranked if limit is None else ranked[-limit:]
+        return ranked if limit is None else ranked[:limit]
+
+    def index_music(self, db_session: Session, music_ids: Iterable[int]) -> None:
+        if not self.loaded:
+            # Индекс будет построен целиком при первом поиске
+            return
+
+        documents = _load_documents(db_session, list(music_ids))
+        with self._lock:
+            for music_id, fields in documents.items():
+                self._remove(music_id)
+                self._add(music_id, fields)
+
+    def invalidate(self) -> None:
+        """Сбрасывает индекс. Следующий поиск построит его заново"""
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self.loaded = False
+
+    def _ensure_loaded(self, db_session: Session) -> None:
+        if self.loaded and time.monotonic() < self._expires_at:
+            return
+
+        if self.loaded:
+            # Перестройка уже идет в другом потоке: поиск выполняется по старому индексу
+            if not self._rebuild_lock.acquire(blocking=False):
+                return
+        else:
+            # Индекса еще нет: поиск ждет его построения
+            self._rebuild_lock.acquire()
+        try:
+            if self.loaded and time.monotonic() < self._expires_at:
+                return
+
+            # Новый индекс строится без блокировки поиска и заменяет старый целиком
+            postings: dict[str, dict[int, int]] = defaultdict(dict)
+            documents: dict[int, list[tuple[int, str]]] = {}
+            for music_id, fields in _load_documents(db_session).items():
+                _add_document(postings, documents, music_id, fields)
+            with self._lock:
+                self._postings = postings
+                self._documents = documents
+                self.loaded = True
+                self._expires_at = time.monotonic() + self.ttl
+        finally:
+            self._rebuild_lock.release()
+
+    def _add(self, music_id: int, fields: list[tuple[int, str]]) -> None:
+        _add_document(self._postings, self._documents, music_id, fields)
+
+    def _remove(self, music_id: int) -> None:
+        for _, value in self._documents.pop(music_id, []):
+            for trigram in _trigrams(value):
+                postings = self._postings.get(trigram)
+                if postings is not None:
+                    postings.pop(music_id, None)
+
+
+class MySqlFulltextSearchBackend(SearchBackend):
+    """
+    Поиск через FULLTEXT индексы MySQL по названиям треков, именам артистов и названиям альбомов.\n
+    Индексы поддерживаются самой базой данных, поэтому index_music ничего не делает.\n
+    Ограничения FULLTEXT: слова ищутся по началу (``слово*``), слова короче innodb_ft_min_token_size
+    (FULLTEXT_MIN_TOKEN_SIZE) и стоп-слова не индексируются. Такие слова в запросе пропускаются.
+    Запрос только из коротких слов и запрос, по которому FULLTEXT ничего не нашел (например, совпадение
+    в середине слова), выполняются через LIKE ``%запрос%`` (см. MySqlLikeSearchBackend) - медленнее,
+    но находит совпадения в середине слова
+    """
+
+    _SEARCH_QUERY = (
+        "SELECT hits.music_id, SUM(hits.score) AS total_score FROM ("
+        " SELECT musics.id AS music_id, MATCH(musics.name) AGAINST(:query IN BOOLEAN MODE) * :track_weight AS score"
+        " FROM musics WHERE MATCH(musics.name) AGAINST(:query IN BOOLEAN MODE)"
+        " UNION ALL"
+        " SELECT music_artist.music_id, MATCH(artists.name) AGAINST(:query IN BOOLEAN MODE) * :artist_weight"
+        " FROM artists JOIN music_artist ON music_artist.artist_id = artists.id"
+        " WHERE MATCH(artists.name) AGAINST(:query IN BOOLEAN MODE)"
+        " UNION ALL"
+        " SELECT musics.id, MATCH(albums.name) AGAINST(:query IN BOOLEAN MODE) * :album_weight"
+        " FROM albums JOIN musics ON musics.album_id = albums.id"
+        " WHERE MATCH(albums.name) AGAINST(:query IN BOOLEAN MODE)"
+        ") AS hits GROUP BY hits.music_id"
+    )
+
+    def __init__(self, fallback: SearchBackend | None = None):
+        self.fallback = fallback
+
+    def search(self, db_session: Session, query: str, limit: int | None = None,
+               after: tuple[float, int] | None = None,
+               before: tuple[float, int] | None = None) -> list[tuple[float, int]]:
+        words = _normalize(query).split()
+        indexed_words = [word for word in words if len(word) >= FULLTEXT_MIN_TOKEN_SIZE]
+        if not indexed_words:
+            if words and self.fallback is not None:
+                return self.fallback.search(db_session, query, limit=limit, after=after, before=before)
+            return []
+
+        params = {
+            "query": " ".join(f"{word}*" for word in indexed_words),
+            "track_weight": TRACK_WEIGHT,
+            "artist_weight": ARTIST_WEIGHT,
+            "album_weight": ALBUM_WEIGHT
+        }
+        results = _ranked_query(db_session, self._SEARCH_QUERY, params, limit, after, before)
+        if results or self.fallback is None:
+            return results
+        if (after is not None or before is not None) and \
+                _ranked_query(db_session, self._SEARCH_QUERY, params, 1, None, None):
+            # Страница за пределами найденного FULLTEXT
+            return results
+        return self.fallback.search(db_session, query, limit=limit, after=after, before=before)
+
+    def index_music(self, db_session: Session, music_ids: Iterable[int]) -> None:
+        pass
+
+
+class MySqlLikeSearchBackend(SearchBackend):
+    """
+    Поиск подстроки через LIKE ``%запрос%`` по названиям треков, именам артистов и названиям альбомов.\n
+    Не использует индексы (полный просмотр таблиц), поэтому применяется только для запросов,
+    которые не может обработать или по которым ничего не нашел FULLTEXT индекс
+    """
+
+    _SEARCH_QUERY = (
+        "SELECT hits.music_id, SUM(hits.score) AS total_score FROM ("
+        " SELECT musics.id AS music_id, :track_weight AS score"
+        " FROM musics WHERE musics.name LIKE :pattern"
+        " UNION ALL"
+        " SELECT music_artist.music_id, :artist_weight"
+        " FROM artists JOIN music_artist ON music_artist.artist_id = artists.id"
+        " WHERE artists.name LIKE :pattern"
+        " UNION ALL"
+        " SELECT musics.id, :album_weight"
+        " FROM albums JOIN musics ON musics.album_id = albums.id"
+        " WHERE albums.name LIKE :pattern"
+        ") AS hits GROUP BY hits.music_id"
+    )
+
+    def search(self, db_session: Session, query: str, limit: int | None = None,
+               after: tuple[float, int] | None = None,
+               before: tuple[float, int] | None = None) -> list[tuple[float, int]]:
+        query = query.strip()
+        if not query:
+            return []
+
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params = {
+            "pattern": f"%{escaped}%",
+            "track_weight": TRACK_WEIGHT,
+            "artist_weight": ARTIST_WEIGHT,
+            "album_weight": ALBUM_WEIGHT
+        }
+        return _ranked_query(db_session, self._SEARCH_QUERY, params, limit, after, before)
+
+    def index_music(self, db_session: Session, music_ids: Iterable[int]) -> None:
+        pass
+
+
+trigram_backend = TrigramSearchBackend(ttl=settings.SEARCH_INDEX_TTL)
+like_backend = MySqlLikeSearchBackend()
+fulltext_backend = MySqlFulltextSearchBackend(fallback=like_backend)
+
+
+def _add_document(postings: dict[str, dict[int, int]], documents: dict[int, list[tuple[int, str]]],
+                  music_id: int, fields: list[tuple[int, str]]) -> None:
+    documents[music_id] = fields
+    for weight, value in fields:
+        for trigram in _trigrams(value):
+            music_postings = postings[trigram]
+            music_postings[music_id] = max(music_postings.get(music_id, 0), weight)
+
+
+def get_search_backend(db_session: Session) -> SearchBackend:
+    """Возвращает поисковый индекс согласно settings.SEARCH_BACKEND.\n
+    При значении "auto" для MySQL используется FULLTEXT поиск, для остальных баз данных - индекс в памяти
+
+    :param db_session: Сессия базы данных
+    :type db_session: Session
+    :return: Поисковый индекс
+    :rtype: SearchBackend
+    """
+    backend = settings.SEARCH_BACKEND
+    if backend == "auto":
+        backend = "mysql" if db_session.get_bind().dialect.name == "mysql" else "trigram"
+
+    if backend == "mysql":
+        return fulltext_backend
+    if backend == "trigram":
+        return trigram_backend
+    raise ValueError(f"Unknown search backend: {settings.SEARCH_BACKEND}")
+
+
+def _ranked_query(db_session: Session, sql: str, params: dict, limit: int | None,
+                  after: tuple[float, int] | None, before: tuple[float, int] | None) -> list[tuple[float, int]]:
+    """Выполняет запрос, возвращающий (music_id, total_score), с сортировкой и keyset условиями SearchBackend"""
+    params = dict(params)
+    order = " ORDER BY total_score DESC, hits.music_id"
+    if after is not None:
+        sql += (" HAVING total_score < :key_score"
+                " OR (total_score = :key_score AND hits.music_id > :key_id)")
+        params.update(key_score=after[0], key_id=after[1])
+    elif before is not None:
+        # Выбираем в обратном порядке, чтобы LIMIT отсек записи, наиболее удаленные от курсора
+        sql += (" HAVING total_score > :key_score"
+                " OR (total_score = :key_score AND hits.music_id < :key_id)")
+        params.update(key_score=before[0], key_id=before[1])
+        order = " ORDER BY total_score ASC, hits.music_id DESC"
+    sql += order
+    if limit is not None:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+
+    rows = [(float(row.total_score), row.music_id) for row in db_session.execute(text(sql), params)]
+    if before is not None:
+        rows.reverse()
+    return rows
+
+
+def _load_documents(db_session: Session, music_ids: list[int] | None = None) -> dict[int, list[tuple[int, str]]]:
+    music_query = select(Music.id, Music.name, Album.name).outerjoin(Album, Music.album_id == Album.id)
+    artist_query = select(MusicArtistAssociation.music_id, Artist.name).join(
+        Artist, MusicArtistAssociation.artist_id == Artist.id
+    )
+    if music_ids is not None:
+        music_query = music_query.where(Music.id.in_(music_ids))
+        artist_query = artist_query.where(MusicArtistAssociation.music_id.in_(music_ids))
+
+    documents: dict[int, list[tuple[int, str]]] = {}
+    for music_id, music_name, album_name in db_session.execute(music_query):
+        fields = [(TRACK_WEIGHT, _normalize(music_name))]
+        if album_name:
+            fields.append((ALBUM_WEIGHT, _normalize(album_name)))
+        documents[music_id] = fields
+
+    for music_id, artist_name in db_session.execute(artist_query):
+        if music_id in documents:
+            documents[music_id].append((ARTIST_WEIGHT, _normalize(artist_name)))
+
+    return documents
+
+
+def _rank_key(item: tuple[float, int]) -> tuple[float, int]:
+    score, music_id = item
+    return -score, music_id
+
+
+def _normalize(value: str) -> str:
+    value = value.casefold().replace("ё", "е")
+    return " ".join(re.findall(r"\w+", value))
+
+
+def _trigrams(value: str) -> set[str]:
+    trigrams = set()
+    for word in value.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
@@ -1,4 +1,6 @@
 from app import app
+from db.connect import create_db_and_tables
 
 if __name__ == "__main__":
+    create_db_and_tables()
     app.run("0.0.0.0")
@@ -0,0 +1,224 @@
+from typing import Sequence
+
+from flask import Blueprint, request, jsonify, url_for, abort
+from flask_login import current_user, login_required
+from werkzeug.exceptions import HTTPException
+
+from db.connect import use_session
+from db.db_config import settings
+from db.managers.music_manager import MusicManager, TrackRow
+from db.managers.playlist_manager import PlaylistManager, PlaylistNotFoundError
+from db.managers.user_manager import UserManager
+from db.models import Playlist
+from db.pagination import Page, InvalidCursorError
+
+# JSON API для клиентов. Ответы компактные (см. app.json в app.py), списки треков постраничные,
+# операции над избранным и получение ссылок принимают сразу много id
+api_v1 = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+
+@api_v1.errorhandler(HTTPException)
+def handle_http_error(ex: HTTPException):
+    return jsonify({"error": ex.description}), ex.code
+
+
+@api_v1.errorhandler(InvalidCursorError)
+def handle_invalid_cursor(ex: InvalidCursorError):
+    return jsonify({"error": str(ex)}), 400
+
+
+@api_v1.errorhandler(PlaylistNotFoundError)
+def handle_playlist_not_found(ex: PlaylistNotFoundError):
+    return jsonify({"error": str(ex)}), 404
+
+
+@api_v1.route("/tracks")
+@login_required
+def list_tracks():
+    # GET /api/v1/tracks?cursor=...&limit=...&urls=1 - каталог треков по возрастанию id
+    with use_session() as db_session:
+        music_manager = MusicManager(db_session)
+        page = music_manager.get_music_page(cursor=request.args.get("cursor"), page_size=_get_limit())
+        return jsonify(_page_to_dict(page, [TrackRow.from_music(music) for music in page]))
+
+
+@api_v1.route("/tracks/urls")
+@login_required
+def get_track_urls():
+    # GET /api/v1/tracks/urls?ids=1,2,3 - ссылки на аудио и обложки существующих треков из ids
+    music_ids = _parse_ids([value for value in request.args.get("ids", "").split(",") if value])
+    with use_session() as db_session:
+        music_ids = MusicManager(db_session).get_existing_ids(music_ids)
+    return jsonify({"urls": _track_urls(music_ids)})
+
+
+@api_v1.route("/favorites")
+@login_required
+def list_favorites():
+    # GET /api/v1/favorites?cursor=...&limit=...&urls=1 - избранные треки, начиная с последних добавленных
+    user_manager = UserManager()
+    page = user_manager.get_favorite_tracks_page(current_user.id, cursor=request.args.get("cursor"),
+                                                 page_size=_get_limit())
+    return jsonify(_page_to_dict(page, page.items))
+
+
+@api_v1.route("/favorites", methods=["PUT"])
+@login_required
+def add_favorites():
+    # PUT /api/v1/favorites {"ids": [...]} - идемпотентно добавляет треки в избранное
+    music_ids = _parse_ids(_get_json_ids())
+    return jsonify({"added": UserManager().add_favorite_tracks(current_user.id, music_ids)})
+
+
+@api_v1.route("/favorites", methods=["DELETE"])
+@login_required
+def remove_favorites():
+    # DELETE /api/v1/favorites {"ids": [...]} - идемпотентно удаляет треки из избранного
+    music_ids = _parse_ids(_get_json_ids())
+    return jsonify({"removed": UserManager().remove_favorite_tracks(current_user.id, music_ids)})
+
+
+@api_v1.route("/playlists")
+@login_required
+def list_playlists():
+    # GET /api/v1/playlists - плейлисты пользователя
+    playlists = PlaylistManager.get_playlists(current_user.id)
+    return jsonify({"items": [_playlist_to_dict(playlist) for playlist in playlists]})
+
+
+@api_v1.route("/playlists", methods=["POST"])
+@login_required
+def create_playlist():
+    # POST /api/v1/playlists {"name": "..."} - создает плейлист
+    playlist = PlaylistManager.create_playlist(current_user.id, _get_json_name())
+    return jsonify(_playlist_to_dict(playlist)), 201
+
+
+@api_v1.route("/playlists/<int:playlist_id>", methods=["PATCH"])
+@login_required
+def rename_playlist(playlist_id: int):
+    # PATCH /api/v1/playlists/<id> {"name": "..."} - переименовывает плейлист
+    PlaylistManager.rename_playlist(current_user.id, playlist_id, _get_json_name())
+    return "", 204
+
+
+@api_v1.route("/playlists/<int:playlist_id>", methods=["DELETE"])
+@login_required
+def delete_playlist(playlist_id: int):
+    PlaylistManager.delete_playlist(current_user.id, playlist_id)
+    return "", 204
+
+
+@api_v1.route("/playlists/<int:playlist_id>/tracks")
+@login_required
+def list_playlist_tracks(playlist_id: int):
+    # GET /api/v1/playlists/<id>/tracks?cursor=...&limit=...&urls=1 - треки в порядке плейлиста
+    page = PlaylistManager.get_tracks_page(current_user.id, playlist_id, cursor=request.args.get("cursor"),
+                                           page_size=_get_limit())
+    return jsonify(_page_to_dict(page, page.items))
+
+
+@api_v1.route("/playlists/<int:playlist_id>/tracks", methods=["PUT"])
+@login_required
+def add_playlist_tracks(playlist_id: int):
+    # PUT /api/v1/playlists/<id>/tracks {"ids": [...]} - добавляет треки в конец плейлиста
+    music_ids = _parse_ids(_get_json_ids())
+    return jsonify({"added": PlaylistManager.add_tracks(current_user.id, playlist_id, music_ids)})
+
+
+@api_v1.route("/playlists/<int:playlist_id>/tracks", methods=["DELETE"])
+@login_required
+def remove_playlist_tracks(playlist_id: int):
+    # DELETE /api/v1/playlists/<id>/tracks {"ids": [...]} - удаляет треки из плейлиста
+    music_ids = _parse_ids(_get_json_ids())
+    return jsonify({"removed": PlaylistManager.remove_tracks(current_user.id, playlist_id, music_ids)})
+
+
+@api_v1.route("/playlists/<int:playlist_id>/tracks/<int:music_id>/move", methods=["POST"])
+@login_required
+def move_playlist_track(playlist_id: int, music_id: int):
+    # POST /api/v1/playlists/<id>/tracks/<music_id>/move {"after": id | null} - перемещает трек после другого
+    data = request.get_json(silent=True)
+    after = data.get("after") if isinstance(data, dict) else None
+    if after is not None and (not isinstance(after, int) or isinstance(after, bool)):
+        abort(400, "Expected JSON object with integer or null \"after\"")
+    if after == music_id:
+        abort(400, "Track can not be moved after itself")
+    try:
+        PlaylistManager.move_track(current_user.id, playlist_id, music_id, after)
+    except ValueError as ex:
+        # Одного из треков нет в плейлисте
+        abort(404, str(ex))
+    return "", 204
+
+
+def _get_limit() -> int | None:
+    return request.args.get("limit", type=int)
+
+
+def _get_json_ids() -> list:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("ids"), list):
+        abort(400, "Expected JSON object with list \"ids\"")
+    return data["ids"]
+
+
+def _get_json_name() -> str:
+    data = request.get_json(silent=True)
+    name = data.get("name") if isinstance(data, dict) else None
+    if not isinstance(name, str) or not name.strip():
+        abort(400, "Expected JSON object with non-empty string \"name\"")
+    if len(name) > 255:
+        abort(400, "Name is too long")
+    return name.strip()
+
+
+def _parse_ids(values: Sequence) -> list[int]:
+    music_ids = []
+    for value in values:
+        try:
+            music_ids.append(int(value))
+        except (TypeError, ValueError):
+            abort(400, f"Invalid id: {value!r}")
+    if not music_ids:
+        abort(400, "No ids given")
+    if len(music_ids) > settings.REST_BATCH_MAX:
+        abort(400, f"Too many ids, max {settings.REST_BATCH_MAX}")
+    return music_ids
+
+
+def _page_to_dict(page: Page, tracks: list[TrackRow]) -> dict:
+    items = [_track_to_dict(track) for track in tracks]
+    if request.args.get("urls", type=int):
+        urls = _track_urls([track.id for track in tracks])
+        for item in items:
+            item.update(urls[str(item["id"])])
+    return {"items": items, "next_cursor": page.next_cursor, "prev_cursor": page.prev_cursor}
+
+
+def _playlist_to_dict(playlist: Playlist) -> dict:
+    return {"id": playlist.id, "name": playlist.name, "created_at": playlist.created_at.isoformat()}
+
+
+def _track_to_dict(track: TrackRow) -> dict:
+    data = track._asdict()
+    if track.favorited_at is None:
+        del data["favorited_at"]
+    else:
+        data["favorited_at"] = track.favorited_at.isoformat()
+    return data
+
+
+def _track_urls(music_ids: list[int]) -> dict[str, dict[str, str | None]]:
+    # Все ссылки подписываются пакетно, без обращений к s3
+    urls = MusicManager.get_music_url_pairs(*music_ids)
+    srcsets = MusicManager.get_music_image_srcsets(*music_ids)
+    return {
+        str(music_id): {
+            "audio_url": url_for("stream_track", track_id=music_id) if settings.STREAM_PROXY_ENABLED else audio_url,
+            "image_url": image_url,
+            "image_srcset": image_srcset,
+            "image_webp_srcset": image_webp_srcset
+        }
+        for music_id, (audio_url, image_url), (image_srcset, image_webp_srcset) in zip(music_ids, urls, srcsets)
+    }
@@ -25,6 +25,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 // Обновить аватар на странице
                 const avatarImg = document.getElementById('userAvatar');
                 avatarImg.src = data.avatar_url;  // Заменить URL изображения на новый
+                avatarImg.srcset = data.avatar_srcset;
 
                 // Закрыть модальное окно
                 avatarModal.hide();
@@ -1,28 +1,36 @@
 document.addEventListener('DOMContentLoaded', function () {
     const favoriteButtons = document.querySelectorAll('.favorite-btn');
 
+    function setFavoriteState(button, favorite) {
+        const icon = button.querySelector('i');
+        icon.classList.toggle('bi-heart', !favorite);
+        icon.classList.toggle('bi-heart-fill', favorite);
+        button.classList.toggle('btn-outline-light', !favorite);
+        button.classList.toggle('btn-danger', favorite);
+        button.title = favorite ? 'Убрать из избранного' : 'Добавить в избранное';
+    }
+
     favoriteButtons.forEach(button => {
         button.addEventListener('click', function () {
             const card = this.closest('.soundtrack-card');
             const audioId = card.querySelector('audio').id.split('-')[1];
             const icon = this.querySelector('i');
+            // Запрашивается конкретное состояние, а не переключение: повторный запрос ничего не меняет
+            const favorite = !icon.classList.contains('bi-heart-fill');
 
+            this.disabled = true;
             fetch(`/toggle_favorite/${audioId}`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                     'X-Requested-With': 'XMLHttpRequest'
-                }
-            })
-            .then(response => {
-                if (response.ok) {
-                    icon.classList.toggle('bi-heart');
-                    icon.classList.toggle('bi-heart-fill');
-                    this.classList.toggle('btn-outline-light');
-                    this.classList.toggle('btn-danger');
-                }
+                },
+                body: JSON.stringify({favorite: favorite})
             })
-            .catch(error => console.error('Ошибка при добавлении в избранное:', error));
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(data => setFavoriteState(this, data.favorite))
+            .catch(error => console.error('Ошибка при добавлении в избранное:', error))
+            .finally(() => { this.disabled = false; });
         });
     });
 });
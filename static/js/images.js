@@ -0,0 +1,15 @@
+// Если уменьшенной копии обложки нет (обложка загружена до появления копий), показываем исходное изображение
+document.addEventListener('error', function (event) {
+    const img = event.target;
+    if (!(img instanceof HTMLImageElement) || !img.dataset.fallbackSrc) {
+        return;
+    }
+
+    const fallbackSrc = img.dataset.fallbackSrc;
+    delete img.dataset.fallbackSrc;
+    if (img.parentElement && img.parentElement.tagName === 'PICTURE') {
+        img.parentElement.querySelectorAll('source').forEach(source => source.remove());
+    }
+    img.removeAttribute('srcset');
+    img.src = fallbackSrc;
+}, true);
@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+# Настройки подключения обязательны для db.db_config; тесты не обращаются к MySQL и s3
+for key, value in {
+    "DB_HOST": "localhost",
+    "DB_PORT": "3306",
+    "DB_USER": "test",
+    "DB_PASS": "test",
+    "DB_NAME": "test",
+    "DB_SSL_CA": "",
+    "AWS_ACCESS_KEY_ID": "AKIDEXAMPLE",
+    "AWS_SECRET_ACCESS_KEY": "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY",
+    "S3_KEY_INDEX_REFRESH_INTERVAL": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeSaavn:
+    """
+    Локальный сервер стороннего API. Отвечает по routes (путь с параметрами или без них),
+    иначе - заранее заданной последовательностью ответов. Тело ответа - JSON или байты файла
+    """
+
+    def __init__(self):
+        self.responses: list[tuple[int, dict[str, str], dict | bytes]] = []
+        self.routes: dict[str, tuple[int, dict[str, str], dict | bytes]] = {}
+        self.requests: list[tuple[str, float]] = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests.append((self.path, time.monotonic()))
+                route = fake.routes.get(self.path) or fake.routes.get(urlsplit(self.path).path)
+                if route is not None:
+                    status, headers, body = route
+                else:
+                    status, headers, body = fake.responses.pop(0) if fake.responses else (200, {}, {"data": {}})
+                if isinstance(body, bytes):
+                    payload, content_type = body, "application/octet-stream"
+                else:
+                    payload, content_type = json.dumps(body).encode("utf-8"), "application/json"
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.root_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.base_url = f"{self.root_url}/api"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def saavn():
+    fake = FakeSaavn()
+    yield fake
+    fake.close()
@@ -0,0 +1,63 @@
+import pytest
+import sqlalchemy
+import sqlalchemy.orm
+from sqlalchemy import text
+
+from db import connect
+from db.pool_metrics import PoolMetrics
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # get_engine создает engine для MySQL; параметры пула сохраняются, меняется только адрес
+    create_engine = sqlalchemy.create_engine
+    url = f"sqlite:///{tmp_path / 'connect.db'}"
+    monkeypatch.setattr(sqlalchemy, "create_engine",
+                        lambda _url, connect_args=None, **kwargs: create_engine(url, **kwargs))
+    monkeypatch.setattr(connect, "_engine", None)
+    monkeypatch.setattr(connect, "pool_metrics", PoolMetrics())
+    monkeypatch.setattr(connect, "SessionLocal", sqlalchemy.orm.sessionmaker(
+        autocommit=False, autoflush=False, class_=connect._CountingSession
+    ))
+    engine = connect.get_engine()
+    yield engine
+    engine.dispose()
+
+
+def test_use_session_reuses_request_session(engine):
+    connect.begin_request_scope()
+    try:
+        with connect.use_session() as first, connect.use_session() as second:
+            assert first is second
+            first.execute(text("SELECT 1"))
+        # Сессия запроса не закрывается при выходе из блока with
+        with connect.use_session() as third:
+            assert third is first
+            third.execute(text("SELECT 2"))
+    finally:
+        stats = connect.end_request_scope()
+
+    assert stats == {"sessions": 1, "checkouts": 1, "queries": 2}
+    assert connect.end_request_scope() is None
+
+
+def test_use_session_outside_request_creates_new_sessions(engine):
+    with connect.use_session() as first:
+        first.execute(text("SELECT 1"))
+    with connect.use_session() as second:
+        assert second is not first
+
+    # Вне запроса статистика не собирается
+    assert connect.end_request_scope() is None
+
+
+def test_request_scopes_are_independent(engine):
+    connect.begin_request_scope()
+    with connect.use_session() as first:
+        first.execute(text("SELECT 1"))
+    assert connect.end_request_scope()["queries"] == 1
+
+    connect.begin_request_scope()
+    with connect.use_session() as second:
+        assert second is not first
+    assert connect.end_request_scope() == {"sessions": 1, "checkouts": 0, "queries": 0}
@@ -0,0 +1,69 @@
+import os
+import time
+from io import BytesIO
+
+from db.disk_cache import DiskLruCache
+
+
+def _wait_for_fill(cache: DiskLruCache) -> None:
+    deadline = time.monotonic() + 5
+    while cache.stats()["files"] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_disk_cache_admits_after_misses(tmp_path):
+    cache = DiskLruCache(str(tmp_path), max_bytes=1024, admit_after=3)
+    fetches = []
+
+    def fetch():
+        fetches.append(None)
+        return BytesIO(b"audio"), "etag", "audio/mp3"
+
+    for _ in range(2):
+        assert cache.get("music_audio_1.mp4") is None
+        cache.record_miss("music_audio_1.mp4", fetch)
+    assert fetches == []
+
+    cache.record_miss("music_audio_1.mp4", fetch)
+    _wait_for_fill(cache)
+    entry = cache.get("music_audio_1.mp4")
+    assert entry is not None
+    with open(entry.path, "rb") as f:
+        assert f.read() == b"audio"
+    assert len(fetches) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_disk_cache_evicts_least_recently_used_by_size(tmp_path):
+    cache = DiskLruCache(str(tmp_path), max_bytes=250)
+    for key in ("a", "b", "c"):
+        cache.put(key, BytesIO(b"x" * 100), "etag", "audio/mp3")
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 200
+
+    assert cache.get("b") is not None
+    cache.put("d", BytesIO(b"x" * 100), "etag", "audio/mp3")
+    assert cache.get("c") is None
+    assert cache.get("b") is not None
+    assert sorted(name for name in os.listdir(tmp_path) if not name.endswith(".json")) \
+        == sorted(os.path.basename(cache.get(key).path) for key in ("b", "d"))
+
+
+def test_disk_cache_invalidate_removes_files(tmp_path):
+    cache = DiskLruCache(str(tmp_path), max_bytes=1024)
+    entry = cache.put("a", BytesIO(b"audio"), "etag", "audio/mp3")
+
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert not os.path.exists(entry.path)
+    assert not os.path.exists(entry.path + ".json")
+    assert cache.stats()["bytes"] == 0
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    DiskLruCache(str(tmp_path), max_bytes=1024).put("a", BytesIO(b"audio"), "etag", "audio/mp3")
+
+    entry = DiskLruCache(str(tmp_path), max_bytes=1024).get("a")
+    assert entry is not None
+    assert (entry.size, entry.etag, entry.content_type) == (5, "etag", "audio/mp3")
@@ -0,0 +1,78 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from db import images
+from db.images import ImageWorkerPool
+
+
+def _png(width: int, height: int) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pool():
+    pool = ImageWorkerPool(max_workers=1, max_pending=1, timeout=0.5)
+    yield pool
+    pool.shutdown()
+
+
+def test_open_image_rejects_too_many_pixels(monkeypatch):
+    monkeypatch.setattr(images.settings, "IMAGE_MAX_PIXELS", 100 * 100)
+
+    assert images.open_image(_png(100, 100)).size == (100, 100)
+    with pytest.raises(ValueError, match="too large"):
+        images.open_image(_png(101, 100))
+
+
+def test_open_image_rejects_invalid_data():
+    with pytest.raises(ValueError, match="Invalid image data"):
+        images.open_image(b"not an image")
+
+
+def test_render_avatar_from_spooled_file():
+    with images.spool_to_file(BytesIO(_png(1000, 800)), max_bytes=1024 * 1024) as spool:
+        rendered = images.render_avatar(spool.name)
+
+    assert set(rendered) == {None, *images.AVATAR_SIZES}
+    assert Image.open(BytesIO(rendered[None])).size == (images.AVATAR_MAX_SIZE, 410)
+
+
+def test_spool_to_file_enforces_size_limit():
+    with pytest.raises(ValueError, match="too large"):
+        images.spool_to_file(BytesIO(b"x" * 100), max_bytes=99)
+
+
+def test_slot_is_released_when_timed_out_task_finishes(pool):
+    with pytest.raises(TimeoutError):
+        pool.run(time.sleep, 2)
+
+    # Задача продолжает выполняться в пуле и занимает единственный слот
+    assert not pool._slots.acquire(blocking=False)
+    with pytest.raises(TimeoutError, match="busy"):
+        pool.run(abs, -1)
+
+    assert pool._slots.acquire(timeout=10)
+    pool._slots.release()
+    pool.timeout = 30
+    assert pool.run(abs, -1) == 1
+
+
+def test_broken_pool_is_replaced(pool):
+    pool.timeout = 30
+    with pytest.raises(BrokenProcessPool):
+        pool.run(os._exit, 1)
+    assert pool._executor is None
+
+    assert pool.run(abs, -3) == 3
+    assert pool._slots.acquire(blocking=False)
+
+
+def test_inline_pool_runs_in_caller():
+    assert ImageWorkerPool(max_workers=0).run(os.getpid) == os.getpid()
@@ -0,0 +1,223 @@
+import threading
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from api.music_getter import ApiUtil
+from db import images
+from db.ingest import IngestPipeline
+from db.models import Artist, Base, IngestManifest, Music, MusicArtistAssociation
+
+
+class FakeS3Manager:
+    """s3 хранилище в памяти с интерфейсом S3Manager, используемым конвейером загрузки"""
+
+    def __init__(self):
+        self.files: dict[str, bytes] = {}
+        self.uploaded: list[str] = []
+        self.deleted: list[str] = []
+        self.failing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def upload_file(self, filename, content, force=False, cache_control=None):
+        data = content.read()
+        if filename in self.failing:
+            raise OSError(f"upload of {filename} failed")
+        with self._lock:
+            self.files[filename] = data
+            self.uploaded.append(filename)
+
+    def delete_file(self, filename):
+        with self._lock:
+            self.files.pop(filename, None)
+            self.deleted.append(filename)
+
+
+def _jpeg(color: str) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (640, 640), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ingest.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    yield sessionmaker(engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def s3():
+    return FakeS3Manager()
+
+
+@pytest.fixture
+def pipeline(saavn, s3, session_factory):
+    api_util = ApiUtil(base_url=saavn.base_url, rate_limit=None, max_retries=0)
+    return IngestPipeline(api_util=api_util, s3_manager_factory=lambda: s3, session_factory=session_factory,
+                          chunk_size=2)
+
+
+def _add_album(saavn, album_id: str, songs: list[tuple[str, bytes, str]]) -> None:
+    """songs - (id трека, аудио, цвет обложки)"""
+    album_songs = []
+    for song_id, audio, color in songs:
+        saavn.routes[f"/files/{song_id}.mp4"] = (200, {}, audio)
+        saavn.routes[f"/files/{song_id}.jpg"] = (200, {}, _jpeg(color))
+        album_songs.append({
+            "id": song_id,
+            "name": f"Song {song_id}",
+            "year": 2020,
+            "duration": 180,
+            "language": "english",
+            "image": [{"url": f"{saavn.root_url}/files/{song_id}.jpg"}],
+            "downloadUrl": [{"url": f"{saavn.root_url}/files/{song_id}.mp4"}],
+            "artists": {"all": [{"id": "ar1", "name": "Artist One", "image": []},
+                                {"id": f"ar-{song_id}", "name": f"Artist {song_id}", "image": []}]}
+        })
+    saavn.routes[f"/api/albums?id={album_id}"] = (200, {}, {
+        "data": {"name": f"Album {album_id}", "description": "", "songs": album_songs}
+    })
+
+
+def _manifest(session_factory) -> dict[str, IngestManifest]:
+    with session_factory() as db_session:
+        return {row.source_song_id: row for row in db_session.execute(select(IngestManifest)).scalars()}
+
+
+def _music_id(manifest: dict[str, IngestManifest], song_id: str) -> int:
+    return manifest[song_id].music_id
+
+
+def test_ingest_writes_rows_and_uploads_files(pipeline, saavn, s3, session_factory):
+    _add_album(saavn, "al1", [("s1", b"audio-1", "red"), ("s2", b"audio-2", "green"), ("s3", b"audio-3", "blue")])
+    _add_album(saavn, "al2", [("s4", b"audio-4", "white")])
+
+    saved = pipeline.run(["al1", "al2"])
+
+    manifest = _manifest(session_factory)
+    assert sorted(saved) == sorted(row.music_id for row in manifest.values())
+    assert {row.status for row in manifest.values()} == {IngestManifest.STATUS_DONE}
+    with session_factory() as db_session:
+        assert sorted(db_session.execute(select(Music.name)).scalars()) == ["Song s1", "Song s2", "Song s3", "Song s4"]
+        assert db_session.execute(select(Artist.name).where(Artist.name == "Artist One")).scalars().all() \
+            == ["Artist One"]
+        assert len(db_session.execute(select(MusicArtistAssociation)).all()) == 8
+
+    for song_id in ("s1", "s2", "s3", "s4"):
+        music_id = _music_id(manifest, song_id)
+        assert s3.files[f"music_audio_{music_id}.mp4"] == f"audio-{song_id[1:]}".encode()
+        assert manifest[song_id].audio_key == f"music_audio_{music_id}.mp4"
+        image_key = f"music_image_{music_id}.jpg"
+        assert manifest[song_id].image_key == image_key
+        assert image_key in s3.files
+        assert images.variant_key(image_key, images.COVER_SIZES[0]) in s3.files
+    assert s3.deleted == []
+
+
+def test_failed_transfer_discards_track_and_its_files(pipeline, saavn, s3, session_factory):
+    _add_album(saavn, "al1", [("s1", b"audio-1", "red"), ("s2", b"audio-2", "green")])
+    saavn.routes["/files/s2.mp4"] = (404, {}, b"")
+
+    saved = pipeline.run(["al1"])
+
+    manifest = _manifest(session_factory)
+    assert manifest["s1"].status == IngestManifest.STATUS_DONE
+    assert manifest["s2"].status == IngestManifest.STATUS_FAILED
+    assert manifest["s2"].music_id is None
+    assert saved == [manifest["s1"].music_id]
+    with session_factory() as db_session:
+        assert db_session.execute(select(Music.id)).scalars().all() == saved
+
+    # Обложка трека была загружена до ошибки аудио и удалена вместе с ее копиями
+    kept = (f"music_audio_{saved[0]}.", f"music_image_{saved[0]}.", f"music_image_{saved[0]}_")
+    assert all(key.startswith(kept) for key in s3.files)
+    assert s3.deleted and not any(key.startswith(kept) for key in s3.deleted)
+
+    # Повторный запуск загружает только незагруженный трек
+    saavn.routes["/files/s2.mp4"] = (200, {}, b"audio-2")
+    assert len(pipeline.run(["al1"])) == 1
+    assert _manifest(session_factory)["s2"].status == IngestManifest.STATUS_DONE
+
+
+def test_failed_upload_is_cleaned_up(pipeline, saavn, s3, session_factory):
+    _add_album(saavn, "al1", [("s1", b"audio-1", "red")])
+    s3.failing.add("music_audio_1.mp4")
+
+    assert pipeline.run(["al1"]) == []
+
+    assert _manifest(session_factory)["s1"].status == IngestManifest.STATUS_FAILED
+    assert s3.files == {}
+    assert "music_image_1.jpg" in s3.deleted
+
+
+def test_interrupted_chunk_is_resumed_with_same_ids(pipeline, saavn, s3, session_factory, monkeypatch):
+    _add_album(saavn, "al1", [("s1", b"audio-1", "red"), ("s2", b"audio-2", "green")])
+
+    def interrupted(*args):
+        raise RuntimeError("connection lost")
+
+    finish_chunk = IngestPipeline._finish_chunk
+    monkeypatch.setattr(IngestPipeline, "_finish_chunk", interrupted)
+    assert pipeline.run(["al1"]) == []
+    manifest = _manifest(session_factory)
+    assert {row.status for row in manifest.values()} == {IngestManifest.STATUS_PENDING}
+    pending_ids = {song_id: row.music_id for song_id, row in manifest.items()}
+
+    monkeypatch.setattr(IngestPipeline, "_finish_chunk", finish_chunk)
+    assert sorted(pipeline.run(["al1"])) == sorted(pending_ids.values())
+    manifest = _manifest(session_factory)
+    assert {song_id: row.music_id for song_id, row in manifest.items()} == pending_ids
+    assert {row.status for row in manifest.values()} == {IngestManifest.STATUS_DONE}
+    with session_factory() as db_session:
+        assert len(db_session.execute(select(Music.id)).all()) == 2
+
+
+def test_rerun_skips_finished_tracks(pipeline, saavn, s3, session_factory):
+    _add_album(saavn, "al1", [("s1", b"audio-1", "red"), ("s2", b"audio-2", "green")])
+    assert len(pipeline.run(["al1"])) == 2
+    uploaded = list(s3.uploaded)
+    saavn.requests.clear()
+
+    assert pipeline.run(["al1"]) == []
+    assert s3.uploaded == uploaded
+    assert [path for path, _ in saavn.requests] == ["/api/albums?id=al1"]
+    with session_factory() as db_session:
+        assert len(db_session.execute(select(Music.id)).all()) == 2
+
+
+def test_duplicate_audio_is_linked_without_upload(pipeline, saavn, s3, session_factory):
+    _add_album(saavn, "al1", [("s1", b"same-audio", "red")])
+    _add_album(saavn, "al2", [("s2", b"same-audio", "green"), ("s3", b"audio-3", "blue")])
+    pipeline.run(["al1"])
+
+    saved = pipeline.run(["al2"])
+
+    manifest = _manifest(session_factory)
+    original, duplicate = _music_id(manifest, "s1"), _music_id(manifest, "s2")
+    assert sorted(saved) == sorted([duplicate, _music_id(manifest, "s3")])
+    assert manifest["s2"].status == IngestManifest.STATUS_DUPLICATE
+    assert manifest["s2"].audio_key == f"music_audio_{original}.mp4"
+    assert manifest["s2"].audio_hash == manifest["s1"].audio_hash
+    # Аудио дубликата не загружалось, обложка у него своя
+    assert f"music_audio_{duplicate}.mp4" not in s3.uploaded
+    assert f"music_image_{duplicate}.jpg" in s3.files
+    with session_factory() as db_session:
+        audio_music_ids = dict(db_session.execute(select(Music.id, Music.audio_music_id)).all())
+    assert audio_music_ids == {original: None, duplicate: original, _music_id(manifest, "s3"): None}
+
+
+def test_duplicate_audio_within_chunk_keeps_one_file(pipeline, saavn, s3, session_factory):
+    _add_album(saavn, "al1", [("s1", b"same-audio", "red"), ("s2", b"same-audio", "green")])
+
+    assert len(pipeline.run(["al1"])) == 2
+
+    manifest = _manifest(session_factory)
+    statuses = sorted(row.status for row in manifest.values())
+    assert statuses == [IngestManifest.STATUS_DONE, IngestManifest.STATUS_DUPLICATE]
+    audio_files = [key for key in s3.files if key.startswith("music_audio_")]
+    assert audio_files == [row.audio_key for row in manifest.values() if row.status == IngestManifest.STATUS_DONE]
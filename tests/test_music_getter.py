@@ -0,0 +1,91 @@
+import time
+
+import pytest
+import requests
+
+from api import music_getter
+from api.music_getter import ApiUtil, TokenBucket
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Задержки между повторами записываются, но не выполняются
+    recorded = []
+    monkeypatch.setattr(music_getter.time, "sleep", recorded.append)
+    return recorded
+
+
+def _album_ids_response(*album_ids):
+    return 200, {}, {"data": {"results": [{"id": album_id} for album_id in album_ids]}}
+
+
+def test_retries_429_and_honours_retry_after(saavn, sleeps):
+    saavn.responses = [(429, {"Retry-After": "3"}, {}), (503, {}, {}), _album_ids_response("a1", "a2")]
+    api_util = ApiUtil(base_url=saavn.base_url, rate_limit=None, backoff_factor=0.5, backoff_max=10)
+
+    assert api_util.get_album_ids_by_category("rock", limit=2) == ["a1", "a2"]
+    assert len(saavn.requests) == 3
+    assert sleeps[0] == 3
+    assert 0 <= sleeps[1] <= 0.5 * 2
+
+
+def test_retry_after_is_capped_by_backoff_max(saavn, sleeps):
+    saavn.responses = [(429, {"Retry-After": "120"}, {}), _album_ids_response("a1")]
+    api_util = ApiUtil(base_url=saavn.base_url, rate_limit=None, backoff_max=5)
+
+    assert api_util.get_album_ids_by_category("rock") == ["a1"]
+    assert sleeps == [5]
+
+
+def test_gives_up_after_max_retries(saavn, sleeps):
+    saavn.responses = [(502, {}, {})] * 3
+    api_util = ApiUtil(base_url=saavn.base_url, rate_limit=None, max_retries=2)
+
+    with pytest.raises(requests.HTTPError):
+        api_util._send(api_util.URL_FOR_ALBUMS)
+    assert len(saavn.requests) == 3
+    assert len(sleeps) == 2
+
+
+def test_does_not_retry_client_errors(saavn, sleeps):
+    saavn.responses = [(404, {}, {})]
+    api_util = ApiUtil(base_url=saavn.base_url, rate_limit=None)
+
+    assert api_util.get_album_info("missing") is None
+    assert len(saavn.requests) == 1
+    assert sleeps == []
+
+
+def test_closes_response_on_non_retryable_status(saavn, monkeypatch):
+    saavn.responses = [(404, {}, {})]
+    api_util = ApiUtil(base_url=saavn.base_url, rate_limit=None)
+    closed = []
+    original_close = requests.Response.close
+    monkeypatch.setattr(requests.Response, "close", lambda self: (closed.append(self), original_close(self)))
+
+    with pytest.raises(requests.HTTPError):
+        api_util._send(api_util.URL_FOR_ALBUMS, stream=True)
+    assert len(closed) == 1
+
+
+def test_rate_limit_spaces_requests(saavn):
+    api_util = ApiUtil(base_url=saavn.base_url, rate_limit=20)
+    api_util.rate_limiter = TokenBucket(rate=20, capacity=1)
+
+    started = time.monotonic()
+    for _ in range(5):
+        api_util.get_album_ids_by_category("rock")
+    elapsed = time.monotonic() - started
+
+    # Первый запрос использует накопленный токен, каждый следующий ждет 1/20 секунды
+    assert elapsed >= 4 / 20 * 0.9
+    times = [request_time for _, request_time in saavn.requests]
+    assert all(later - earlier >= 1 / 20 * 0.8 for earlier, later in zip(times, times[1:]))
+
+
+def test_token_bucket_allows_burst_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=3)
+    started = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - started < 0.1
@@ -0,0 +1,140 @@
+from urllib.parse import urlsplit
+
+import pytest
+from sqlalchemy import create_engine, delete, event
+from sqlalchemy.orm import Session
+
+from db import images
+from db.managers import music_manager
+from db.managers.music_manager import MusicIdPool, MusicManager
+from db.models import Base, Music
+from db.s3manager import S3Manager
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def db_session(engine):
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def statements(engine):
+    executed = []
+    event.listen(engine, "before_cursor_execute", lambda *args: executed.append(args[2]))
+    return executed
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = MusicIdPool(ttl=300)
+    monkeypatch.setattr(music_manager, "music_id_pool", pool)
+    return pool
+
+
+def _add_tracks(db_session, count: int) -> list[int]:
+    tracks = [Music(name=f"Track {i}", release_year=2000, duration=1, language="en") for i in range(count)]
+    db_session.add_all(tracks)
+    db_session.commit()
+    return [track.id for track in tracks]
+
+
+def test_id_pool_is_refreshed_after_ttl_or_invalidate(db_session, pool, statements, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(music_manager.time, "monotonic", lambda: now[0])
+    first_ids = _add_tracks(db_session, 2)
+    statements.clear()
+
+    assert sorted(pool.get_ids(db_session)) == first_ids
+    new_ids = _add_tracks(db_session, 1)
+    statements.clear()
+    # До истечения ttl список не перечитывается
+    now[0] += 299
+    assert sorted(pool.get_ids(db_session)) == first_ids
+    assert statements == []
+
+    now[0] += 1
+    assert sorted(pool.get_ids(db_session)) == first_ids + new_ids
+
+    db_session.execute(delete(Music).where(Music.id == first_ids[0]))
+    db_session.commit()
+    pool.invalidate()
+    assert sorted(pool.get_ids(db_session)) == first_ids[1:] + new_ids
+
+
+def test_random_music_returns_whole_small_catalogue(db_session, pool):
+    music_ids = _add_tracks(db_session, 3)
+
+    musics = MusicManager(db_session).get_random_music(count=10)
+    assert sorted(music.id for music in musics) == music_ids
+
+
+def test_random_music_sample_has_no_repeats(db_session, pool):
+    music_ids = _add_tracks(db_session, 20)
+
+    for _ in range(10):
+        sampled = [music.id for music in MusicManager(db_session).get_random_music(count=5)]
+        assert len(sampled) == len(set(sampled)) == 5
+        assert set(sampled) <= set(music_ids)
+
+
+def test_random_music_on_empty_catalogue(db_session, pool, statements):
+    assert MusicManager(db_session).get_random_music(count=5) == []
+    # Запрос треков по пустому списку id не выполняется
+    assert len(statements) == 1
+
+
+def test_random_music_skips_tracks_deleted_after_refresh(db_session, pool):
+    music_ids = _add_tracks(db_session, 3)
+    pool.get_ids(db_session)
+    db_session.execute(delete(Music).where(Music.id == music_ids[0]))
+    db_session.commit()
+
+    musics = MusicManager(db_session).get_random_music(count=3)
+    assert sorted(music.id for music in musics) == music_ids[1:]
+
+
+@pytest.fixture
+def offline_storage(monkeypatch):
+    # Копии не проверяются в хранилище: любое обращение к нему - ошибка
+    def unexpected(*args, **kwargs):
+        raise AssertionError("storage was queried")
+
+    monkeypatch.setattr(S3Manager, "_file_exists", unexpected)
+    monkeypatch.setattr(S3Manager, "get_objects_collection", unexpected)
+
+
+def _srcset_files(srcset: str) -> list[tuple[str, str]]:
+    return [(urlsplit(url).path.rsplit("/", 1)[-1], width) for url, width in
+            (candidate.split(" ") for candidate in srcset.split(", "))]
+
+
+def test_srcsets_for_tracks_without_variants(offline_storage, monkeypatch):
+    monkeypatch.setattr(images.settings, "IMAGE_WEBP_ENABLED", False)
+
+    srcsets = MusicManager.get_music_image_srcsets(7, 3)
+
+    # Для трека без копий генерируются те же url: если копии нет, страница показывает исходную обложку
+    assert [(_srcset_files(jpeg), webp) for jpeg, webp in srcsets] == [
+        ([("music_image_7_300.jpg", "300w"), ("music_image_7_600.jpg", "600w")], None),
+        ([("music_image_3_300.jpg", "300w"), ("music_image_3_600.jpg", "600w")], None)
+    ]
+
+
+def test_srcsets_include_webp_variants(offline_storage, monkeypatch):
+    monkeypatch.setattr(images.settings, "IMAGE_WEBP_ENABLED", True)
+
+    [(jpeg, webp)] = MusicManager.get_music_image_srcsets(5)
+
+    assert _srcset_files(jpeg) == [("music_image_5_300.jpg", "300w"), ("music_image_5_600.jpg", "600w")]
+    assert _srcset_files(webp) == [("music_image_5_300.webp", "300w"), ("music_image_5_600.webp", "600w")]
+
+
+def test_srcsets_for_no_tracks(offline_storage):
+    assert MusicManager.get_music_image_srcsets() == []
@@ -0,0 +1,107 @@
+import contextlib
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from db.managers import playlist_manager
+from db.managers.playlist_manager import POSITION_GAP, PlaylistManager, PlaylistNotFoundError
+from db.models import Base, Music, PlaylistTrack
+
+USER_ID = 1
+
+
+@pytest.fixture
+def db_session(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        monkeypatch.setattr(playlist_manager, "use_session", lambda: contextlib.nullcontext(session))
+        yield session
+
+
+@pytest.fixture
+def music_ids(db_session):
+    tracks = [Music(name=f"Track {i}", release_year=2000, duration=1, language="en") for i in range(6)]
+    db_session.add_all(tracks)
+    db_session.commit()
+    return [track.id for track in tracks]
+
+
+@pytest.fixture
+def playlist_id(db_session):
+    return PlaylistManager.create_playlist(USER_ID, "Road trip").id
+
+
+def _order(playlist_id: int) -> list[int]:
+    page = PlaylistManager.get_tracks_page(USER_ID, playlist_id, page_size=100)
+    return [track.id for track in page]
+
+
+def test_add_tracks_appends_in_order_and_skips_duplicates(playlist_id, music_ids):
+    first, second, third = music_ids[:3]
+    assert PlaylistManager.add_tracks(USER_ID, playlist_id, [second, first, second]) == 2
+    # Трек, уже находящийся в плейлисте, и несуществующий трек пропускаются
+    assert PlaylistManager.add_tracks(USER_ID, playlist_id, [first, third, 10_000]) == 1
+    assert _order(playlist_id) == [second, first, third]
+
+
+def test_other_users_playlist_is_not_found(playlist_id, music_ids):
+    with pytest.raises(PlaylistNotFoundError):
+        PlaylistManager.add_tracks(USER_ID + 1, playlist_id, music_ids)
+    with pytest.raises(PlaylistNotFoundError):
+        PlaylistManager.get_tracks_page(USER_ID + 1, playlist_id)
+
+
+def test_move_track(playlist_id, music_ids):
+    a, b, c, d = music_ids[:4]
+    PlaylistManager.add_tracks(USER_ID, playlist_id, [a, b, c, d])
+
+    PlaylistManager.move_track(USER_ID, playlist_id, d, a)
+    assert _order(playlist_id) == [a, d, b, c]
+    PlaylistManager.move_track(USER_ID, playlist_id, c, None)
+    assert _order(playlist_id) == [c, a, d, b]
+    PlaylistManager.move_track(USER_ID, playlist_id, c, b)
+    assert _order(playlist_id) == [a, d, b, c]
+
+    with pytest.raises(ValueError):
+        PlaylistManager.move_track(USER_ID, playlist_id, a, music_ids[5])
+
+
+def test_move_renumbers_when_gap_is_exhausted(db_session, playlist_id, music_ids, monkeypatch):
+    renumbered = []
+    renumber = playlist_manager._renumber
+    monkeypatch.setattr(playlist_manager, "_renumber", lambda *args: (renumbered.append(args[1]), renumber(*args)))
+    a, b, c = music_ids[:3]
+    PlaylistManager.add_tracks(USER_ID, playlist_id, [a, b, c])
+
+    # Каждое перемещение делит промежуток после a пополам; через log2(POSITION_GAP) перемещений он исчерпан
+    moved, other = b, c
+    for _ in range(POSITION_GAP.bit_length() + 2):
+        PlaylistManager.move_track(USER_ID, playlist_id, other, a)
+        assert _order(playlist_id) == [a, other, moved]
+        moved, other = other, moved
+    assert renumbered == [playlist_id]
+
+    positions = db_session.execute(
+        select(PlaylistTrack.position)
+        .where(PlaylistTrack.playlist_id == playlist_id)
+        .order_by(PlaylistTrack.position)
+    ).scalars().all()
+    assert all(later - earlier >= 2 for earlier, later in zip(positions, positions[1:]))
+
+
+def test_tracks_page_keyset_pagination(playlist_id, music_ids):
+    PlaylistManager.add_tracks(USER_ID, playlist_id, music_ids)
+    PlaylistManager.move_track(USER_ID, playlist_id, music_ids[-1], None)
+    expected = _order(playlist_id)
+
+    pages = [PlaylistManager.get_tracks_page(USER_ID, playlist_id, page_size=4)]
+    while pages[-1].next_cursor is not None:
+        pages.append(PlaylistManager.get_tracks_page(USER_ID, playlist_id, cursor=pages[-1].next_cursor,
+                                                     page_size=4))
+    assert [[track.id for track in page] for page in pages] == [expected[:4], expected[4:]]
+    assert pages[0].prev_cursor is None
+
+    previous = PlaylistManager.get_tracks_page(USER_ID, playlist_id, cursor=pages[-1].prev_cursor, page_size=4)
+    assert [track.id for track in previous] == expected[:4]
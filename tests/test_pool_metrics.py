@@ -0,0 +1,102 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+import app as app_module
+from db import connect
+from db.pool_metrics import PoolMetrics, TimedQueuePool
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool, pool_size=1,
+                           max_overflow=0, pool_timeout=0.05)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def metrics(engine):
+    metrics = PoolMetrics(window=10)
+    metrics.attach(engine)
+    engine.pool.metrics = metrics
+    return metrics
+
+
+def test_snapshot_counts_checkouts_and_hold_time(engine, metrics):
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    stats = metrics.snapshot(engine)
+    assert stats["counters"] == {"checkouts": 3, "checkins": 3, "connects": 1, "invalidations": 0}
+    assert stats["hold_ms"]["count"] == 3
+    assert stats["checkout_wait_ms"]["count"] == 3
+    assert stats["connect_ms"]["count"] == 1
+    assert stats["pool"]["class"] == "TimedQueuePool"
+    assert stats["pool"]["size"] == 1
+    assert stats["pool"]["checked_out"] == 0
+    assert stats["pool"]["utilisation"] == 0
+
+
+def test_checkout_wait_is_recorded_on_pool_timeout(engine, metrics):
+    with engine.connect():
+        assert metrics.snapshot(engine)["pool"]["utilisation"] == 1
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+
+    waits = metrics.snapshot(engine)["checkout_wait_ms"]
+    assert waits["count"] == 2
+    assert waits["max"] >= 50
+
+
+def test_recreated_pool_keeps_metrics(engine, metrics):
+    engine.dispose()
+
+    assert engine.pool.metrics is metrics
+    with engine.connect():
+        pass
+    assert metrics.snapshot(engine)["checkout_wait_ms"]["count"] == 1
+
+
+@pytest.fixture
+def stats_client(engine, metrics, monkeypatch):
+    monkeypatch.setattr(connect, "create_session", lambda: Session(engine))
+    monkeypatch.setattr(app_module, "get_engine", lambda: engine)
+    monkeypatch.setattr(app_module, "pool_metrics", metrics)
+    monkeypatch.setattr(app_module.settings, "INTERNAL_STATS_TOKEN", None)
+    monkeypatch.setattr(app_module.settings, "INTERNAL_STATS_ALLOW_LOOPBACK", False)
+    return app_module.app.test_client()
+
+
+def _get_stats(client, remote_addr: str = "10.0.0.1", token: str | None = None):
+    headers = {} if token is None else {"X-Stats-Token": token}
+    return client.get("/internal/stats", headers=headers, environ_base={"REMOTE_ADDR": remote_addr})
+
+
+def test_internal_stats_disabled_without_token(stats_client):
+    assert _get_stats(stats_client).status_code == 404
+    assert _get_stats(stats_client, remote_addr="127.0.0.1").status_code == 404
+
+
+def test_internal_stats_requires_token(stats_client, monkeypatch):
+    monkeypatch.setattr(app_module.settings, "INTERNAL_STATS_TOKEN", "secret")
+
+    assert _get_stats(stats_client).status_code == 403
+    assert _get_stats(stats_client, token="wrong").status_code == 403
+    # Без явного разрешения локальный адрес не дает доступа: за прокси это адрес любого клиента
+    assert _get_stats(stats_client, remote_addr="127.0.0.1").status_code == 403
+
+    response = _get_stats(stats_client, token="secret")
+    assert response.status_code == 200
+    assert set(response.json) == {"db", "s3", "audio_disk_cache"}
+    assert response.json["db"]["pool"]["class"] == "TimedQueuePool"
+
+
+def test_internal_stats_loopback_access(stats_client, monkeypatch):
+    monkeypatch.setattr(app_module.settings, "INTERNAL_STATS_ALLOW_LOOPBACK", True)
+
+    assert _get_stats(stats_client, remote_addr="127.0.0.1").status_code == 200
+    assert _get_stats(stats_client, remote_addr="::1").status_code == 200
+    assert _get_stats(stats_client).status_code == 403
@@ -0,0 +1,211 @@
+import datetime
+import threading
+from io import BytesIO
+
+import pytest
+from botocore.credentials import Credentials
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from db import s3manager
+from db.s3manager import DelayedDeleter, LocalPresigner, PresignedUrlCache, S3ClientRegistry, S3KeyIndex, S3Manager
+
+FIXED_NOW = datetime.datetime(2026, 3, 14, 15, 9, 26, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr("botocore.auth.get_current_datetime", lambda: FIXED_NOW.replace(tzinfo=None))
+    monkeypatch.setattr(s3manager, "_utcnow", lambda: FIXED_NOW)
+    registry = S3ClientRegistry()
+    yield registry
+    registry.close()
+
+
+def _botocore_url(client, filename: str, content_type: str, content_disposition: str, expiration: int) -> str:
+    return client.generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": s3manager.BUCKET_NAME,
+            "Key": filename,
+            "ResponseContentType": content_type,
+            "ResponseContentDisposition": content_disposition
+        },
+        ExpiresIn=expiration
+    )
+
+
+@pytest.mark.parametrize("filename, content_type, content_disposition, expiration", [
+    ("music_audio_1.mp4", "audio/mp3", "inline", 3600),
+    ("music_image_42_300.jpg", "image/jpeg", "inline", 60),
+    ("user_avatar_7_v1792319654640.jpg", "image/jpeg", 'attachment; filename="a b.jpg"', 604800),
+    ("папка/трек (1)+~.mp4", "audio/mp3", "inline", 3600),
+])
+def test_local_presigner_matches_botocore(registry, filename, content_type, content_disposition, expiration):
+    presigner = registry.presigner()
+    assert presigner is not None
+    assert presigner.region == "ru-central1"
+
+    expected = _botocore_url(registry.client(), filename, content_type, content_disposition, expiration)
+    actual = presigner.presign_get(filename, content_type, content_disposition, expiration)
+    assert actual == expected
+
+
+def test_local_presigner_matches_botocore_with_session_token(registry):
+    client = registry.client()
+    credentials = Credentials("AKIDEXAMPLE", "secret", token="session/token+=")
+    client._request_signer._credentials = credentials
+    presigner = LocalPresigner(credentials, region=client.meta.region_name, endpoint_url=client.meta.endpoint_url)
+
+    expected = _botocore_url(client, "music_audio_1.mp4", "audio/mp3", "inline", 3600)
+    assert presigner.presign_get("music_audio_1.mp4", "audio/mp3", "inline", 3600) == expected
+
+
+def test_presigner_disabled_without_region(registry, monkeypatch):
+    monkeypatch.setattr(s3manager.settings, "S3_REGION", "")
+    lookups = []
+    session = registry._get_session()
+    get_credentials = session.get_credentials
+    monkeypatch.setattr(session, "get_credentials", lambda: (lookups.append(None), get_credentials())[1])
+
+    assert registry.presigner() is None
+    # Отрицательный результат кэшируется до close(), как и созданный генератор
+    assert registry.presigner() is None
+    assert len(lookups) == 1
+
+    registry.close()
+    monkeypatch.setattr(s3manager.settings, "S3_REGION", "ru-central1")
+    assert registry.presigner() is not None
+
+
+@pytest.fixture
+def stubbed_client(registry, monkeypatch):
+    # Индекс уже заполнен пустым списком: наличие файлов проверяется HEAD запросами
+    index = S3KeyIndex(negative_ttl=60)
+    index.loaded = True
+    monkeypatch.setattr(s3manager, "client_registry", registry)
+    monkeypatch.setattr(s3manager, "key_index", index)
+    with Stubber(registry.client()) as stubber:
+        yield stubber
+
+
+def test_missing_file_is_cached(stubbed_client):
+    stubbed_client.add_client_error("head_object", service_error_code="404", http_status_code=404)
+
+    assert S3Manager()._file_exists("music_audio_1.mp4") is False
+    # Повторная проверка отвечает из индекса, без запроса к хранилищу
+    assert S3Manager()._file_exists("music_audio_1.mp4") is False
+    stubbed_client.assert_no_pending_responses()
+
+
+def test_storage_errors_are_not_cached(stubbed_client):
+    stubbed_client.add_client_error("head_object", service_error_code="403", http_status_code=403)
+    stubbed_client.add_response("head_object", {}, {"Bucket": s3manager.BUCKET_NAME, "Key": "music_audio_1.mp4"})
+
+    with pytest.raises(ClientError):
+        S3Manager()._file_exists("music_audio_1.mp4")
+    assert S3Manager()._file_exists("music_audio_1.mp4") is True
+
+
+def test_url_cache_is_keyed_by_expiration():
+    cache = PresignedUrlCache(margin=10)
+    cache.put("music_audio_1.mp4", "audio/mp3", "inline", "short-url", 60)
+
+    # Url на минуту не выдается вместо запрошенного на неделю
+    assert cache.get("music_audio_1.mp4", "audio/mp3", "inline", 604800) is None
+    assert cache.get("music_audio_1.mp4", "audio/mp3", "inline", 60) == "short-url"
+
+
+def test_forced_upload_invalidates_cached_urls(registry, monkeypatch):
+    cache = PresignedUrlCache()
+    monkeypatch.setattr(s3manager, "client_registry", registry)
+    monkeypatch.setattr(s3manager, "url_cache", cache)
+    monkeypatch.setattr(s3manager, "key_index", S3KeyIndex())
+    monkeypatch.setattr(registry.client(), "upload_fileobj", lambda **kwargs: None)
+
+    s3_manager = S3Manager()
+    first_url = s3_manager.get_file_url_fast("music_image_1.jpg", content_type="image/jpeg",
+                                             content_disposition="inline")
+    assert cache.get("music_image_1.jpg", "image/jpeg", "inline", 3600) == first_url
+
+    s3_manager.upload_file("music_image_1.jpg", BytesIO(b"new cover"), force=True)
+    assert cache.stats()["size"] == 0
+
+
+def test_unloaded_index_checks_storage_without_listing(registry, monkeypatch):
+    monkeypatch.setattr(s3manager, "client_registry", registry)
+    monkeypatch.setattr(s3manager, "key_index", S3KeyIndex())
+    with Stubber(registry.client()) as stubber:
+        # Список объектов в запросе не загружается: только HEAD проверяемого файла
+        stubber.add_response("head_object", {}, {"Bucket": s3manager.BUCKET_NAME, "Key": "music_audio_1.mp4"})
+        assert S3Manager()._file_exists("music_audio_1.mp4") is True
+        assert S3Manager()._file_exists("music_audio_1.mp4") is True
+        stubber.assert_no_pending_responses()
+
+
+def test_key_index_refresh_drops_deleted_keys():
+    index = S3KeyIndex()
+    index.refresh(lambda: ["music_audio_1.mp4", "music_audio_2.mp4"])
+    assert index.contains("music_audio_1.mp4") is True
+
+    # Файл удален другим процессом, а music_audio_2.mp4 удален во время получения списка
+    index.discard("music_audio_2.mp4")
+    index.refresh(lambda: ["music_audio_2.mp4"])
+    assert index.contains("music_audio_1.mp4") is None
+    assert index.contains("music_audio_2.mp4") is False
+
+
+def test_key_index_keeps_keys_when_listing_fails():
+    index = S3KeyIndex()
+    index.refresh(lambda: ["music_audio_1.mp4"])
+
+    def broken_listing():
+        raise ClientError({"Error": {"Code": "AccessDenied"}}, "ListObjectsV2")
+
+    index.refresh(broken_listing)
+    assert index.loaded
+    assert index.contains("music_audio_1.mp4") is True
+
+
+def test_key_index_background_refresh():
+    index = S3KeyIndex()
+    listings = [["music_audio_1.mp4"], ["music_audio_2.mp4"]]
+    calls = []
+    reloaded = threading.Event()
+
+    def loader():
+        calls.append(None)
+        # Третья загрузка начинается после того, как вторая применена к индексу
+        if len(calls) == 3:
+            reloaded.set()
+        return listings[min(len(calls), 2) - 1]
+
+    index.start_refresh(loader, interval=0.01)
+    try:
+        assert reloaded.wait(5)
+    finally:
+        index.stop_refresh()
+    assert index.contains("music_audio_1.mp4") is None
+    assert index.contains("music_audio_2.mp4") is True
+
+
+def test_delayed_deleter_deletes_in_due_order():
+    deleted = []
+    done = threading.Event()
+
+    def delete(key):
+        if key == "missing.jpg":
+            raise ValueError("File not found")
+        deleted.append(key)
+        if len(deleted) == 3:
+            done.set()
+
+    deleter = DelayedDeleter(delete)
+    deleter.schedule(["late.jpg"], delay=0.2)
+    deleter.schedule(["missing.jpg", "early.jpg", "early_80.jpg"], delay=0.05)
+    assert deleter.pending() == 2
+    assert deleted == []
+
+    assert done.wait(5)
+    assert deleted == ["early.jpg", "early_80.jpg", "late.jpg"]
+    assert deleter.pending() == 0
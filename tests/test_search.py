@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from db import search
+from db.models import Base, Music
+from db.search import MySqlFulltextSearchBackend, SearchBackend, TrigramSearchBackend
+
+
+@pytest.fixture
+def db_session():
+    # Перестройка индекса в тестах выполняется и в другом потоке
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def _add_music(db_session: Session, name: str) -> int:
+    music = Music(name=name, release_year=2000, duration=1, language="en")
+    db_session.add(music)
+    db_session.commit()
+    return music.id
+
+
+class RecordingBackend(SearchBackend):
+    def __init__(self):
+        self.queries = []
+
+    def search(self, db_session, query, limit=None, after=None, before=None):
+        self.queries.append(query)
+        return [(1.0, 1)]
+
+    def index_music(self, db_session, music_ids):
+        pass
+
+
+def test_search_backend_is_abstract():
+    with pytest.raises(TypeError):
+        SearchBackend()
+
+
+def test_trigram_index_is_rebuilt_after_ttl(db_session, monkeypatch):
+    backend = TrigramSearchBackend(ttl=60)
+    _add_music(db_session, "Yellow Submarine")
+    assert len(backend.search(db_session, "yellow")) == 1
+
+    # Трек, добавленный другим процессом, не попадает в индекс до истечения ttl
+    new_id = _add_music(db_session, "Yellow Ledbetter")
+    assert len(backend.search(db_session, "yellow")) == 1
+
+    now = time.monotonic()
+    monkeypatch.setattr("db.search.time.monotonic", lambda: now + 61)
+    assert new_id in {music_id for _, music_id in backend.search(db_session, "yellow")}
+
+
+@pytest.mark.parametrize("query", ["lo", "a", "fi lo"])
+def test_fulltext_falls_back_for_short_tokens(db_session, query):
+    fallback = RecordingBackend()
+    backend = MySqlFulltextSearchBackend(fallback=fallback)
+    assert backend.search(db_session, query) == [(1.0, 1)]
+    assert fallback.queries == [query]
+
+
+def test_fulltext_ignores_empty_query(db_session):
+    fallback = RecordingBackend()
+    assert MySqlFulltextSearchBackend(fallback=fallback).search(db_session, " !? ") == []
+    assert fallback.queries == []
+
+
+def test_trigram_rebuild_is_single_flight(db_session, monkeypatch):
+    backend = TrigramSearchBackend(ttl=60)
+    _add_music(db_session, "Yellow Submarine")
+    assert len(backend.search(db_session, "yellow")) == 1
+
+    loads = []
+    release = threading.Event()
+    load_documents = search._load_documents
+
+    def slow_load(*args):
+        loads.append(threading.current_thread().name)
+        release.wait(5)
+        return load_documents(*args)
+
+    monkeypatch.setattr(search, "_load_documents", slow_load)
+    now = time.monotonic()
+    monkeypatch.setattr("db.search.time.monotonic", lambda: now + 61)
+
+    rebuild = threading.Thread(target=backend.search, args=(db_session, "yellow"), name="rebuild")
+    rebuild.start()
+    try:
+        while not loads:
+            time.sleep(0.001)
+        # Пока индекс перестраивается, остальные запросы отвечают по старому индексу без ожидания
+        assert len(backend.search(db_session, "yellow")) == 1
+    finally:
+        release.set()
+        rebuild.join()
+    assert loads == ["rebuild"]
+    assert backend._expires_at > now + 61
+
+
+def test_fulltext_falls_back_when_nothing_found(db_session, monkeypatch):
+    monkeypatch.setattr(search, "_ranked_query", lambda *args: [])
+    fallback = RecordingBackend()
+    backend = MySqlFulltextSearchBackend(fallback=fallback)
+
+    # "ellow" входит в "yellow" только в середине слова
+    assert backend.search(db_session, "ellow") == [(1.0, 1)]
+    assert backend.search(db_session, "ellow", after=(1.0, 1)) == [(1.0, 1)]
+    assert fallback.queries == ["ellow", "ellow"]
+
+
+def test_fulltext_does_not_fall_back_past_last_page(db_session, monkeypatch):
+    def ranked_query(db_session, sql, params, limit, after, before):
+        return [] if after is not None else [(3.0, 1)]
+
+    monkeypatch.setattr(search, "_ranked_query", ranked_query)
+    fallback = RecordingBackend()
+    backend = MySqlFulltextSearchBackend(fallback=fallback)
+
+    assert backend.search(db_session, "yellow", limit=10, after=(3.0, 1)) == []
+    assert fallback.queries == []
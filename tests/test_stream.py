@@ -0,0 +1,146 @@
+import re
+import time
+from io import BytesIO
+
+import pytest
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import app as app_module
+from db import connect
+from db.disk_cache import DiskLruCache
+from db.managers.music_manager import MusicManager
+from db.s3manager import S3Manager
+
+AUDIO = bytes(range(256)) * 40
+ETAG = '"0123abcd"'
+
+
+class FakeStorage:
+    """Ответы GetObject для одного файла с поддержкой Range и If-None-Match"""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.requests: list[tuple[str, str | None]] = []
+
+    def get_file_object(self, filename, byte_range=None, if_none_match=None):
+        self.requests.append((filename, byte_range))
+        if if_none_match == ETAG:
+            raise _client_error(304)
+
+        size = len(self.content)
+        response = {"ETag": ETAG}
+        start, end = 0, size - 1
+        if byte_range is not None:
+            first, last = re.fullmatch(r"bytes=(\d*)-(\d*)", byte_range).groups()
+            start, end = int(first), min(int(last) if last else size - 1, size - 1)
+            if start >= size:
+                raise _client_error(416)
+            response["ContentRange"] = f"bytes {start}-{end}/{size}"
+        data = self.content[start:end + 1]
+        response["ContentLength"] = len(data)
+        response["Body"] = StreamingBody(BytesIO(data), len(data))
+        return response
+
+
+def _client_error(status: int) -> ClientError:
+    return ClientError({"Error": {"Code": str(status)}, "ResponseMetadata": {"HTTPStatusCode": status}}, "GetObject")
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = FakeStorage(AUDIO)
+    monkeypatch.setattr(S3Manager, "get_file_object",
+                        lambda self, *args, **kwargs: storage.get_file_object(*args, **kwargs))
+    return storage
+
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    cache = DiskLruCache(str(tmp_path / "audio"), max_bytes=1024 * 1024, admit_after=2)
+    monkeypatch.setattr(app_module, "audio_disk_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def client(storage, disk_cache, monkeypatch):
+    # Сессия запроса открывается для каждого запроса, но маршрут к базе данных не обращается
+    engine = create_engine("sqlite://")
+    monkeypatch.setattr(connect, "create_session", lambda: Session(engine))
+    monkeypatch.setattr(app_module.settings, "STREAM_PROXY_ENABLED", True)
+    monkeypatch.setattr(MusicManager, "get_audio_keys", staticmethod(
+        lambda *music_ids: [f"music_audio_{music_id}.mp4" for music_id in music_ids]
+    ))
+    monkeypatch.setitem(app_module.app.config, "LOGIN_DISABLED", True)
+    return app_module.app.test_client()
+
+
+def _wait_for_fill(cache: DiskLruCache) -> None:
+    deadline = time.monotonic() + 5
+    while cache.stats()["files"] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_streams_whole_file(client, storage):
+    response = client.get("/stream/1")
+
+    assert response.status_code == 200
+    assert response.data == AUDIO
+    assert response.headers["ETag"] == ETAG
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert storage.requests == [("music_audio_1.mp4", None)]
+
+
+def test_streams_requested_range(client, storage):
+    response = client.get("/stream/1", headers={"Range": "bytes=100-199"})
+
+    assert response.status_code == 206
+    assert response.data == AUDIO[100:200]
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(AUDIO)}"
+    assert response.headers["Content-Length"] == "100"
+    assert storage.requests == [("music_audio_1.mp4", "bytes=100-199")]
+
+
+def test_not_modified(client):
+    response = client.get("/stream/1", headers={"If-None-Match": ETAG})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == ETAG
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/stream/1", headers={"Range": f"bytes={len(AUDIO) + 10}-"})
+
+    assert response.status_code == 416
+
+
+def test_disabled_proxy_is_not_found(client, monkeypatch):
+    monkeypatch.setattr(app_module.settings, "STREAM_PROXY_ENABLED", False)
+
+    assert client.get("/stream/1").status_code == 404
+
+
+def test_popular_track_is_served_from_disk_cache(client, storage, disk_cache):
+    # Запросы продолжения прослушивания промахами не считаются
+    client.get("/stream/1", headers={"Range": "bytes=100-"})
+    client.get("/stream/1")
+    assert disk_cache.stats()["files"] == 0
+    client.get("/stream/1")
+    _wait_for_fill(disk_cache)
+    storage.requests.clear()
+
+    response = client.get("/stream/1")
+    assert response.status_code == 200
+    assert response.data == AUDIO
+    assert response.headers["ETag"] == ETAG
+
+    response = client.get("/stream/1", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.data == AUDIO[10:20]
+
+    response = client.get("/stream/1", headers={"If-None-Match": ETAG})
+    assert response.status_code == 304
+    assert storage.requests == []
@@ -0,0 +1,239 @@
+import contextlib
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session
+
+from db import images
+from db.managers import user_manager
+from db.cache import InMemoryCacheBackend
+from db.managers.user_manager import UserCache, UserManager
+from db.models import Base, Favorite, Music, User
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(dbapi_connection, _):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture
+def db_session(engine, monkeypatch):
+    with Session(engine) as session:
+        monkeypatch.setattr(user_manager, "use_session", lambda: contextlib.nullcontext(session))
+        yield session
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = UserCache(InMemoryCacheBackend(), ttl=60)
+    monkeypatch.setattr(user_manager, "user_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def statements(engine):
+    executed = []
+    event.listen(engine, "before_cursor_execute", lambda *args: executed.append(args[2]))
+    return executed
+
+
+@pytest.fixture
+def user_id(db_session):
+    user = User(username="listener", email="listener@example.com", password="secret")
+    db_session.add(user)
+    db_session.commit()
+    return user.id
+
+
+@pytest.fixture
+def music_id(db_session):
+    music = Music(name="Track", release_year=2000, duration=1, language="en")
+    db_session.add(music)
+    db_session.commit()
+    return music.id
+
+
+def _favorites(db_session, user_id: int) -> list[int]:
+    return db_session.execute(select(Favorite.music_id).where(Favorite.user_id == user_id)).scalars().all()
+
+
+def test_set_favorite_is_idempotent_single_statement(db_session, user_id, music_id, statements):
+    assert UserManager.set_favorite(user_id, music_id, True) is True
+    assert len(statements) == 1
+    assert UserManager.set_favorite(user_id, music_id, True) is True
+    assert _favorites(db_session, user_id) == [music_id]
+
+    assert UserManager.set_favorite(user_id, music_id, False) is False
+    assert UserManager.set_favorite(user_id, music_id, False) is False
+    assert _favorites(db_session, user_id) == []
+
+
+def test_toggle_favorite(db_session, user_id, music_id, statements):
+    assert UserManager.toggle_favorite(user_id, music_id) is True
+    assert _favorites(db_session, user_id) == [music_id]
+
+    statements.clear()
+    assert UserManager.toggle_favorite(user_id, music_id) is False
+    # Удаление не требует второго запроса
+    assert len(statements) == 1
+    assert _favorites(db_session, user_id) == []
+
+
+def test_missing_track_is_rejected_by_foreign_key(db_session, user_id, music_id):
+    with pytest.raises(ValueError):
+        UserManager.set_favorite(user_id, music_id + 1, True)
+    with pytest.raises(ValueError):
+        UserManager.toggle_favorite(user_id, music_id + 1)
+
+    # Сессия остается пригодной для следующих запросов
+    assert UserManager.toggle_favorite(user_id, music_id) is True
+
+
+class FakeS3Manager:
+    """Хранилище аватарок в памяти; список файлов при загрузке не запрашивается"""
+
+    files: dict[str, bytes] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def upload_file(self, filename, content, force=False, cache_control=None):
+        self.files[filename] = content.read()
+
+    def delete_file(self, filename):
+        if self.files.pop(filename, None) is None:
+            raise ValueError("File not found")
+
+    def get_objects_collection(self, prefix=None):
+        return [type("Object", (), {"key": key})() for key in self.files if key.startswith(prefix or "")]
+
+
+class FakeDeleter:
+    def __init__(self):
+        self.scheduled: list[tuple[list[str], float]] = []
+
+    def schedule(self, keys, delay):
+        self.scheduled.append((list(keys), delay))
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(FakeS3Manager, "files", {})
+    monkeypatch.setattr(user_manager, "S3Manager", FakeS3Manager)
+    monkeypatch.setattr(images, "image_workers", images.ImageWorkerPool(max_workers=0))
+    return FakeS3Manager.files
+
+
+@pytest.fixture
+def deleter(monkeypatch):
+    deleter = FakeDeleter()
+    monkeypatch.setattr(user_manager, "delayed_deleter", deleter)
+    return deleter
+
+
+def _png() -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _avatar_files(user_id: int, version: int) -> list[str]:
+    filename = f"user_avatar_{user_id}_v{version}.jpg"
+    return [filename, *(images.variant_key(filename, size) for size in images.AVATAR_SIZES)]
+
+
+def test_upload_avatar_schedules_deletion_of_replaced_version(db_session, user_id, storage, deleter):
+    first = UserManager.upload_avatar(user_id, _png())
+    assert deleter.scheduled == []
+    time.sleep(0.002)
+
+    second = UserManager.upload_avatar(user_id, BytesIO(_png()))
+    assert second > first
+    assert db_session.get(User, user_id).avatar_version == second
+    assert deleter.scheduled == [(_avatar_files(user_id, first), user_manager.settings.AVATAR_DELETE_DELAY)]
+    assert sorted(storage) == sorted(_avatar_files(user_id, first) + _avatar_files(user_id, second))
+
+
+def test_upload_older_than_current_version_is_replaced(db_session, user_id, storage, deleter):
+    newer = time.time_ns() // 1_000_000 + 60_000
+    storage.update(dict.fromkeys(_avatar_files(user_id, newer), b"jpeg"))
+    db_session.get(User, user_id).avatar_version = newer
+    db_session.commit()
+
+    assert UserManager.upload_avatar(user_id, _png()) == newer
+    assert db_session.get(User, user_id).avatar_version == newer
+    # Удаляется только что загруженная версия, а не текущая
+    [(keys, _)] = deleter.scheduled
+    assert set(keys) == set(storage) - set(_avatar_files(user_id, newer))
+
+
+def test_delete_replaced_avatars(db_session, user_id, storage, monkeypatch):
+    monkeypatch.setattr(user_manager.settings, "AVATAR_DELETE_DELAY", 60)
+    now = time.time_ns() // 1_000_000
+    old, replaced, current = now - 300_000, now - 120_000, now - 30_000
+    for version in (old, replaced, current):
+        storage.update(dict.fromkeys(_avatar_files(user_id, version), b"jpeg"))
+    legacy = f"user_avatar_{user_id}.jpg"
+    storage[legacy] = b"jpeg"
+    db_session.get(User, user_id).avatar_version = current
+    db_session.commit()
+
+    # Аватарка без версии и old заменены больше AVATAR_DELETE_DELAY назад, replaced - недавно
+    expected = {legacy, *_avatar_files(user_id, old)}
+    assert UserManager.delete_replaced_avatars() == len(expected)
+    assert set(storage) == set(_avatar_files(user_id, replaced) + _avatar_files(user_id, current))
+
+
+def test_user_snapshot_is_cached(db_session, user_id, cache, statements):
+    assert UserManager.get_user_snapshot(user_id).username == "listener"
+    statements.clear()
+
+    assert UserManager.get_user_snapshot(user_id).username == "listener"
+    assert statements == []
+
+
+def test_snapshot_is_not_cached_with_zero_ttl(db_session, user_id, cache, statements):
+    cache.ttl = 0
+    UserManager.get_user_snapshot(user_id)
+    statements.clear()
+
+    UserManager.get_user_snapshot(user_id)
+    assert len(statements) == 1
+
+
+def test_update_invalidates_snapshot(db_session, user_id, cache):
+    UserManager.get_user_snapshot(user_id)
+    user = UserManager.get_user_by_id(user_id)
+    user.username = "renamed"
+
+    UserManager.update_user_info(user)
+    assert UserManager.get_user_snapshot(user_id).username == "renamed"
+
+
+def test_delete_invalidates_snapshot(db_session, user_id, cache):
+    UserManager.get_user_snapshot(user_id)
+
+    UserManager.delete_user(UserManager.get_user_by_id(user_id))
+    assert cache.get(user_id) is None
+    with pytest.raises(ValueError):
+        UserManager.get_user_snapshot(user_id)
+
+
+def test_avatar_upload_invalidates_snapshot(db_session, user_id, cache, storage, deleter):
+    assert UserManager.get_user_snapshot(user_id).avatar_version is None
+
+    version = UserManager.upload_avatar(user_id, _png())
+    assert UserManager.get_user_snapshot(user_id).avatar_version == version